@@ -0,0 +1,288 @@
+"""
+過去データのバックフィル
+
+デバイス定義（ストアの内容）と負荷モデルから、指定した期間・間隔の時系列を生成し、
+VictoriaMetrics の JSON line import 形式（`/api/v1/import`）で gzip 圧縮して書き出す。
+1 年分を待たずに、長期間の Grafana クエリを現実的なデータ量で試せる。
+
+生成はコピーしたストアの上でシミュレーターを進めるため、稼働中の値には影響しない。
+BACKFILL_CHUNK_SAMPLES サンプルごとに 1 つの gzip メンバーとして出力するので、
+期間が長くてもメモリ使用量は一定。gzip メンバーを連結したファイルはそのまま 1 つの
+gzip ファイルとして読める。
+稼働中のプロセスから生成する GET /backfill は、BACKFILL_MAX_SAMPLES を超える期間・間隔を受け付けない。
+
+使い方（初期デバイス定義ファイルか、稼働中の dummy-exporter の /devices から生成）:
+
+    python -m src.backfill --devices /config/devices.json \\
+        --start 2025-01-01 --end 2026-01-01 --step 60 --output backfill.jsonl.gz
+
+    python -m src.backfill --devices http://localhost:9100/devices --days 30 \\
+        --url http://localhost:8428/api/v1/import --label job=dummy-exporter
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import sys
+import time
+import urllib.request
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+
+from src.simulation import Simulator
+from src.store import DEFAULT_DUTY, DEFAULT_PERIOD, MODELS, DeviceStore
+
+BACKFILL_CHUNK_SAMPLES = int(os.getenv("BACKFILL_CHUNK_SAMPLES", "1000000"))
+# GET /backfill で 1 回に生成するサンプル数の上限（電力値と UP/DOWN の合計）
+BACKFILL_MAX_SAMPLES = int(os.getenv("BACKFILL_MAX_SAMPLES", "20000000"))
+
+logger = logging.getLogger(__name__)
+
+
+def _model_code(record: dict[str, Any]) -> int:
+    model = record.get("model", "uniform")
+    if model not in MODELS:
+        raise ValueError(
+            f"device {record['device_id']}: unknown model {model!r} "
+            f"(choose from {', '.join(MODELS)})"
+        )
+    return MODELS.index(model)
+
+
+def store_from_records(
+    records: list[dict[str, Any]], rng: np.random.Generator | None = None
+) -> DeviceStore:
+    """
+    GET /devices のレコード（または初期デバイス定義）から新しいストアを作る
+
+    未知の負荷モデルがあれば ValueError。
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    records = [r for r in records if r.get("device_id")]
+    store = DeviceStore(capacity=len(records))
+    store.add_many(
+        device_ids=[r["device_id"] for r in records],
+        attrs=[dict(r.get("attrs", {})) for r in records],
+        power_watts=[float(r.get("power_watts", 10.0)) for r in records],
+        up=[bool(r.get("up", True)) for r in records],
+        auto_jitter=[bool(r.get("auto_jitter", True)) for r in records],
+        jitter_min=[float(r.get("jitter_min", 5.0)) for r in records],
+        jitter_max=[float(r.get("jitter_max", 100.0)) for r in records],
+        model=[_model_code(r) for r in records],
+        phase=[
+            rng.random() if r.get("phase") is None else float(r["phase"])
+            for r in records
+        ],
+        period=[float(r.get("period", DEFAULT_PERIOD)) for r in records],
+        duty=[float(r.get("duty", DEFAULT_DUTY)) for r in records],
+    )
+    return store
+
+
+def parse_time(value: str) -> float:
+    """epoch 秒か ISO 8601（タイムゾーン省略時はローカル時刻）を epoch 秒にする"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_labels(values: list[str]) -> dict[str, str]:
+    """["job=dummy-exporter", ...] を dict にする"""
+    labels: dict[str, str] = {}
+    for value in values:
+        name, sep, label_value = value.partition("=")
+        if not sep or not name:
+            raise ValueError(f"label must be name=value: {value}")
+        labels[name] = label_value
+    return labels
+
+
+def sample_count(devices: int, start: float, end: float, step: float) -> int:
+    """[start, end) を step 秒間隔で生成したときのサンプル数（電力値と UP/DOWN）"""
+    return 2 * devices * max(math.ceil((end - start) / step), 0)
+
+
+def _series_prefix(name: str, labels: dict[str, str]) -> str:
+    metric = json.dumps(
+        {"__name__": name, **labels}, ensure_ascii=False, separators=(",", ":")
+    )
+    return '{"metric":' + metric + ',"values":['
+
+
+def iter_chunks(
+    store: DeviceStore,
+    start: float,
+    end: float,
+    step: float,
+    extra_labels: dict[str, str] | None = None,
+    rng: np.random.Generator | None = None,
+    parent_sum: bool = True,
+    chunk_samples: int = BACKFILL_CHUNK_SAMPLES,
+    compresslevel: int = 6,
+) -> Iterator[bytes]:
+    """
+    [start, end) を step 秒間隔で生成し、gzip メンバーを順に返す
+
+    store の値はシミュレーションで書き換わるので、稼働中のストアではなくコピーを渡す。
+    """
+    if step <= 0 or end <= start:
+        raise ValueError("step must be > 0 and end must be after start")
+    n = len(store)
+    if n == 0:
+        return
+    extra = extra_labels or {}
+    power_prefix: list[str] = []
+    up_prefix: list[str] = []
+    for i, device_id in enumerate(store.ids):
+        room, shelf, device, device_name, parent_id = store.label_row(i)
+        labels = {
+            "room": room,
+            "shelf": shelf,
+            "device": device,
+            "device_name": device_name,
+            "device_id": device_id,
+            "parent_id": parent_id,
+        }
+        power_prefix.append(
+            _series_prefix("switchbot_power_watts", {**extra, **labels})
+        )
+        up_prefix.append(
+            _series_prefix("switchbot_device_up", {**extra, "device_id": device_id})
+        )
+    up_mask = store.up.copy()  # UP/DOWN は期間中変えない
+    up = up_mask.tolist()
+
+    sim = Simulator(store, rng, parent_sum=parent_sum)
+    total = math.ceil((end - start) / step)
+    per_chunk = max(1, chunk_samples // n)
+    for first in range(0, total, per_chunk):
+        times = start + step * np.arange(first, min(first + per_chunk, total))
+        values = np.where(up_mask[:, None], sim.run(times), 0.0)
+        count = len(times)
+        tail = (
+            '],"timestamps":['
+            + ",".join(map(str, (times * 1000).astype(np.int64).tolist()))
+            + "]}\n"
+        )
+        up_values = (",".join(["1"] * count), ",".join(["0"] * count))
+        parts: list[str] = []
+        for i, row in enumerate(values.tolist()):
+            parts += [power_prefix[i], ",".join(map(repr, row)), tail]
+        for i in range(n):
+            parts += [up_prefix[i], up_values[0 if up[i] else 1], tail]
+        yield gzip.compress("".join(parts).encode(), compresslevel)
+
+
+def push_chunk(url: str, payload: bytes, timeout: float = 60.0) -> None:
+    """gzip 済みのチャンクを VictoriaMetrics の /api/v1/import に送る"""
+    request = urllib.request.Request(
+        url,
+        data=payload,
+        method="POST",
+        headers={"Content-Encoding": "gzip", "Content-Type": "application/x-ndjson"},
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+
+
+def _load_records(source: str) -> list[dict[str, Any]]:
+    if source.startswith(("http://", "https://")):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            data = json.load(response)
+    else:
+        with open(source, encoding="utf-8") as f:
+            data = json.load(f)
+    return data["devices"] if isinstance(data, dict) else data
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="dummy-exporter の過去データを生成する"
+    )
+    parser.add_argument(
+        "--devices",
+        default=os.getenv("INITIAL_DEVICES_FILE", "/config/devices.json"),
+        help="初期デバイス定義ファイルか、稼働中の dummy-exporter の /devices の URL",
+    )
+    parser.add_argument("--start", help="開始時刻（epoch 秒か ISO 8601）")
+    parser.add_argument("--end", help="終了時刻（省略で現在）")
+    parser.add_argument(
+        "--days", type=float, help="--start の代わりに終了時刻から遡る日数"
+    )
+    parser.add_argument("--step", type=float, default=60.0, help="サンプル間隔（秒）")
+    parser.add_argument(
+        "--output", help="書き出すファイル（.jsonl.gz）。'-' で標準出力"
+    )
+    parser.add_argument("--url", help="送信先。例: http://localhost:8428/api/v1/import")
+    parser.add_argument(
+        "--label", action="append", default=[], help="全系列に付けるラベル name=value"
+    )
+    parser.add_argument("--seed", type=int, help="乱数のシード（同じ値なら同じデータ）")
+    parser.add_argument(
+        "--no-parent-sum", action="store_true", help="親デバイスを子の合計にしない"
+    )
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        format="%(asctime)s - %(levelname)s - %(message)s",
+    )
+    if (args.output is None) == (args.url is None):
+        parser.error("specify exactly one of --output or --url")
+    end = parse_time(args.end) if args.end else time.time()
+    if args.start:
+        start = parse_time(args.start)
+    elif args.days:
+        start = end - args.days * 86400
+    else:
+        parser.error("specify --start or --days")
+
+    rng = np.random.default_rng(args.seed)
+    try:
+        store = store_from_records(_load_records(args.devices), rng)
+    except ValueError as exc:
+        parser.error(str(exc))
+    chunks = iter_chunks(
+        store,
+        start,
+        end,
+        args.step,
+        extra_labels=parse_labels(args.label),
+        rng=rng,
+        parent_sum=not args.no_parent_sum,
+    )
+    samples = sample_count(len(store), start, end, args.step)
+    logger.info(
+        f"Backfill: {len(store)} device(s), {samples} samples, "
+        f"{datetime.fromtimestamp(start)} → {datetime.fromtimestamp(end)}"
+    )
+
+    written = 0
+    if args.url:
+        for chunk in chunks:
+            push_chunk(args.url, chunk)
+            written += len(chunk)
+    else:
+        out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+    logger.info(f"Backfill done: {written} bytes (gzip)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+一括操作 API のリクエスト本文の読み込み
+
+本文は JSON 配列か NDJSON（1 行 1 オブジェクト）。NDJSON は受信しながら読み、
+BULK_BATCH_SIZE 件ごとにまとめて返すため、数万件でも本文全体を一度にメモリへ載せない。
+
+不正な要素（JSON として読めない行・検証エラー）は全体を失敗にせず、位置と理由を
+BulkResult に記録して飛ばす。
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import AsyncIterator
+from dataclasses import dataclass, field
+from typing import Any, Generic, TypeVar
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "5000"))
+# レスポンスに載せるエラーの最大件数（件数自体は failed で返す）
+MAX_REPORTED_ERRORS = 100
+
+_NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+M = TypeVar("M", bound=BaseModel)
+
+
+@dataclass
+class BulkResult:
+    """一括操作の結果"""
+
+    applied: int = 0
+    failed: int = 0
+    errors: list[dict[str, Any]] = field(default_factory=list)
+
+    def error(self, position: int, reason: str, device_id: Any = None) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(
+                {"index": position, "device_id": device_id, "reason": reason}
+            )
+
+    def to_dict(self) -> dict[str, Any]:
+        errors = sorted(self.errors, key=lambda e: e["index"])
+        return {"applied": self.applied, "failed": self.failed, "errors": errors}
+
+
+@dataclass
+class Batch(Generic[M]):
+    """検証済みの要素と、本文中での位置（0 始まり）"""
+
+    positions: list[int]
+    items: list[M]
+
+
+def _is_ndjson(request: Request) -> bool:
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    return content_type in _NDJSON_TYPES
+
+
+async def _iter_raw(
+    request: Request, result: BulkResult
+) -> AsyncIterator[tuple[int, Any]]:
+    """本文の要素を (位置, 値) で順に返す"""
+    if not _is_ndjson(request):
+        try:
+            body = json.loads(await request.body())
+        except ValueError as exc:
+            raise HTTPException(status_code=400, detail=f"invalid JSON: {exc}")
+        if not isinstance(body, list):
+            raise HTTPException(status_code=422, detail="body must be a JSON array")
+        for position, value in enumerate(body):
+            yield position, value
+        return
+
+    position = 0
+    pending = b""
+    async for chunk in request.stream():
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                value = json.loads(line)
+            except ValueError as exc:
+                result.error(position, f"invalid JSON: {exc}")
+            else:
+                yield position, value
+            position += 1
+    if pending.strip():
+        try:
+            value = json.loads(pending)
+        except ValueError as exc:
+            result.error(position, f"invalid JSON: {exc}")
+        else:
+            yield position, value
+
+
+async def iter_batches(
+    request: Request,
+    model: type[M],
+    result: BulkResult,
+    batch_size: int = BULK_BATCH_SIZE,
+) -> AsyncIterator[Batch[M]]:
+    """本文を model で検証し、batch_size 件ずつ返す"""
+    adapter = TypeAdapter(model)
+    batch: Batch[M] = Batch([], [])
+    async for position, value in _iter_raw(request, result):
+        try:
+            item = adapter.validate_python(value)
+        except ValidationError as exc:
+            device_id = value.get("device_id") if isinstance(value, dict) else None
+            error = exc.errors()[0]
+            loc = ".".join(str(part) for part in error["loc"])
+            result.error(position, f"{loc}: {error['msg']}", device_id)
+            continue
+        batch.positions.append(position)
+        batch.items.append(item)
+        if len(batch.items) >= batch_size:
+            yield batch
+            batch = Batch([], [])
+    if batch.items:
+        yield batch
@@ -0,0 +1,102 @@
+"""
+デバイスストアから直接書き出す /metrics
+
+デバイスごとの Gauge の子を持つと、スクレイプのたびに generate_latest が全サンプルを
+たどってラベルを組み立て直し、削除も 1 件ずつになる。
+ここではデバイスごとのラベル部分（`switchbot_power_watts{...} ` まで）を文字列として
+一度だけ作っておく。ラベル部分と値の部分を交互に並べた出力バッファをスクレイプを
+またいで使い回し、スクレイプ時は値の位置だけを整形し直して連結する。バッファはデバイスの追加・削除・
+属性変更（ストアの version が変わったとき）にだけ組み直す。
+属性を変えたデバイスは forget() でラベル部分のキャッシュから外す。
+"""
+
+from __future__ import annotations
+
+from prometheus_client import CollectorRegistry, generate_latest
+
+from src.store import DeviceStore
+
+POWER_METRIC = "switchbot_power_watts"
+UP_METRIC = "switchbot_device_up"
+
+# ラベル名は prometheus_client の出力と同じくアルファベット順に並べる
+_POWER_HEADER = (
+    f"# HELP {POWER_METRIC} Current power usage in Watts\n# TYPE {POWER_METRIC} gauge"
+)
+_UP_HEADER = (
+    f"# HELP {UP_METRIC} Device availability (1: OK, 0: NG)\n# TYPE {UP_METRIC} gauge"
+)
+_UP_VALUES = ("0.0", "1.0")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+class StoreExposition:
+    """電力値と UP/DOWN をデバイスストアから Prometheus テキスト形式で書き出す"""
+
+    def __init__(self, store: DeviceStore, registry: CollectorRegistry) -> None:
+        self.store = store
+        self.registry = registry  # デバイスごとでないメトリクス（残り API 回数など）
+        # device_id -> ラベル部分（先頭の改行と末尾の空白を含む）
+        self._power_prefix: dict[str, str] = {}
+        self._up_prefix: dict[str, str] = {}
+        # スクレイプをまたいで使い回す出力バッファ（ラベル部分と値の部分が交互に並ぶ）
+        self._rows_version = -1
+        self._buffer: list[str] = []
+        self._power_values = slice(0)
+        self._up_values = slice(0)
+
+    def forget(self, device_id: str) -> None:
+        """削除やラベル変更のあったデバイスのラベル部分を捨てる"""
+        self._power_prefix.pop(device_id, None)
+        self._up_prefix.pop(device_id, None)
+
+    def _prefixes(self, i: int, device_id: str) -> tuple[str, str]:
+        power = self._power_prefix.get(device_id)
+        if power is None:
+            room, shelf, device, device_name, parent_id = self.store.label_row(i)
+            did = _escape(device_id)
+            power = (
+                f'\n{POWER_METRIC}{{device="{_escape(device)}",device_id="{did}",'
+                f'device_name="{_escape(device_name)}",parent_id="{_escape(parent_id)}",'
+                f'room="{_escape(room)}",shelf="{_escape(shelf)}"}} '
+            )
+            self._power_prefix[device_id] = power
+            self._up_prefix[device_id] = f'\n{UP_METRIC}{{device_id="{did}"}} '
+        return power, self._up_prefix[device_id]
+
+    def _sync_rows(self) -> None:
+        """ストアの行の並びが変わっていれば出力バッファを組み直す"""
+        if self._rows_version == self.store.version:
+            return
+        n = len(self.store.ids)
+        # [ヘッダー, ラベル, 値, ラベル, 値, ..., 改行, ヘッダー, ラベル, 値, ..., 改行]
+        buffer: list[str] = [""] * (4 * n + 4)
+        buffer[0] = _POWER_HEADER
+        buffer[2 * n + 1] = "\n"
+        buffer[2 * n + 2] = _UP_HEADER
+        buffer[4 * n + 3] = "\n"
+        pairs = [
+            self._prefixes(i, device_id) for i, device_id in enumerate(self.store.ids)
+        ]
+        buffer[1 : 2 * n + 1 : 2] = [power for power, _ in pairs]
+        buffer[2 * n + 3 : 4 * n + 3 : 2] = [up for _, up in pairs]
+        self._buffer = buffer
+        self._power_values = slice(2, 2 * n + 2, 2)
+        self._up_values = slice(2 * n + 4, 4 * n + 4, 2)
+        self._rows_version = self.store.version
+
+    def render(self) -> bytes:
+        """値の位置だけを書き換えて出力バッファを連結する"""
+        with self.store.lock:
+            self._sync_rows()
+            self._buffer[self._power_values] = map(
+                repr, self.store.exported_watts().tolist()
+            )
+            self._buffer[self._up_values] = [
+                _UP_VALUES[u] for u in self.store.up.tolist()
+            ]
+            body = "".join(self._buffer)
+        return body.encode() + generate_latest(self.registry)
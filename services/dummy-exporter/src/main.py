@@ -13,20 +13,33 @@ import asyncio
 import json
 import logging
 import os
-import random
+import time
 from contextlib import asynccontextmanager
-from typing import Any
+from typing import Any, Literal
 
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import Response, JSONResponse
+import numpy as np
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from prometheus_client import (
     CollectorRegistry,
     Gauge,
-    generate_latest,
     CONTENT_TYPE_LATEST,
 )
 from pydantic import BaseModel, Field
 
+from src.backfill import (
+    BACKFILL_MAX_SAMPLES,
+    iter_chunks,
+    parse_labels,
+    parse_time,
+    sample_count,
+    store_from_records,
+)
+from src.bulk import Batch, BulkResult, iter_batches
+from src.exposition import StoreExposition
+from src.simulation import Simulator
+from src.store import MODELS, DEFAULT_DUTY, DEFAULT_PERIOD, DeviceStore
+
 # ---------------------------------------------------------------------------
 # ロギング
 # ---------------------------------------------------------------------------
@@ -41,20 +54,7 @@ logger = logging.getLogger(__name__)
 # ---------------------------------------------------------------------------
 REGISTRY = CollectorRegistry(auto_describe=False)
 
-POWER_WATT = Gauge(
-    "switchbot_power_watts",
-    "Current power usage in Watts",
-    ["room", "shelf", "device", "device_name", "device_id", "parent_id"],
-    registry=REGISTRY,
-)
-
-DEVICE_UP = Gauge(
-    "switchbot_device_up",
-    "Device availability (1: OK, 0: NG)",
-    ["device_id"],
-    registry=REGISTRY,
-)
-
+# 電力値と UP/DOWN はデバイスストアから直接書き出す（src/exposition.py）
 API_REMAINING = Gauge(
     "switchbot_api_requests_remaining",
     "Remaining API calls for the day (dummy: fixed 9999)",
@@ -63,94 +63,50 @@ API_REMAINING = Gauge(
 API_REMAINING.set(9999)
 
 # ---------------------------------------------------------------------------
-# デバイスストア（インメモリ）
+# デバイスストア（インメモリ、列指向）
 # ---------------------------------------------------------------------------
-# key: device_id (str)
-# value: {
-#   "device_id": str,
-#   "power_watts": float,
-#   "up": bool,
-#   "auto_jitter": bool,
-#   "jitter_min": float,
-#   "jitter_max": float,
-#   "attrs": dict[str, Any]   ← name/room/shelf/device/parent_id + 任意の追加属性
-# }
-_devices: dict[str, dict[str, Any]] = {}
-
-
-def _std_attr(attrs: dict[str, Any]) -> tuple[str, str, str, str, str]:
-    """Prometheus ラベルに使う標準属性を attrs から取得する（なければデフォルト値）"""
-    return (
-        str(attrs.get("room", "unknown")),
-        str(attrs.get("shelf", "unknown")),
-        str(attrs.get("device", "unknown")),
-        str(attrs.get("name", "unknown")),
-        str(attrs.get("parent_id", "none")),
-    )
-
-
-def _apply_metrics(device_id: str) -> None:
-    """デバイスの現在状態をメトリクスに反映する"""
-    rec = _devices.get(device_id)
-    if rec is None:
-        return
+# 電力値・UP/DOWN・ジッター範囲は NumPy 配列、attrs は行ごとの dict（src/store.py）
+_store = DeviceStore()
 
-    room, shelf, device, device_name, parent_id = _std_attr(rec["attrs"])
+_exposition = StoreExposition(_store, REGISTRY)
 
-    DEVICE_UP.labels(device_id=device_id).set(1 if rec["up"] else 0)
 
-    if rec["up"]:
-        POWER_WATT.labels(
-            room=room,
-            shelf=shelf,
-            device=device,
-            device_name=device_name,
-            device_id=device_id,
-            parent_id=parent_id,
-        ).set(rec["power_watts"])
-    else:
-        # DOWN 時は電力を 0 とみなす
-        POWER_WATT.labels(
-            room=room,
-            shelf=shelf,
-            device=device,
-            device_name=device_name,
-            device_id=device_id,
-            parent_id=parent_id,
-        ).set(0.0)
-
-
-def _remove_metrics(device_id: str, attrs: dict[str, Any]) -> None:
-    """デバイス削除時にメトリクスを消去する"""
-    room, shelf, device, device_name, parent_id = _std_attr(attrs)
-    try:
-        POWER_WATT.remove(room, shelf, device, device_name, device_id, parent_id)
-    except KeyError:
-        pass
-    try:
-        DEVICE_UP.remove(device_id)
-    except KeyError:
-        pass
+def _remove_metrics(device_id: str) -> None:
+    """デバイス削除・ラベル変更時に書き出し用のラベルを捨てる"""
+    _exposition.forget(device_id)
 
 
 # ---------------------------------------------------------------------------
-# バックグラウンドジッタータスク
+# バックグラウンドジッタータスク（負荷モデルのシミュレーション）
 # ---------------------------------------------------------------------------
-JITTER_INTERVAL = int(os.getenv("JITTER_INTERVAL", "15"))  # 秒
+JITTER_INTERVAL = float(os.getenv("JITTER_INTERVAL", "15"))  # 秒（1 秒未満も可）
+# 子デバイスを持つデバイスの電力値を子の合計にする
+SIM_PARENT_SUM = os.getenv("SIM_PARENT_SUM", "true").lower() in ("1", "true", "yes")
+
+_rng = np.random.default_rng()
+_simulator = Simulator(_store, _rng, parent_sum=SIM_PARENT_SUM)
+
+
+def _jitter_step() -> int:
+    """auto_jitter=True の全デバイスを負荷モデルに従って 1 ティック進める"""
+    return _simulator.step()
 
 
 async def _jitter_loop() -> None:
-    """auto_jitter=True のデバイスの電力値を定期的にランダム変動させる"""
+    """auto_jitter=True のデバイスの電力値を定期的に変動させる"""
     while True:
         await asyncio.sleep(JITTER_INTERVAL)
-        for device_id, rec in list(_devices.items()):
-            if rec["up"] and rec["auto_jitter"]:
-                new_watts = round(
-                    random.uniform(rec["jitter_min"], rec["jitter_max"]), 2
-                )
-                rec["power_watts"] = new_watts
-                _apply_metrics(device_id)
-                logger.debug(f"Jitter: {device_id} → {new_watts}W")
+        updated = _jitter_step()
+        logger.debug(f"Jitter: {updated} device(s) updated")
+
+
+def _model_code(name: str) -> int:
+    return MODELS.index(name)
+
+
+def _phase_or_random(phase: float | None) -> float:
+    """phase を省略したデバイスはピーク時刻をばらけさせる"""
+    return _rng.random() if phase is None else phase
 
 
 # ---------------------------------------------------------------------------
@@ -172,32 +128,49 @@ def _load_initial_devices() -> None:
         logger.error(f"Failed to load initial devices file: {exc}")
         return
 
-    loaded = 0
+    columns: dict[str, list[Any]] = {
+        "device_ids": [],
+        "attrs": [],
+        "power_watts": [],
+        "up": [],
+        "auto_jitter": [],
+        "jitter_min": [],
+        "jitter_max": [],
+        "model": [],
+        "phase": [],
+        "period": [],
+        "duty": [],
+    }
     for entry in entries:
         device_id = entry.get("device_id")
         if not device_id:
             logger.warning(f"Skipping entry without device_id: {entry}")
             continue
-        if device_id in _devices:
-            logger.debug(f"device_id '{device_id}' already exists, skipping")
-            continue
         jitter_min = float(entry.get("jitter_min", 5.0))
         jitter_max = float(entry.get("jitter_max", 100.0))
         if jitter_max < jitter_min:
             logger.warning(f"jitter_max < jitter_min for {device_id}, swapping")
             jitter_min, jitter_max = jitter_max, jitter_min
-        rec: dict[str, Any] = {
-            "device_id": device_id,
-            "power_watts": float(entry.get("power_watts", 10.0)),
-            "up": bool(entry.get("up", True)),
-            "auto_jitter": bool(entry.get("auto_jitter", True)),
-            "jitter_min": jitter_min,
-            "jitter_max": jitter_max,
-            "attrs": entry.get("attrs", {}),
-        }
-        _devices[device_id] = rec
-        _apply_metrics(device_id)
-        loaded += 1
+        model = entry.get("model", "uniform")
+        if model not in MODELS:
+            logger.warning(f"Unknown model '{model}' for {device_id}, using uniform")
+            model = "uniform"
+        columns["device_ids"].append(device_id)
+        columns["attrs"].append(entry.get("attrs", {}))
+        columns["power_watts"].append(float(entry.get("power_watts", 10.0)))
+        columns["up"].append(bool(entry.get("up", True)))
+        columns["auto_jitter"].append(bool(entry.get("auto_jitter", True)))
+        columns["jitter_min"].append(jitter_min)
+        columns["jitter_max"].append(jitter_max)
+        columns["model"].append(_model_code(model))
+        columns["phase"].append(_phase_or_random(entry.get("phase")))
+        columns["period"].append(float(entry.get("period", DEFAULT_PERIOD)))
+        columns["duty"].append(float(entry.get("duty", DEFAULT_DUTY)))
+
+    skipped = _store.add_many(**columns)
+    for k in skipped:
+        logger.debug(f"device_id '{columns['device_ids'][k]}' already exists, skipping")
+    loaded = len(columns["device_ids"]) - len(skipped)
 
     logger.info(
         f"Initial devices loaded: {loaded} device(s) from {INITIAL_DEVICES_FILE}"
@@ -232,6 +205,9 @@ app = FastAPI(
 # ---------------------------------------------------------------------------
 
 
+ModelName = Literal["uniform", "daily", "weekly", "duty", "walk", "spike"]
+
+
 class AddDeviceRequest(BaseModel):
     device_id: str = Field(..., description="デバイスID（一意）")
     attrs: dict[str, Any] = Field(
@@ -242,6 +218,16 @@ class AddDeviceRequest(BaseModel):
     auto_jitter: bool = Field(default=True, description="自動ランダム変動の有効/無効")
     jitter_min: float = Field(default=5.0, ge=0, description="ジッター最小値（W）")
     jitter_max: float = Field(default=100.0, ge=0, description="ジッター最大値（W）")
+    model: ModelName = Field(default="uniform", description="負荷モデル")
+    period: float = Field(
+        default=DEFAULT_PERIOD, gt=0, description="duty/walk/spike の周期（秒）"
+    )
+    duty: float = Field(
+        default=DEFAULT_DUTY, gt=0, le=1, description="duty の ON 比率 / spike の減衰"
+    )
+    phase: float | None = Field(
+        default=None, ge=0, lt=1, description="周期の位相（0〜1）。省略でランダム"
+    )
 
 
 class SetPowerRequest(BaseModel):
@@ -259,20 +245,67 @@ class UpdateAttrsRequest(BaseModel):
     attrs: dict[str, Any] = Field(..., description="更新する属性（部分更新）")
 
 
+class SetModelRequest(BaseModel):
+    model: ModelName = Field(..., description="負荷モデル")
+    period: float = Field(
+        default=DEFAULT_PERIOD, gt=0, description="duty/walk/spike の周期（秒）"
+    )
+    duty: float = Field(
+        default=DEFAULT_DUTY, gt=0, le=1, description="duty の ON 比率 / spike の減衰"
+    )
+
+
+# 一括操作の要素（本文は JSON 配列か NDJSON）
+
+
+class BulkAddEntry(AddDeviceRequest):
+    up: bool = Field(default=True, description="初期状態（True: UP）")
+
+
+class BulkDeleteEntry(BaseModel):
+    device_id: str = Field(..., description="削除するデバイスID")
+
+
+class BulkPowerEntry(SetPowerRequest):
+    device_id: str = Field(..., description="対象のデバイスID")
+
+
+class BulkStateEntry(SetStateRequest):
+    device_id: str = Field(..., description="対象のデバイスID")
+
+
+class BulkAttrsEntry(UpdateAttrsRequest):
+    device_id: str = Field(..., description="対象のデバイスID")
+
+
+class BulkModelEntry(SetModelRequest):
+    device_id: str = Field(..., description="対象のデバイスID")
+
+
 # ---------------------------------------------------------------------------
 # エンドポイント
 # ---------------------------------------------------------------------------
 
 
+def _find(device_id: str) -> int:
+    """device_id の行番号（なければ 404）"""
+    try:
+        return _store.index(device_id)
+    except KeyError:
+        raise HTTPException(
+            status_code=404, detail=f"device_id '{device_id}' not found"
+        )
+
+
 @app.get("/metrics", summary="Prometheus メトリクス出力")
 def get_metrics() -> Response:
-    output = generate_latest(REGISTRY)
+    output = _exposition.render()
     return Response(content=output, media_type=CONTENT_TYPE_LATEST)
 
 
 @app.get("/devices", summary="デバイス一覧取得")
 def list_devices() -> JSONResponse:
-    return JSONResponse({"devices": list(_devices.values()), "count": len(_devices)})
+    return JSONResponse({"devices": _store.records(), "count": len(_store)})
 
 
 @app.post("/devices", status_code=201, summary="デバイス追加")
@@ -293,7 +326,7 @@ def add_device(req: AddDeviceRequest) -> JSONResponse:
       }'
     ```
     """
-    if req.device_id in _devices:
+    if req.device_id in _store:
         raise HTTPException(
             status_code=409, detail=f"device_id '{req.device_id}' already exists"
         )
@@ -301,19 +334,28 @@ def add_device(req: AddDeviceRequest) -> JSONResponse:
     if req.jitter_max < req.jitter_min:
         raise HTTPException(status_code=422, detail="jitter_max must be >= jitter_min")
 
-    rec: dict[str, Any] = {
-        "device_id": req.device_id,
-        "power_watts": req.power_watts,
-        "up": True,
-        "auto_jitter": req.auto_jitter,
-        "jitter_min": req.jitter_min,
-        "jitter_max": req.jitter_max,
-        "attrs": req.attrs,
-    }
-    _devices[req.device_id] = rec
-    _apply_metrics(req.device_id)
+    try:
+        i = _store.add(
+            req.device_id,
+            attrs=req.attrs,
+            power_watts=req.power_watts,
+            up=True,
+            auto_jitter=req.auto_jitter,
+            jitter_min=req.jitter_min,
+            jitter_max=req.jitter_max,
+            model=_model_code(req.model),
+            phase=_phase_or_random(req.phase),
+            period=req.period,
+            duty=req.duty,
+        )
+    except KeyError:
+        raise HTTPException(
+            status_code=409, detail=f"device_id '{req.device_id}' already exists"
+        )
     logger.info(f"Device added: {req.device_id} attrs={req.attrs}")
-    return JSONResponse({"message": "created", "device": rec}, status_code=201)
+    return JSONResponse(
+        {"message": "created", "device": _store.record(i)}, status_code=201
+    )
 
 
 @app.delete("/devices/{device_id}", summary="デバイス削除")
@@ -325,12 +367,13 @@ def delete_device(device_id: str) -> JSONResponse:
     curl -X DELETE http://localhost:9100/devices/DUMMY001
     ```
     """
-    rec = _devices.pop(device_id, None)
-    if rec is None:
+    try:
+        _store.remove(device_id)
+    except KeyError:
         raise HTTPException(
             status_code=404, detail=f"device_id '{device_id}' not found"
         )
-    _remove_metrics(device_id, rec["attrs"])
+    _remove_metrics(device_id)
     logger.info(f"Device removed: {device_id}")
     return JSONResponse({"message": "deleted", "device_id": device_id})
 
@@ -347,16 +390,11 @@ def set_power(device_id: str, req: SetPowerRequest) -> JSONResponse:
       -d '{"watts": 250.0, "auto_jitter": false}'
     ```
     """
-    rec = _devices.get(device_id)
-    if rec is None:
-        raise HTTPException(
-            status_code=404, detail=f"device_id '{device_id}' not found"
-        )
-
-    rec["power_watts"] = req.watts
-    if req.auto_jitter is not None:
-        rec["auto_jitter"] = req.auto_jitter
-    _apply_metrics(device_id)
+    with _store.lock:
+        i = _find(device_id)
+        _store.set_power(i, req.watts)
+        if req.auto_jitter is not None:
+            _store.set_auto_jitter(i, req.auto_jitter)
     logger.info(f"Power set: {device_id} → {req.watts}W")
     return JSONResponse(
         {"message": "updated", "device_id": device_id, "power_watts": req.watts}
@@ -375,14 +413,9 @@ def set_state(device_id: str, req: SetStateRequest) -> JSONResponse:
       -d '{"up": false}'
     ```
     """
-    rec = _devices.get(device_id)
-    if rec is None:
-        raise HTTPException(
-            status_code=404, detail=f"device_id '{device_id}' not found"
-        )
-
-    rec["up"] = req.up
-    _apply_metrics(device_id)
+    with _store.lock:
+        i = _find(device_id)
+        _store.set_up(i, req.up)
     state_str = "UP" if req.up else "DOWN"
     logger.info(f"State set: {device_id} → {state_str}")
     return JSONResponse({"message": "updated", "device_id": device_id, "up": req.up})
@@ -401,19 +434,243 @@ def update_attrs(device_id: str, req: UpdateAttrsRequest) -> JSONResponse:
       -d '{"room": "bedroom", "custom_tag": "server-a"}'
     ```
     """
-    rec = _devices.get(device_id)
-    if rec is None:
+    with _store.lock:
+        i = _find(device_id)
+        # 旧ラベルのメトリクスを削除してから属性を更新
+        _remove_metrics(device_id)
+        _store.update_attrs(i, req.attrs)
+        attrs = _store.attrs[i]
+    logger.info(f"Attrs updated: {device_id} → {attrs}")
+    return JSONResponse({"message": "updated", "device_id": device_id, "attrs": attrs})
+
+
+@app.put("/devices/{device_id}/model", summary="負荷モデルの設定")
+def set_model(device_id: str, req: SetModelRequest) -> JSONResponse:
+    """
+    デバイスの負荷モデルを切り替える。値の範囲は jitter_min〜jitter_max のまま。
+
+    ```bash
+    # 30 分周期で 20% だけ ON になる機器（冷蔵庫のコンプレッサーなど）
+    curl -X PUT http://localhost:9100/devices/DUMMY001/model \\
+      -H 'Content-Type: application/json' \\
+      -d '{"model": "duty", "period": 1800, "duty": 0.2}'
+    ```
+    """
+    with _store.lock:
+        i = _find(device_id)
+        _store.set_model(i, _model_code(req.model), req.period, req.duty)
+    logger.info(f"Model set: {device_id} → {req.model}")
+    return JSONResponse(
+        {"message": "updated", "device_id": device_id, **req.model_dump()}
+    )
+
+
+# ---------------------------------------------------------------------------
+# 一括操作
+# ---------------------------------------------------------------------------
+# 本文は JSON 配列か NDJSON（Content-Type: application/x-ndjson）。
+# BULK_BATCH_SIZE 件ごとに 1 回でストアへ反映し、不正・該当なしの要素は飛ばして件数と理由を返す。
+
+
+def _found_rows(batch: Batch[Any], result: BulkResult) -> tuple[np.ndarray, list[Any]]:
+    """バッチの要素のうちストアにあるものの行番号と要素（ストアのロック内で呼ぶ）"""
+    rows, missing = _store.rows([item.device_id for item in batch.items])
+    for k in missing:
+        result.error(batch.positions[k], "not found", batch.items[k].device_id)
+    missing_set = set(missing)
+    items = [item for k, item in enumerate(batch.items) if k not in missing_set]
+    result.applied += len(items)
+    return rows, items
+
+
+def _bulk_response(operation: str, result: BulkResult) -> JSONResponse:
+    logger.info(
+        f"Bulk {operation}: {result.applied} applied, {result.failed} failed "
+        f"(devices: {len(_store)})"
+    )
+    return JSONResponse(
+        {"message": operation, **result.to_dict(), "device_count": len(_store)}
+    )
+
+
+@app.post("/bulk/devices", summary="デバイスの一括追加")
+async def bulk_add(request: Request) -> JSONResponse:
+    """
+    デバイスをまとめて追加する。要素は `POST /devices` と同じ形（`up` も指定可）。
+
+    ```bash
+    curl -X POST http://localhost:9100/bulk/devices \\
+      -H 'Content-Type: application/x-ndjson' --data-binary @devices.ndjson
+    ```
+    """
+    result = BulkResult()
+    async for batch in iter_batches(request, BulkAddEntry, result):
+        positions: list[int] = []
+        items: list[BulkAddEntry] = []
+        for position, item in zip(batch.positions, batch.items):
+            if item.jitter_max < item.jitter_min:
+                result.error(
+                    position, "jitter_max must be >= jitter_min", item.device_id
+                )
+            else:
+                positions.append(position)
+                items.append(item)
+        skipped = _store.add_many(
+            device_ids=[item.device_id for item in items],
+            attrs=[item.attrs for item in items],
+            power_watts=[item.power_watts for item in items],
+            up=[item.up for item in items],
+            auto_jitter=[item.auto_jitter for item in items],
+            jitter_min=[item.jitter_min for item in items],
+            jitter_max=[item.jitter_max for item in items],
+            model=[_model_code(item.model) for item in items],
+            phase=[_phase_or_random(item.phase) for item in items],
+            period=[item.period for item in items],
+            duty=[item.duty for item in items],
+        )
+        for k in skipped:
+            result.error(positions[k], "already exists", items[k].device_id)
+        result.applied += len(items) - len(skipped)
+    return _bulk_response("created", result)
+
+
+@app.post("/bulk/devices/delete", summary="デバイスの一括削除")
+async def bulk_delete(request: Request) -> JSONResponse:
+    """要素は `{"device_id": "..."}`。"""
+    result = BulkResult()
+    async for batch in iter_batches(request, BulkDeleteEntry, result):
+        device_ids = [item.device_id for item in batch.items]
+        missing = _store.remove_many(device_ids)
+        missing_set = set(missing)
+        for k, device_id in enumerate(device_ids):
+            if k not in missing_set:
+                _remove_metrics(device_id)
+        for k in missing:
+            result.error(batch.positions[k], "not found", device_ids[k])
+        result.applied += len(device_ids) - len(missing)
+    return _bulk_response("deleted", result)
+
+
+@app.put("/bulk/devices/power", summary="電力値の一括設定")
+async def bulk_set_power(request: Request) -> JSONResponse:
+    """要素は `{"device_id": "...", "watts": 100.0, "auto_jitter": false}`（auto_jitter は任意）。"""
+    result = BulkResult()
+    async for batch in iter_batches(request, BulkPowerEntry, result):
+        with _store.lock:
+            rows, items = _found_rows(batch, result)
+            _store.set_power(rows, [item.watts for item in items])
+            toggled = [
+                k for k, item in enumerate(items) if item.auto_jitter is not None
+            ]
+            _store.set_auto_jitter(
+                rows[toggled], [items[k].auto_jitter for k in toggled]
+            )
+    return _bulk_response("updated", result)
+
+
+@app.put("/bulk/devices/state", summary="UP/DOWN の一括設定")
+async def bulk_set_state(request: Request) -> JSONResponse:
+    """要素は `{"device_id": "...", "up": false}`。"""
+    result = BulkResult()
+    async for batch in iter_batches(request, BulkStateEntry, result):
+        with _store.lock:
+            rows, items = _found_rows(batch, result)
+            _store.set_up(rows, [item.up for item in items])
+    return _bulk_response("updated", result)
+
+
+@app.patch("/bulk/devices/attrs", summary="デバイス属性の一括編集")
+async def bulk_update_attrs(request: Request) -> JSONResponse:
+    """要素は `{"device_id": "...", "attrs": {...}}`（各デバイスの属性を部分更新）。"""
+    result = BulkResult()
+    async for batch in iter_batches(request, BulkAttrsEntry, result):
+        with _store.lock:
+            rows, items = _found_rows(batch, result)
+            for i, item in zip(rows.tolist(), items):
+                _remove_metrics(item.device_id)
+                _store.update_attrs(i, item.attrs)
+    return _bulk_response("updated", result)
+
+
+@app.put("/bulk/devices/model", summary="負荷モデルの一括設定")
+async def bulk_set_model(request: Request) -> JSONResponse:
+    """要素は `{"device_id": "...", "model": "daily", "period": 3600, "duty": 0.5}`。"""
+    result = BulkResult()
+    async for batch in iter_batches(request, BulkModelEntry, result):
+        with _store.lock:
+            rows, items = _found_rows(batch, result)
+            _store.set_model(
+                rows,
+                [_model_code(item.model) for item in items],
+                [item.period for item in items],
+                [item.duty for item in items],
+            )
+    return _bulk_response("updated", result)
+
+
+# ---------------------------------------------------------------------------
+# バックフィル
+# ---------------------------------------------------------------------------
+
+
+@app.get("/backfill", summary="過去データの生成（JSON line import 形式、gzip）")
+def backfill(
+    start: str | None = Query(
+        default=None, description="開始時刻（epoch 秒か ISO 8601）"
+    ),
+    end: str | None = Query(default=None, description="終了時刻。省略で現在"),
+    days: float | None = Query(
+        default=None, gt=0, description="start の代わりに遡る日数"
+    ),
+    step: float = Query(default=60.0, gt=0, description="サンプル間隔（秒）"),
+    label: list[str] = Query(default=[], description="全系列に付けるラベル name=value"),
+) -> StreamingResponse:
+    """
+    現在のデバイスと負荷モデルから指定期間の時系列を生成し、gzip 圧縮して返す。
+    稼働中の値には影響しない。出力はそのまま VictoriaMetrics の `/api/v1/import` に送れる。
+
+    ```bash
+    curl -o backfill.jsonl.gz 'http://localhost:9100/backfill?days=30&step=60&label=job=dummy-exporter'
+    curl -X POST http://localhost:8428/api/v1/import \\
+      -H 'Content-Encoding: gzip' --data-binary @backfill.jsonl.gz
+    ```
+    """
+    try:
+        end_ts = parse_time(end) if end else time.time()
+        if start:
+            start_ts = parse_time(start)
+        elif days:
+            start_ts = end_ts - days * 86400
+        else:
+            raise ValueError("specify start or days")
+        labels = parse_labels(label)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if end_ts <= start_ts:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    samples = sample_count(len(_store), start_ts, end_ts, step)
+    if samples > BACKFILL_MAX_SAMPLES:
         raise HTTPException(
-            status_code=404, detail=f"device_id '{device_id}' not found"
+            status_code=400,
+            detail=(
+                f"too many samples: {samples} > {BACKFILL_MAX_SAMPLES} "
+                "(shorten the period or increase step)"
+            ),
         )
 
-    # 旧ラベルのメトリクスを削除してから属性を更新
-    _remove_metrics(device_id, rec["attrs"])
-    rec["attrs"].update(req.attrs)
-    _apply_metrics(device_id)
-    logger.info(f"Attrs updated: {device_id} → {rec['attrs']}")
-    return JSONResponse(
-        {"message": "updated", "device_id": device_id, "attrs": rec["attrs"]}
+    # 生成はコピーしたストアで行う（稼働中の値を進めない）
+    store = store_from_records(_store.records(), _rng)
+    logger.info(
+        f"Backfill requested: {len(store)} device(s), {start_ts:.0f}-{end_ts:.0f}, "
+        f"step {step}s"
+    )
+    chunks = iter_chunks(
+        store, start_ts, end_ts, step, labels, _rng, parent_sum=SIM_PARENT_SUM
+    )
+    return StreamingResponse(
+        chunks,
+        media_type="application/gzip",
+        headers={"Content-Disposition": 'attachment; filename="backfill.jsonl.gz"'},
     )
 
 
@@ -445,7 +702,7 @@ def _status_row(rec: dict[str, Any]) -> str:
     watts = f"{rec['power_watts']:.1f}W".rjust(10)
     up = "UP  ✓" if rec["up"] else "DOWN ✗"
     if rec["auto_jitter"]:
-        jitter = f"{rec['jitter_min']:.0f}-{rec['jitter_max']:.0f}W (auto)"
+        jitter = f"{rec['jitter_min']:.0f}-{rec['jitter_max']:.0f}W ({rec['model']})"
     else:
         jitter = "fixed"
     jitter = jitter[:14].ljust(14)
@@ -465,16 +722,16 @@ def get_status() -> Response:
     curl http://localhost:9100/status
     ```
     """
-    if not _devices:
+    if not len(_store):
         body = 'No devices registered.\n\nAdd a device:\n  curl -X POST http://localhost:9100/devices -H \'Content-Type: application/json\' -d \'{"device_id":"DUMMY001","attrs":{"name":"pc","room":"work","shelf":"desk","device":"pc"},"power_watts":100.0}\'\n'
         return Response(content=body, media_type="text/plain; charset=utf-8")
 
-    rows = "".join(_status_row(rec) for rec in _devices.values())
-    up_count = sum(1 for r in _devices.values() if r["up"])
-    total_watts = sum(r["power_watts"] for r in _devices.values() if r["up"])
+    rows = "".join(_status_row(rec) for rec in _store.records())
+    up_count = _store.up_count()
+    total_watts = _store.total_watts()
     summary = (
-        f"\n  devices: {len(_devices)}  |  up: {up_count}  "
-        f"|  down: {len(_devices) - up_count}  |  total power: {total_watts:.1f}W\n"
+        f"\n  devices: {len(_store)}  |  up: {up_count}  "
+        f"|  down: {len(_store) - up_count}  |  total power: {total_watts:.1f}W\n"
     )
     body = _STATUS_HEADER + rows + _STATUS_FOOTER + summary
     return Response(content=body, media_type="text/plain; charset=utf-8")
@@ -557,7 +814,7 @@ def _html_row(rec: dict[str, Any]) -> str:
     )
     watts = f"{rec['power_watts']:.1f}"
     if rec["auto_jitter"]:
-        jitter = f"{rec['jitter_min']:.0f}–{rec['jitter_max']:.0f} (auto)"
+        jitter = f"{rec['jitter_min']:.0f}–{rec['jitter_max']:.0f} ({rec['model']})"
     else:
         jitter = "fixed"
     extra = " ".join(
@@ -615,20 +872,20 @@ def dashboard(request: Request) -> Response:
     curl チートシートも確認できる。
     """
     rows_html = (
-        "".join(_html_row(r) for r in _devices.values())
-        if _devices
+        "".join(_html_row(r) for r in _store.records())
+        if len(_store)
         else '      <tr><td colspan="9" style="color:#666;text-align:center">No devices registered</td></tr>\n'
     )
 
-    up_count = sum(1 for r in _devices.values() if r["up"])
-    total_watts = sum(r["power_watts"] for r in _devices.values() if r["up"])
+    up_count = _store.up_count()
+    total_watts = _store.total_watts()
     base = str(request.base_url).rstrip("/")
 
     html = _HTML_TEMPLATE.format(
         jitter_interval=JITTER_INTERVAL,
-        total=len(_devices),
+        total=len(_store),
         up_count=up_count,
-        dn_count=len(_devices) - up_count,
+        dn_count=len(_store) - up_count,
         total_watts=total_watts,
         rows=rows_html,
         cheatsheet=_build_cheatsheet(base),
@@ -643,7 +900,7 @@ def dashboard(request: Request) -> Response:
 
 @app.get("/healthz", summary="ヘルスチェック")
 def healthz() -> JSONResponse:
-    return JSONResponse({"status": "ok", "device_count": len(_devices)})
+    return JSONResponse({"status": "ok", "device_count": len(_store)})
 
 
 # ---------------------------------------------------------------------------
@@ -652,5 +909,6 @@ def healthz() -> JSONResponse:
 if __name__ == "__main__":
     import uvicorn
 
+    # サービスのルートから `python -m src.main` で起動する（src.* を import するため）
     port = int(os.getenv("METRICS_PORT", "9100"))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=False)
+    uvicorn.run("src.main:app", host="0.0.0.0", port=port, reload=False)
@@ -0,0 +1,203 @@
+"""
+負荷プロファイルのシミュレーション
+
+デバイスごとに負荷モデルを選び、全デバイスを配列演算でまとめて 1 ティック進める。
+バックフィルでは複数の時刻を 1 回の run() でまとめて計算する。
+値の範囲は各デバイスの jitter_min〜jitter_max。
+
+| モデル    | 振る舞い                                                                  |
+| --------- | ------------------------------------------------------------------------- |
+| `uniform` | ティックごとに範囲内の一様乱数（従来のジッター）                          |
+| `daily`   | 1 日周期の正弦波。phase（0〜1）は 1 日のうちピークになる時刻の割合        |
+| `weekly`  | daily に 1 週間周期の変動を重ねる                                         |
+| `duty`    | period 秒周期のうち duty の割合だけ ON（上限付近）、残りは OFF（下限付近） |
+| `walk`    | ランダムウォーク。period 秒でおよそ範囲の幅だけ動く                       |
+| `spike`   | 下限付近で待機し、平均 period 秒ごとに上限まで跳ねて duty×period 秒で減衰 |
+
+parent_sum が有効なら、子デバイス（parent_id が他のデバイスを指すもの）を持つデバイスの
+電力値は子の電力値の合計になる（DOWN の子は 0 として数える）。
+"""
+
+from __future__ import annotations
+
+import time
+from collections.abc import Callable
+
+import numpy as np
+
+from src.store import MODELS, DeviceStore
+
+UNIFORM, DAILY, WEEKLY, DUTY, WALK, SPIKE = range(len(MODELS))
+
+DAY = 86400.0
+WEEK = 7 * DAY
+# 周期モデルに加えるノイズ（範囲の幅に対する標準偏差）
+NOISE = 0.02
+
+
+def _local_offset() -> float:
+    """UTC からの時差（秒）。daily / weekly の位相をローカル時刻に合わせる"""
+    return float(time.localtime().tm_gmtoff)
+
+
+class Simulator:
+    """デバイスストアの電力値を負荷モデルに従って進める"""
+
+    def __init__(
+        self,
+        store: DeviceStore,
+        rng: np.random.Generator | None = None,
+        parent_sum: bool = True,
+        utc_offset: float | None = None,
+    ) -> None:
+        self.store = store
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.parent_sum = parent_sum
+        self.utc_offset = _local_offset() if utc_offset is None else utc_offset
+        self._last: float | None = None
+        # 親子の集計計画（ストアの version が変わったときだけ作り直す）
+        self._plan_version = -1
+        self._levels: list[tuple[np.ndarray, np.ndarray]] = []
+        self._parents = np.empty(0, dtype=np.intp)
+        self._models: dict[int, Callable[..., np.ndarray]] = {
+            UNIFORM: self._uniform,
+            DAILY: self._daily,
+            WEEKLY: self._weekly,
+            DUTY: self._duty,
+            WALK: self._walk,
+            SPIKE: self._spike,
+        }
+
+    def step(self, now: float | None = None) -> int:
+        """1 ティック進め、値を更新したデバイス数を返す"""
+        now = time.time() if now is None else now
+        with self.store.lock:
+            self.run(np.array([now]))
+            return int(np.count_nonzero(self.store.up & self.store.auto_jitter))
+
+    def run(self, times: np.ndarray) -> np.ndarray:
+        """
+        times（昇順の epoch 秒）の各時刻まで進め、(デバイス, 時刻) の電力値を返す
+
+        時刻の方向にも配列演算でまとめて計算する（状態を持つ walk / spike だけは時刻順に回す）。
+        ストアの電力値は最後の時刻の値になる。
+        """
+        store = self.store
+        last = times[0] if self._last is None else self._last
+        dts = np.maximum(np.diff(times, prepend=last), 0.0)
+        self._last = float(times[-1])
+        with store.lock:
+            watts = store.watts  # ビューなので書き込みはストアに反映される
+            values = np.repeat(watts[:, None], len(times), axis=1)
+            active = store.up & store.auto_jitter
+            model = store.model
+            for code, advance in self._models.items():
+                rows = np.flatnonzero(active & (model == code))
+                if rows.size == 0:
+                    continue
+                low = store.jitter_min[rows, None]
+                span = store.jitter_max[rows, None] - low
+                values[rows] = np.round(advance(rows, times, dts, low, span), 2)
+            if self.parent_sum:
+                self._sum_children(values)
+            watts[:] = values[:, -1]
+        return values
+
+    # ------------------------------------------------------------------
+    # 負荷モデル（rows の行について (行, 時刻) の値を返す。low / span は (行, 1)）
+    # ------------------------------------------------------------------
+
+    def _noise(self, span: np.ndarray, count: int) -> np.ndarray:
+        return self.rng.normal(0.0, NOISE, (span.shape[0], count)) * span
+
+    def _uniform(self, rows, times, dts, low, span) -> np.ndarray:
+        return low + span * self.rng.random((rows.size, times.size))
+
+    def _daily_shape(self, rows: np.ndarray, times: np.ndarray) -> np.ndarray:
+        day = (times[None, :] + self.utc_offset) / DAY
+        return 0.5 + 0.5 * np.cos(2 * np.pi * (day - self.store.phase[rows, None]))
+
+    def _daily(self, rows, times, dts, low, span) -> np.ndarray:
+        shape = self._daily_shape(rows, times)
+        noise = self._noise(span, times.size)
+        return low + np.clip(span * shape + noise, 0.0, span)
+
+    def _weekly(self, rows, times, dts, low, span) -> np.ndarray:
+        week = (times[None, :] + self.utc_offset) / WEEK
+        weekly = 0.5 + 0.5 * np.cos(2 * np.pi * (week - self.store.phase[rows, None]))
+        shape = 0.6 * self._daily_shape(rows, times) + 0.4 * weekly
+        noise = self._noise(span, times.size)
+        return low + np.clip(span * shape + noise, 0.0, span)
+
+    def _duty(self, rows, times, dts, low, span) -> np.ndarray:
+        period = self.store.period[rows, None]
+        cycle = (times[None, :] / period + self.store.phase[rows, None]) % 1.0
+        on = cycle < self.store.duty[rows, None]
+        level = np.where(on, span, 0.0)
+        noise = self._noise(span, times.size)
+        return low + np.clip(level + noise, 0.0, span)
+
+    def _walk(self, rows, times, dts, low, span) -> np.ndarray:
+        low, span = low[:, 0], span[:, 0]
+        scale = span / np.sqrt(self.store.period[rows])
+        steps = self.rng.normal(0.0, 1.0, (rows.size, times.size))
+        current = np.clip(self.store.watts[rows], low, low + span)
+        out = np.empty((rows.size, times.size))
+        for k, dt in enumerate(dts.tolist()):
+            current = np.clip(current + steps[:, k] * scale * dt**0.5, low, low + span)
+            out[:, k] = current
+        return out
+
+    def _spike(self, rows, times, dts, low, span) -> np.ndarray:
+        low, span = low[:, 0], span[:, 0]
+        period = self.store.period[rows]
+        tau = np.maximum(self.store.duty[rows] * period, 1e-3)
+        draws = self.rng.random((rows.size, times.size))
+        excess = np.clip(self.store.watts[rows] - low, 0.0, span)
+        out = np.empty((rows.size, times.size))
+        for k, dt in enumerate(dts.tolist()):
+            fired = draws[:, k] < -np.expm1(-dt / period)
+            excess = np.where(fired, span, excess * np.exp(-dt / tau))
+            out[:, k] = low + excess
+        return out
+
+    # ------------------------------------------------------------------
+    # 親子の整合
+    # ------------------------------------------------------------------
+
+    def _sync_plan(self) -> None:
+        """深さごとの (子の行, 親の行) を深い順に並べる。循環した親子は集計しない"""
+        if self._plan_version == self.store.version:
+            return
+        parent = self.store.parent_rows()
+        depth = np.where(parent < 0, 0, -1)
+        levels: list[tuple[np.ndarray, np.ndarray]] = []
+        d = 0
+        while True:
+            known = parent >= 0
+            child = np.flatnonzero(known & (depth < 0))
+            child = child[depth[parent[child]] == d]
+            if child.size == 0:
+                break
+            d += 1
+            depth[child] = d
+            levels.append((child, parent[child]))
+        levels.reverse()
+        self._levels = levels
+        self._parents = (
+            np.unique(np.concatenate([p for _, p in levels]))
+            if levels
+            else np.empty(0, dtype=np.intp)
+        )
+        self._plan_version = self.store.version
+
+    def _sum_children(self, values: np.ndarray) -> None:
+        """values（デバイス, 時刻）の親の行を子の合計で置き換える"""
+        self._sync_plan()
+        if not self._levels:
+            return
+        up = self.store.up
+        values[self._parents] = 0.0
+        for child, parent in self._levels:
+            np.add.at(values, parent, np.where(up[child, None], values[child], 0.0))
+        values[self._parents] = np.round(values[self._parents], 2)
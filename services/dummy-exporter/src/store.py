@@ -0,0 +1,420 @@
+"""
+列指向のデバイスストア
+
+10 万台規模の擬似デバイスを 1 Pod で扱うため、デバイスごとの dict ではなく
+項目ごとの NumPy 配列（電力値・UP/DOWN・ジッター範囲）にまとめて保持する。
+ジッターは全デバイスを 1 回の配列演算で更新する。
+
+- 電力値の変化のさせ方（負荷モデル）と、そのパラメータも列として持つ（src/simulation.py が使う）
+- 削除は末尾の行との入れ替えで行い、配列を常に詰まった状態に保つ（行番号は変わりうる）
+- Prometheus ラベルに使う標準属性の組はラベル表に 1 度だけ登録し、各行は表の番号を持つ
+- API ハンドラ（スレッドプール）とジッターループ（イベントループ）から触るため、操作はロックで守る
+"""
+
+from __future__ import annotations
+
+import sys
+import threading
+from typing import Any
+
+import numpy as np
+
+# Prometheus ラベルに使う標準属性（attrs のキー）とデフォルト値
+LABEL_KEYS = ("room", "shelf", "device", "name", "parent_id")
+_LABEL_DEFAULTS = ("unknown", "unknown", "unknown", "unknown", "none")
+
+LabelValues = tuple[str, str, str, str, str]
+
+# 負荷モデル（model 列にはこのタプルでの位置を入れる）
+MODELS = ("uniform", "daily", "weekly", "duty", "walk", "spike")
+DEFAULT_PERIOD = 3600.0
+DEFAULT_DUTY = 0.5
+
+
+def label_values(attrs: dict[str, Any]) -> LabelValues:
+    """attrs から標準属性を取り出す（なければデフォルト値）"""
+    return tuple(  # type: ignore[return-value]
+        sys.intern(str(attrs.get(key, default)))
+        for key, default in zip(LABEL_KEYS, _LABEL_DEFAULTS)
+    )
+
+
+class LabelTable:
+    """標準属性の組を番号で共有する表（同じ部屋・棚のデバイスは同じ文字列を指す）"""
+
+    def __init__(self) -> None:
+        self.rows: list[LabelValues | None] = []
+        self._ids: dict[LabelValues, int] = {}
+        self._refs: list[int] = []
+        self._free: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def acquire(self, values: LabelValues) -> int:
+        label_id = self._ids.get(values)
+        if label_id is None:
+            if self._free:
+                label_id = self._free.pop()
+                self.rows[label_id] = values
+                self._refs[label_id] = 0
+            else:
+                label_id = len(self.rows)
+                self.rows.append(values)
+                self._refs.append(0)
+            self._ids[values] = label_id
+        self._refs[label_id] += 1
+        return label_id
+
+    def release(self, label_id: int) -> None:
+        self._refs[label_id] -= 1
+        if self._refs[label_id] == 0:
+            values = self.rows[label_id]
+            del self._ids[values]  # type: ignore[arg-type]
+            self.rows[label_id] = None
+            self._free.append(label_id)
+
+
+class DeviceStore:
+    """擬似デバイスの状態を列ごとの配列で保持する"""
+
+    # 行と一緒に動かす配列の属性名
+    _COLUMNS = (
+        "_watts",
+        "_jitter_min",
+        "_jitter_max",
+        "_up",
+        "_auto_jitter",
+        "_label_id",
+        "_model",
+        "_phase",
+        "_period",
+        "_duty",
+    )
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self.lock = threading.RLock()
+        self.labels = LabelTable()
+        self.ids: list[str] = []
+        self.attrs: list[dict[str, Any]] = []
+        self._index: dict[str, int] = {}
+        # 行の並びかラベルが変わるたびに増える（行に沿ったキャッシュの無効化に使う）
+        self.version = 0
+        capacity = max(capacity, 1)
+        self._watts = np.zeros(capacity, dtype=np.float64)
+        self._jitter_min = np.zeros(capacity, dtype=np.float64)
+        self._jitter_max = np.zeros(capacity, dtype=np.float64)
+        self._up = np.zeros(capacity, dtype=np.bool_)
+        self._auto_jitter = np.zeros(capacity, dtype=np.bool_)
+        self._label_id = np.zeros(capacity, dtype=np.int32)
+        self._model = np.zeros(capacity, dtype=np.int8)
+        self._phase = np.zeros(capacity, dtype=np.float64)
+        self._period = np.zeros(capacity, dtype=np.float64)
+        self._duty = np.zeros(capacity, dtype=np.float64)
+
+    def _grow(self) -> None:
+        """容量を倍にする（既存の行はコピーする）"""
+        size = len(self.ids)
+        for name in self._COLUMNS:
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:size] = old[:size]
+            setattr(self, name, new)
+
+    # 各列の有効部分（ビュー。コピーしない）
+    @property
+    def watts(self) -> np.ndarray:
+        return self._watts[: len(self.ids)]
+
+    @property
+    def up(self) -> np.ndarray:
+        return self._up[: len(self.ids)]
+
+    @property
+    def auto_jitter(self) -> np.ndarray:
+        return self._auto_jitter[: len(self.ids)]
+
+    @property
+    def jitter_min(self) -> np.ndarray:
+        return self._jitter_min[: len(self.ids)]
+
+    @property
+    def jitter_max(self) -> np.ndarray:
+        return self._jitter_max[: len(self.ids)]
+
+    @property
+    def label_id(self) -> np.ndarray:
+        return self._label_id[: len(self.ids)]
+
+    @property
+    def model(self) -> np.ndarray:
+        return self._model[: len(self.ids)]
+
+    @property
+    def phase(self) -> np.ndarray:
+        return self._phase[: len(self.ids)]
+
+    @property
+    def period(self) -> np.ndarray:
+        return self._period[: len(self.ids)]
+
+    @property
+    def duty(self) -> np.ndarray:
+        return self._duty[: len(self.ids)]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, device_id: object) -> bool:
+        return device_id in self._index
+
+    def index(self, device_id: str) -> int:
+        """device_id の行番号（なければ KeyError）"""
+        return self._index[device_id]
+
+    # ------------------------------------------------------------------
+    # 追加・削除
+    # ------------------------------------------------------------------
+
+    def add(
+        self,
+        device_id: str,
+        attrs: dict[str, Any],
+        power_watts: float,
+        up: bool,
+        auto_jitter: bool,
+        jitter_min: float,
+        jitter_max: float,
+        model: int = 0,
+        phase: float = 0.0,
+        period: float = DEFAULT_PERIOD,
+        duty: float = DEFAULT_DUTY,
+    ) -> int:
+        with self.lock:
+            if device_id in self._index:
+                raise KeyError(device_id)
+            i = len(self.ids)
+            if i == len(self._watts):
+                self._grow()
+            self._watts[i] = power_watts
+            self._up[i] = up
+            self._auto_jitter[i] = auto_jitter
+            self._jitter_min[i] = jitter_min
+            self._jitter_max[i] = jitter_max
+            self._model[i] = model
+            self._phase[i] = phase
+            self._period[i] = period
+            self._duty[i] = duty
+            self._label_id[i] = self.labels.acquire(label_values(attrs))
+            self.ids.append(sys.intern(device_id))
+            self.attrs.append(attrs)
+            self._index[device_id] = i
+            self.version += 1
+            return i
+
+    def remove(self, device_id: str) -> dict[str, Any]:
+        """デバイスを削除し、削除前のレコードを返す（なければ KeyError）"""
+        with self.lock:
+            i = self._index.pop(device_id)
+            rec = self.record(i)
+            self.labels.release(int(self._label_id[i]))
+            last = len(self.ids) - 1
+            if i != last:
+                # 末尾の行を空いた位置へ移す
+                for name in self._COLUMNS:
+                    column = getattr(self, name)
+                    column[i] = column[last]
+                self.ids[i] = self.ids[last]
+                self.attrs[i] = self.attrs[last]
+                self._index[self.ids[i]] = i
+            self.ids.pop()
+            self.attrs.pop()
+            self.version += 1
+            return rec
+
+    def add_many(
+        self,
+        device_ids: list[str],
+        attrs: list[dict[str, Any]],
+        power_watts: list[float],
+        up: list[bool],
+        auto_jitter: list[bool],
+        jitter_min: list[float],
+        jitter_max: list[float],
+        model: list[int] | None = None,
+        phase: list[float] | None = None,
+        period: list[float] | None = None,
+        duty: list[float] | None = None,
+    ) -> list[int]:
+        """
+        まとめて追加する（各列は 1 回の配列代入で書き込む）
+
+        既に存在する・同じ呼び出しの中で重複した device_id は追加せず、その位置を返す。
+        負荷モデルの列を省略した場合は add() と同じデフォルト値になる。
+        """
+        with self.lock:
+            keep: list[int] = []
+            skipped: list[int] = []
+            seen: set[str] = set()
+            for k, device_id in enumerate(device_ids):
+                if device_id in self._index or device_id in seen:
+                    skipped.append(k)
+                else:
+                    seen.add(device_id)
+                    keep.append(k)
+            if not keep:
+                return skipped
+
+            start = len(self.ids)
+            while start + len(keep) > len(self._watts):
+                self._grow()
+            rows = slice(start, start + len(keep))
+            self._watts[rows] = [power_watts[k] for k in keep]
+            self._up[rows] = [up[k] for k in keep]
+            self._auto_jitter[rows] = [auto_jitter[k] for k in keep]
+            self._jitter_min[rows] = [jitter_min[k] for k in keep]
+            self._jitter_max[rows] = [jitter_max[k] for k in keep]
+            self._model[rows] = 0 if model is None else [model[k] for k in keep]
+            self._phase[rows] = 0.0 if phase is None else [phase[k] for k in keep]
+            self._period[rows] = (
+                DEFAULT_PERIOD if period is None else [period[k] for k in keep]
+            )
+            self._duty[rows] = DEFAULT_DUTY if duty is None else [duty[k] for k in keep]
+            self._label_id[rows] = [
+                self.labels.acquire(label_values(attrs[k])) for k in keep
+            ]
+            for offset, k in enumerate(keep):
+                device_id = sys.intern(device_ids[k])
+                self.ids.append(device_id)
+                self.attrs.append(attrs[k])
+                self._index[device_id] = start + offset
+            self.version += 1
+            return skipped
+
+    def remove_many(self, device_ids: list[str]) -> list[int]:
+        """
+        まとめて削除し、見つからなかった要素の位置を返す
+
+        1 件ずつの入れ替えではなく残す行だけを前に詰めるため、残った行の順序は変わらない。
+        """
+        with self.lock:
+            n = len(self.ids)
+            removed = np.zeros(n, dtype=np.bool_)
+            missing: list[int] = []
+            for k, device_id in enumerate(device_ids):
+                i = self._index.pop(device_id, None)
+                if i is None:
+                    missing.append(k)
+                    continue
+                removed[i] = True
+                self.labels.release(int(self._label_id[i]))
+            if not removed.any():
+                return missing
+
+            kept = np.flatnonzero(~removed)
+            for name in self._COLUMNS:
+                column = getattr(self, name)
+                column[: len(kept)] = column[kept]
+            rows = kept.tolist()
+            self.ids = [self.ids[i] for i in rows]
+            self.attrs = [self.attrs[i] for i in rows]
+            self._index = {device_id: i for i, device_id in enumerate(self.ids)}
+            self.version += 1
+            return missing
+
+    def rows(self, device_ids: list[str]) -> tuple[np.ndarray, list[int]]:
+        """device_id ごとの行番号と、見つからなかった要素の位置を返す"""
+        found: list[int] = []
+        missing: list[int] = []
+        for k, device_id in enumerate(device_ids):
+            i = self._index.get(device_id)
+            if i is None:
+                missing.append(k)
+            else:
+                found.append(i)
+        return np.array(found, dtype=np.intp), missing
+
+    # ------------------------------------------------------------------
+    # 値の更新（i は行番号か、rows() で得た行番号の配列）
+    # ------------------------------------------------------------------
+
+    def set_power(self, i: int | np.ndarray, watts: float | list[float]) -> None:
+        self._watts[i] = watts
+
+    def set_up(self, i: int | np.ndarray, up: bool | list[bool]) -> None:
+        self._up[i] = up
+
+    def set_auto_jitter(
+        self, i: int | np.ndarray, auto_jitter: bool | list[bool]
+    ) -> None:
+        self._auto_jitter[i] = auto_jitter
+
+    def set_model(
+        self,
+        i: int | np.ndarray,
+        model: int | list[int],
+        period: float | list[float],
+        duty: float | list[float],
+    ) -> None:
+        self._model[i] = model
+        self._period[i] = period
+        self._duty[i] = duty
+
+    def update_attrs(self, i: int, attrs: dict[str, Any]) -> None:
+        """属性を部分更新し、標準属性が変わればラベル表の番号を付け替える"""
+        with self.lock:
+            self.attrs[i].update(attrs)
+            label_id = self.labels.acquire(label_values(self.attrs[i]))
+            self.labels.release(int(self._label_id[i]))
+            self._label_id[i] = label_id
+            self.version += 1
+
+    def label_row(self, i: int) -> LabelValues:
+        return self.labels.rows[int(self._label_id[i])]  # type: ignore[return-value]
+
+    def parent_rows(self) -> np.ndarray:
+        """各行の parent_id が指すデバイスの行番号（ストアにいなければ -1）"""
+        parents = np.full(len(self.ids), -1, dtype=np.intp)
+        for i in range(len(self.ids)):
+            j = self._index.get(self.label_row(i)[4], -1)
+            if j != i:
+                parents[i] = j
+        return parents
+
+    # ------------------------------------------------------------------
+    # 全体に対する操作
+    # ------------------------------------------------------------------
+
+    def exported_watts(self) -> np.ndarray:
+        """公開する電力値（DOWN のデバイスは 0）"""
+        return np.where(self.up, self.watts, 0.0)
+
+    def up_count(self) -> int:
+        return int(np.count_nonzero(self.up))
+
+    def total_watts(self) -> float:
+        return float(self.watts[self.up].sum())
+
+    def record(self, i: int) -> dict[str, Any]:
+        """API で返す形のレコード"""
+        return {
+            "device_id": self.ids[i],
+            "power_watts": float(self._watts[i]),
+            "up": bool(self._up[i]),
+            "auto_jitter": bool(self._auto_jitter[i]),
+            "jitter_min": float(self._jitter_min[i]),
+            "jitter_max": float(self._jitter_max[i]),
+            "model": MODELS[self._model[i]],
+            "period": float(self._period[i]),
+            "duty": float(self._duty[i]),
+            "phase": float(self._phase[i]),
+            "attrs": self.attrs[i],
+        }
+
+    def get(self, device_id: str) -> dict[str, Any] | None:
+        i = self._index.get(device_id)
+        return None if i is None else self.record(i)
+
+    def records(self) -> list[dict[str, Any]]:
+        with self.lock:
+            return [self.record(i) for i in range(len(self.ids))]
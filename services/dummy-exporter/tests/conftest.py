@@ -0,0 +1,14 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import src.main as dummy
+
+
+@pytest.fixture
+def client():
+    """空のストアで API を呼ぶクライアント（ジッターループは動かさない）"""
+    dummy._store.remove_many(list(dummy._store.ids))
+    for device_id in list(dummy._exposition._power_prefix):
+        dummy._exposition.forget(device_id)
+    yield TestClient(dummy.app)
+    dummy._store.remove_many(list(dummy._store.ids))
@@ -0,0 +1,98 @@
+import gzip
+import json
+
+import numpy as np
+import pytest
+
+import src.main as dummy
+from src.backfill import iter_chunks, parse_labels, sample_count, store_from_records
+
+START = 1_735_689_600.0  # 2025-01-01T00:00:00Z
+
+RECORDS = [
+    {"device_id": "TAP", "model": "uniform"},
+    {"device_id": "PC", "attrs": {"parent_id": "TAP"}, "model": "daily"},
+    {"device_id": "MON", "attrs": {"parent_id": "TAP"}, "model": "duty"},
+    {"device_id": "OFF", "attrs": {"parent_id": "TAP"}, "up": False},
+]
+
+
+def _series(payload):
+    """連結した gzip メンバーを 1 つの gzip として読み、系列ごとにまとめる"""
+    series = {}
+    for line in gzip.decompress(payload).decode().splitlines():
+        row = json.loads(line)
+        key = (row["metric"]["__name__"], row["metric"]["device_id"])
+        values, timestamps = series.setdefault(key, ([], []))
+        values += row["values"]
+        timestamps += row["timestamps"]
+    return series
+
+
+def test_chunks_cover_the_period_and_parents_sum_their_children():
+    store = store_from_records(RECORDS, np.random.default_rng(0))
+    chunks = list(
+        iter_chunks(
+            store,
+            START,
+            START + 3600,
+            60,
+            extra_labels={"job": "dummy-exporter"},
+            rng=np.random.default_rng(0),
+            chunk_samples=4 * 25,  # 25 時刻ずつ
+        )
+    )
+    assert len(chunks) == 3
+
+    series = _series(b"".join(chunks))
+    assert len(series) == 8
+    expected = [int((START + 60 * k) * 1000) for k in range(60)]
+    for values, timestamps in series.values():
+        assert timestamps == expected
+        assert len(values) == 60
+
+    power = {d: series["switchbot_power_watts", d][0] for d in ("TAP", "PC", "MON")}
+    np.testing.assert_allclose(
+        power["TAP"], np.add(power["PC"], power["MON"]), atol=0.011
+    )
+    # DOWN のデバイスは 0 で、UP/DOWN も期間中変わらない
+    assert set(series["switchbot_power_watts", "OFF"][0]) == {0.0}
+    assert set(series["switchbot_device_up", "OFF"][0]) == {0}
+    assert set(series["switchbot_device_up", "PC"][0]) == {1}
+
+
+def test_extra_labels_are_added_to_every_series():
+    store = store_from_records(RECORDS[:1])
+    payload = b"".join(
+        iter_chunks(store, START, START + 60, 60, parse_labels(["job=dummy"]))
+    )
+
+    metrics = [json.loads(line)["metric"] for line in gzip.decompress(payload).split()]
+    assert all(m["job"] == "dummy" for m in metrics)
+    assert metrics[0]["parent_id"] == "none"
+
+
+def test_unknown_model_is_rejected_with_the_device_id():
+    with pytest.raises(ValueError, match="TAP: unknown model 'fridge'"):
+        store_from_records([{"device_id": "TAP", "model": "fridge"}])
+
+
+def test_sample_count():
+    assert sample_count(10, 0, 3600, 60) == 2 * 10 * 60
+    assert sample_count(10, 0, 3601, 60) == 2 * 10 * 61
+
+
+def test_endpoint_streams_gzip_and_rejects_oversized_requests(client, monkeypatch):
+    client.post("/bulk/devices", json=RECORDS)
+
+    response = client.get(
+        "/backfill", params={"start": START, "end": START + 600, "step": 60}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    assert len(_series(response.content)) == 8
+
+    monkeypatch.setattr(dummy, "BACKFILL_MAX_SAMPLES", 1000)
+    response = client.get("/backfill", params={"days": 1, "step": 60})
+    assert response.status_code == 400
+    assert "too many samples" in response.json()["detail"]
@@ -0,0 +1,166 @@
+import asyncio
+import json
+
+from pydantic import BaseModel
+from starlette.requests import Request
+
+import src.main as dummy
+from src.bulk import BulkResult, iter_batches
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+class _Entry(BaseModel):
+    device_id: str
+    watts: float = 0.0
+
+
+def _request(chunks, content_type="application/x-ndjson"):
+    """本文を chunks の区切りのまま受信するリクエスト"""
+    messages = [
+        {"type": "http.request", "body": c, "more_body": k + 1 < len(chunks)}
+        for k, c in enumerate(chunks)
+    ]
+
+    async def receive():
+        return messages.pop(0)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "headers": [(b"content-type", content_type.encode())],
+    }
+    return Request(scope, receive)
+
+
+def _collect(chunks, batch_size=2):
+    async def run():
+        result = BulkResult()
+        batches = [
+            b async for b in iter_batches(_request(chunks), _Entry, result, batch_size)
+        ]
+        return batches, result
+
+    return asyncio.run(run())
+
+
+def _ndjson(*entries):
+    return "".join(json.dumps(e) + "\n" for e in entries)
+
+
+def test_ndjson_lines_split_across_chunks():
+    body = _ndjson(*({"device_id": f"D{k}", "watts": k} for k in range(5))).encode()
+    # 行の途中・改行の直前直後で区切る
+    chunks = [body[:7], body[7:20], body[20:21], body[21:58], body[58:]]
+
+    batches, result = _collect(chunks)
+
+    assert [len(b.items) for b in batches] == [2, 2, 1]
+    items = [item for b in batches for item in b.items]
+    assert [item.device_id for item in items] == [f"D{k}" for k in range(5)]
+    assert [p for b in batches for p in b.positions] == [0, 1, 2, 3, 4]
+    assert result.failed == 0
+
+
+def test_trailing_line_without_newline_is_read():
+    body = _ndjson({"device_id": "A"}) + json.dumps({"device_id": "B"})
+
+    batches, result = _collect([body.encode()[:20], body.encode()[20:]])
+
+    assert [item.device_id for b in batches for item in b.items] == ["A", "B"]
+    assert result.failed == 0
+
+
+def test_invalid_lines_are_reported_at_their_position():
+    body = (
+        _ndjson({"device_id": "A"})
+        + "{not json\n"
+        + "\n"  # 空行は数えない
+        + _ndjson({"watts": 1.0}, {"device_id": "B"})
+        + "[1"
+    )
+
+    batches, result = _collect([body.encode()])
+
+    assert [p for b in batches for p in b.positions] == [0, 3]
+    errors = result.to_dict()["errors"]
+    assert [e["index"] for e in errors] == [1, 2, 4]
+    assert errors[0]["reason"].startswith("invalid JSON")
+    assert errors[1]["reason"].startswith("device_id")
+
+
+def test_bulk_add_skips_invalid_and_duplicated_devices(client):
+    client.post("/devices", json={"device_id": "OLD"})
+    body = _ndjson(
+        {"device_id": "A", "power_watts": 10},
+        {"device_id": "OLD"},
+        {"device_id": "A"},
+        {"device_id": "B", "jitter_min": 50, "jitter_max": 10},
+        {"device_id": "C", "model": "nope"},
+        {"device_id": "D", "up": False},
+    )
+
+    response = client.post("/bulk/devices", content=body, headers=NDJSON).json()
+
+    assert response["applied"] == 2
+    assert response["failed"] == 4
+    assert [(e["index"], e["reason"]) for e in response["errors"][:3]] == [
+        (1, "already exists"),
+        (2, "already exists"),
+        (3, "jitter_max must be >= jitter_min"),
+    ]
+    assert response["errors"][3]["index"] == 4
+    assert sorted(dummy._store.ids) == ["A", "D", "OLD"]
+    assert dummy._store.get("D")["up"] is False
+
+
+def test_bulk_body_must_be_a_json_array(client):
+    assert client.post("/bulk/devices", content="{").status_code == 400
+    assert client.post("/bulk/devices", json={"device_id": "A"}).status_code == 422
+
+
+def test_bulk_power_with_a_duplicated_id_applies_the_last_value(client):
+    client.post("/bulk/devices", json=[{"device_id": "A"}, {"device_id": "B"}])
+
+    response = client.put(
+        "/bulk/devices/power",
+        json=[
+            {"device_id": "A", "watts": 1.0},
+            {"device_id": "X", "watts": 2.0},
+            {"device_id": "A", "watts": 3.0, "auto_jitter": False},
+        ],
+    ).json()
+
+    assert response["applied"] == 2
+    assert response["errors"] == [{"index": 1, "device_id": "X", "reason": "not found"}]
+    record = dummy._store.get("A")
+    assert record["power_watts"] == 3.0 and record["auto_jitter"] is False
+
+
+def test_bulk_delete_forgets_only_removed_devices(client, monkeypatch):
+    client.post("/bulk/devices", json=[{"device_id": "A"}, {"device_id": "B"}])
+    forgotten = []
+    monkeypatch.setattr(dummy, "_remove_metrics", forgotten.append)
+
+    response = client.post(
+        "/bulk/devices/delete",
+        json=[{"device_id": "A"}, {"device_id": "X"}, {"device_id": "A"}],
+    ).json()
+
+    assert response["applied"] == 1
+    assert [e["index"] for e in response["errors"]] == [1, 2]
+    assert forgotten == ["A"]
+    assert dummy._store.ids == ["B"]
+
+
+def test_bulk_attrs_relabels_the_exported_series(client):
+    client.post("/bulk/devices", json=[{"device_id": "A", "attrs": {"room": "work"}}])
+    assert 'room="work"' in client.get("/metrics").text
+
+    response = client.patch(
+        "/bulk/devices/attrs", json=[{"device_id": "A", "attrs": {"room": "bed"}}]
+    ).json()
+
+    assert response["applied"] == 1
+    metrics = client.get("/metrics").text
+    assert 'room="bed"' in metrics and 'room="work"' not in metrics
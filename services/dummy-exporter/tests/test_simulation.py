@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+from src.simulation import DAILY, DUTY, SPIKE, UNIFORM, WALK, Simulator
+from src.store import DeviceStore
+
+
+def _store(*devices):
+    """(device_id, parent_id, model, watts) の組からストアを作る"""
+    store = DeviceStore()
+    for device_id, parent_id, model, watts in devices:
+        store.add(
+            device_id,
+            {"parent_id": parent_id},
+            watts,
+            True,
+            True,
+            10.0,
+            110.0,
+            model=model,
+            phase=0.25,
+            period=600.0,
+            duty=0.2,
+        )
+    return store
+
+
+def _simulator(store, **kwargs):
+    return Simulator(store, np.random.default_rng(0), utc_offset=0.0, **kwargs)
+
+
+def _row(store, values, device_id):
+    return values[store.index(device_id)]
+
+
+def test_models_stay_within_the_jitter_range():
+    store = _store(
+        *((f"D{m}", "none", m, 60.0) for m in (UNIFORM, DAILY, DUTY, WALK, SPIKE))
+    )
+    values = _simulator(store, parent_sum=False).run(np.arange(0.0, 86400.0, 60.0))
+
+    assert values.min() >= 10.0 and values.max() <= 110.0
+    assert store.watts.tolist() == values[:, -1].tolist()
+
+
+def test_daily_peaks_at_its_phase():
+    store = _store(("D", "none", DAILY, 60.0))
+    times = np.arange(0.0, 86400.0, 3600.0)
+    values = _simulator(store).run(times)[0]
+
+    # phase=0.25 なので 6 時が最大、18 時が最小
+    assert times[values.argmax()] == 6 * 3600
+    assert times[values.argmin()] == 18 * 3600
+
+
+def test_duty_is_on_for_its_share_of_the_period():
+    store = _store(("D", "none", DUTY, 60.0))
+    values = _simulator(store).run(np.arange(0.0, 6000.0, 1.0))[0]
+
+    assert np.mean(values > 60.0) == pytest.approx(0.2, abs=0.01)
+
+
+def test_walk_and_spike_continue_from_the_current_value():
+    store = _store(("W", "none", WALK, 110.0), ("S", "none", SPIKE, 110.0))
+    sim = _simulator(store)
+    sim.step(0.0)  # 最初のティックは dt=0 なので値は変わらない
+
+    assert store.watts.tolist() == [110.0, 110.0]
+
+    values = sim.run(np.array([1.0, 2.0]))
+    # ランダムウォークは 1 秒で範囲の幅 / sqrt(period) 程度しか動かない
+    assert abs(_row(store, values, "W")[0] - 110.0) < 100.0 / np.sqrt(600.0) * 5
+    # スパイクは tau = duty × period で減衰する
+    tau = 0.2 * 600.0
+    assert _row(store, values, "S")[0] == pytest.approx(
+        10.0 + 100.0 * np.exp(-1.0 / tau), abs=0.01
+    )
+
+
+def test_same_seed_gives_the_same_series():
+    def run():
+        store = _store(("W", "none", WALK, 50.0), ("U", "none", UNIFORM, 50.0))
+        return _simulator(store).run(np.arange(0.0, 600.0, 10.0))
+
+    np.testing.assert_array_equal(run(), run())
+
+
+def test_parent_is_the_sum_of_its_children_across_levels():
+    # HOUSE ── TAP ── PC
+    #      │      └─ MON
+    #      └─ LAMP
+    store = _store(
+        ("PC", "TAP", UNIFORM, 0.0),
+        ("HOUSE", "none", UNIFORM, 0.0),
+        ("MON", "TAP", DAILY, 0.0),
+        ("TAP", "HOUSE", UNIFORM, 0.0),
+        ("LAMP", "HOUSE", DUTY, 0.0),
+    )
+    values = _simulator(store).run(np.arange(0.0, 3600.0, 60.0))
+
+    def row(device_id):
+        return _row(store, values, device_id)
+
+    np.testing.assert_allclose(row("TAP"), row("PC") + row("MON"), atol=0.011)
+    np.testing.assert_allclose(row("HOUSE"), row("TAP") + row("LAMP"), atol=0.011)
+
+
+def test_down_children_count_as_zero():
+    store = _store(
+        ("TAP", "none", UNIFORM, 0.0),
+        ("PC", "TAP", UNIFORM, 50.0),
+        ("MON", "TAP", UNIFORM, 50.0),
+    )
+    store.set_up(store.index("MON"), False)
+    sim = _simulator(store)
+    sim.step(0.0)
+
+    assert store.watts[store.index("TAP")] == store.watts[store.index("PC")]
+
+    # 親子関係の変更（version の更新）で集計の計画を作り直す
+    store.update_attrs(store.index("MON"), {"parent_id": "none"})
+    store.set_up(store.index("MON"), True)
+    store.set_up(store.index("PC"), False)
+    sim.step(1.0)
+    assert store.watts[store.index("TAP")] == 0.0
+
+
+def test_parent_cycles_are_not_summed():
+    store = _store(
+        ("A", "B", UNIFORM, 0.0),
+        ("B", "A", UNIFORM, 0.0),
+        ("ROOT", "none", UNIFORM, 0.0),
+        ("LEAF", "ROOT", UNIFORM, 0.0),
+    )
+    values = _simulator(store).run(np.arange(0.0, 600.0, 60.0))
+
+    np.testing.assert_array_equal(
+        _row(store, values, "ROOT"), _row(store, values, "LEAF")
+    )
+    # 循環した A / B はそれぞれ自分の負荷モデルのまま
+    assert not np.array_equal(_row(store, values, "A"), _row(store, values, "B"))
+    assert values.min() >= 10.0
+
+
+def test_manual_devices_keep_their_value():
+    store = _store(("M", "none", UNIFORM, 42.0))
+    store.set_auto_jitter(0, False)
+    sim = _simulator(store)
+
+    assert sim.step(0.0) == 0
+    assert store.watts[0] == 42.0
@@ -0,0 +1,196 @@
+import numpy as np
+import pytest
+from src.store import DeviceStore
+
+
+def _attrs(room="work", shelf="rack", name="plug", parent_id="none"):
+    return {
+        "room": room,
+        "shelf": shelf,
+        "device": "pc",
+        "name": name,
+        "parent_id": parent_id,
+    }
+
+
+def _add(store, device_id, watts=10.0, **attrs):
+    return store.add(device_id, _attrs(**attrs), watts, True, True, 5.0, 100.0)
+
+
+def _add_many(store, device_ids, **columns):
+    n = len(device_ids)
+    return store.add_many(
+        device_ids=device_ids,
+        attrs=[_attrs(name=d) for d in device_ids],
+        power_watts=columns.get("power_watts", [float(k) for k in range(n)]),
+        up=[True] * n,
+        auto_jitter=[True] * n,
+        jitter_min=[5.0] * n,
+        jitter_max=[100.0] * n,
+    )
+
+
+def _assert_consistent(store):
+    """索引・行・列の長さが食い違っていないこと"""
+    assert len(store.ids) == len(store.attrs) == len(store.watts)
+    assert {d: store.index(d) for d in store.ids} == {
+        d: i for i, d in enumerate(store.ids)
+    }
+    for i, device_id in enumerate(store.ids):
+        assert store.label_row(i)[3] == store.attrs[i]["name"]
+        assert store.record(i)["device_id"] == device_id
+
+
+def test_remove_moves_the_last_row_into_the_gap():
+    store = DeviceStore(capacity=2)
+    for k, device_id in enumerate(["A", "B", "C", "D"]):
+        _add(store, device_id, watts=float(k), name=device_id)
+
+    record = store.remove("B")
+
+    assert record["device_id"] == "B" and record["power_watts"] == 1.0
+    assert store.ids == ["A", "D", "C"]
+    assert store.index("D") == 1
+    assert store.get("D")["power_watts"] == 3.0
+    assert "B" not in store
+    _assert_consistent(store)
+
+    # 末尾の行の削除は入れ替えなし
+    store.remove("C")
+    assert store.ids == ["A", "D"]
+    with pytest.raises(KeyError):
+        store.remove("C")
+    _assert_consistent(store)
+
+
+def test_add_rejects_an_existing_id():
+    store = DeviceStore()
+    _add(store, "A")
+    version = store.version
+
+    with pytest.raises(KeyError):
+        _add(store, "A")
+    assert len(store) == 1 and store.version == version
+
+
+def test_add_many_reports_existing_and_duplicated_positions():
+    store = DeviceStore(capacity=1)
+    _add(store, "A", name="A")
+
+    skipped = _add_many(store, ["B", "A", "C", "B", "D"])
+
+    assert skipped == [1, 3]
+    assert store.ids == ["A", "B", "C", "D"]
+    # 列の値は追加した要素の位置のもの
+    assert store.get("C")["power_watts"] == 2.0
+    assert store.get("D")["power_watts"] == 4.0
+    assert store.get("D")["model"] == "uniform"
+    _assert_consistent(store)
+
+
+def test_remove_many_compacts_rows_in_order():
+    store = DeviceStore()
+    _add_many(store, ["A", "B", "C", "D", "E"])
+
+    missing = store.remove_many(["B", "X", "D", "B"])
+
+    assert missing == [1, 3]
+    assert store.ids == ["A", "C", "E"]
+    assert store.watts.tolist() == [0.0, 2.0, 4.0]
+    _assert_consistent(store)
+
+    # 削除後に追加しても行がずれない
+    _add(store, "F", watts=9.0, name="F")
+    assert store.get("F")["power_watts"] == 9.0
+    _assert_consistent(store)
+
+
+def test_rows_returns_found_rows_and_missing_positions():
+    store = DeviceStore()
+    _add_many(store, ["A", "B", "C"])
+
+    rows, missing = store.rows(["C", "X", "A"])
+
+    assert rows.tolist() == [2, 0]
+    assert missing == [1]
+    store.set_power(rows, [20.0, 30.0])
+    assert store.watts.tolist() == [30.0, 1.0, 20.0]
+
+
+def test_update_attrs_relabels_and_bumps_version():
+    store = DeviceStore()
+    _add(store, "A", room="work")
+    _add(store, "B", room="work")
+    version = store.version
+
+    store.update_attrs(store.index("A"), {"room": "bedroom", "color": "white"})
+
+    assert store.label_row(store.index("A"))[0] == "bedroom"
+    assert store.label_row(store.index("B"))[0] == "work"
+    assert store.attrs[store.index("A")]["color"] == "white"
+    assert store.version > version
+
+    # ラベルに関係ない属性だけの変更でも同じ番号を使い続ける
+    label_id = int(store.label_id[store.index("A")])
+    store.update_attrs(store.index("A"), {"color": "black"})
+    assert int(store.label_id[store.index("A")]) == label_id
+    assert len(store.labels) == 2
+
+
+def test_label_table_shares_and_releases_rows():
+    store = DeviceStore()
+    _add(store, "A")
+    _add(store, "B")
+    _add(store, "C", room="bedroom")
+
+    assert len(store.labels) == 2
+    assert store.label_id[0] == store.label_id[1]
+
+    store.remove("A")
+    assert len(store.labels) == 2  # B がまだ使っている
+    store.remove_many(["B", "C"])
+    assert len(store.labels) == 0
+
+    # 解放した番号は使い回す
+    _add(store, "D", room="garage")
+    assert len(store.labels) == 1
+    assert int(store.label_id[0]) in (0, 1)
+    assert store.label_row(0)[0] == "garage"
+
+
+def test_relabel_to_an_existing_label_releases_the_old_one():
+    store = DeviceStore()
+    _add(store, "A", room="work")
+    _add(store, "B", room="bedroom")
+
+    store.update_attrs(store.index("B"), {"room": "work"})
+
+    assert len(store.labels) == 1
+    assert store.label_id[0] == store.label_id[1]
+
+
+def test_parent_rows_follow_swaps_and_ignore_self_references():
+    store = DeviceStore()
+    _add(store, "TAP")
+    _add(store, "PC", parent_id="TAP")
+    _add(store, "SELF", parent_id="SELF")
+    _add(store, "ORPHAN", parent_id="GONE")
+
+    assert store.parent_rows().tolist() == [-1, 0, -1, -1]
+
+    # TAP を消すと末尾の ORPHAN が行 0 に入る
+    store.remove("TAP")
+    _add(store, "TAP")
+    parents = store.parent_rows()
+    assert parents[store.index("PC")] == store.index("TAP")
+    assert np.count_nonzero(parents >= 0) == 1
+
+
+def test_exported_watts_and_totals_ignore_down_devices():
+    store = DeviceStore()
+    _add_many(store, ["A", "B", "C"], power_watts=[10.0, 20.0, 30.0])
+    store.set_up(store.index("B"), False)
+
+    assert store.exported_watts().tolist() == [10.0, 0.0, 30.0]
+    assert store.up_count() == 2
+    assert store.total_watts() == 40.0
@@ -0,0 +1,230 @@
+"""
+収集サイクルの負荷ベンチマーク
+
+偽の SwitchBot API（benchmarks/fake_switchbot.py）を別プロセスで起動し、
+デバイス数を変えながら collect_metrics を繰り返し実行する。
+デバイス数ごとにサイクル時間のパーセンタイル・CPU 時間・最大メモリ使用量・
+/metrics の描画時間を計測し、JSON に書き出す。
+
+使い方:
+    cd services/exporter
+    python benchmarks/bench_collect.py                          # 10〜5,000 台
+    python benchmarks/bench_collect.py --devices 10 100 --cycles 5 --latency-ms 50
+    python benchmarks/bench_collect.py -o after.json --compare before.json
+    python benchmarks/bench_collect.py --devices 1000 --remaining 500   # 途中で 429 になる
+
+--compare を指定すると、前回の結果（別コミットで取得した JSON）との比を表示する。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from fake_switchbot import FakeApiConfig, run_server
+
+DEFAULT_SIZES = [10, 100, 1000, 5000]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(q / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _devices(count: int) -> List[Dict[str, str]]:
+    # デバイス数を増やすと前のサイズの系列を包含するよう ID を固定する
+    return [
+        {
+            "id": f"BENCH{i:07d}",
+            "name": f"plug_{i}",
+            "device": "bench",
+            "room": f"room_{i % 8}",
+            "shelf": f"shelf_{i % 32}",
+            "parent_id": "none",
+        }
+        for i in range(count)
+    ]
+
+
+async def bench_size(main, count: int, cycles: int, concurrency: int) -> dict:
+    from prometheus_client import REGISTRY, generate_latest
+
+    devices = _devices(count)
+    pool = main.FetchPool(concurrency=concurrency, cycle_deadline=None)
+    client = main.build_client_from_env(concurrency)
+    latencies: List[float] = []
+    failures = 0
+    cpu_start = time.process_time()
+    try:
+        await main.collect_metrics(devices, pool, client)  # ウォームアップ（接続確立）
+        cpu_start = time.process_time()
+        for _ in range(cycles):
+            start = time.perf_counter()
+            results = await main.collect_metrics(devices, pool, client)
+            latencies.append(time.perf_counter() - start)
+            failures += sum(1 for r in results if not r.ok) + count - len(results)
+    finally:
+        await client.aclose()
+    cpu = time.process_time() - cpu_start
+
+    renders = []
+    for _ in range(5):
+        start = time.perf_counter()
+        body = generate_latest(REGISTRY)
+        renders.append(time.perf_counter() - start)
+
+    return {
+        "devices": count,
+        "cycles": cycles,
+        "cycle_seconds": {
+            "p50": _percentile(latencies, 50),
+            "p90": _percentile(latencies, 90),
+            "p99": _percentile(latencies, 99),
+            "max": max(latencies),
+        },
+        "cpu_seconds_per_cycle": cpu / cycles,
+        "cpu_us_per_device": cpu / cycles / count * 1e6,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "metrics_render_ms": statistics.median(renders) * 1000,
+        "metrics_bytes": len(body),
+        "failed_fetches": failures,
+    }
+
+
+def _print_result(r: dict) -> None:
+    c = r["cycle_seconds"]
+    print(
+        f"  {r['devices']:>6} devices: cycle p50={c['p50'] * 1000:8.1f}ms "
+        f"p99={c['p99'] * 1000:8.1f}ms  cpu={r['cpu_us_per_device']:7.1f}µs/device  "
+        f"rss={r['max_rss_mb']:6.1f}MB  /metrics={r['metrics_render_ms']:7.2f}ms "
+        f"failed={r['failed_fetches']}"
+    )
+
+
+def _compare(current: dict, baseline_path: str) -> None:
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    before = {r["devices"]: r for r in baseline["results"]}
+    print(f"\nCompared with {baseline_path} ({baseline.get('revision', '?')}):")
+    for r in current["results"]:
+        old = before.get(r["devices"])
+        if old is None:
+            continue
+        ratios = {
+            "cycle p50": r["cycle_seconds"]["p50"] / old["cycle_seconds"]["p50"],
+            "cpu": r["cpu_seconds_per_cycle"] / old["cpu_seconds_per_cycle"],
+            "/metrics": r["metrics_render_ms"] / old["metrics_render_ms"],
+        }
+        summary = "  ".join(f"{k} x{v:.2f}" for k, v in ratios.items())
+        print(f"  {r['devices']:>6} devices: {summary}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--devices", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--cycles", type=int, default=5, help="サイズごとの回数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--daily-limit", type=int, default=10_000_000)
+    parser.add_argument(
+        "--remaining",
+        type=int,
+        help="レート制限の残り回数の初期値（既定は --daily-limit）",
+    )
+    parser.add_argument("-o", "--output", default="bench_collect.json")
+    parser.add_argument("--compare", help="比較する前回の結果 JSON")
+    args = parser.parse_args()
+
+    config = FakeApiConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        daily_limit=args.daily_limit,
+        remaining=args.remaining,
+        seed=0,
+    )
+    port = _free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(
+        target=run_server, args=("127.0.0.1", port, config, ready), daemon=True
+    )
+    server.start()
+    if not ready.wait(10):
+        sys.exit("fake SwitchBot API did not start")
+
+    # src.main は import 時に API の接続先を読むため、環境変数を先に設定する
+    os.environ["SWITCHBOT_API_BASE"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("SWITCHBOT_TOKEN", "bench-token")
+    os.environ.setdefault("SWITCHBOT_SECRET", "bench-secret")
+    os.environ.setdefault("HTTP_KEEPALIVE_EXPIRY", "120")
+    logging.disable(logging.CRITICAL)
+    from src import main as exporter
+
+    print(
+        f"Collect benchmark (latency={args.latency_ms}ms±{args.jitter_ms}ms, "
+        f"error_rate={args.error_rate}, concurrency={args.concurrency}, "
+        f"remaining={config.daily_limit if args.remaining is None else args.remaining})"
+    )
+    results = []
+    try:
+        for count in sorted(args.devices):
+            result = asyncio.run(
+                bench_size(exporter, count, args.cycles, args.concurrency)
+            )
+            _print_result(result)
+            results.append(result)
+    finally:
+        server.terminate()
+        server.join()
+
+    report = {
+        "revision": _git_revision(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.output}")
+    if args.compare:
+        _compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+署名ヘッダー生成のマイクロベンチマーク
+
+使い方:
+    cd services/exporter
+    python benchmarks/bench_signer.py            # 各方式 20,000 回
+    python benchmarks/bench_signer.py -n 100000
+
+比較する方式:
+    legacy   : 署名ごとに hmac.new() で鍵設定し、ヘッダー dict を組み立てる（旧実装）
+    signer   : SwitchBotSigner.headers()（鍵設定済み HMAC を copy）
+    per_tick : SwitchBotSigner(reuse_window>0).headers()（バッチ内で署名を使い回す）
+
+効果があるのは per_tick（署名そのものを省く）。鍵設定の事前計算（signer）で減るのは
+署名 1 回あたり 1 µs 未満で、ヘッダー生成全体では計測誤差に埋もれる程度なので、
+倍率ではなく署名 1 回あたりの差（µs）で示す。各方式とも 3 回測って最速の値を使う。
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.signer import SwitchBotSigner
+
+TOKEN = "x" * 96
+SECRET = "y" * 32
+
+
+def legacy_headers(token: str, secret: str) -> dict:
+    nonce = str(uuid.uuid4())
+    t = str(int(time.time() * 1000))
+    sign = base64.b64encode(
+        hmac.new(
+            secret.encode(), f"{token}{t}{nonce}".encode(), hashlib.sha256
+        ).digest()
+    ).upper()
+    return {
+        "Authorization": token,
+        "sign": str(sign, "utf-8"),
+        "nonce": nonce,
+        "t": t,
+        "Content-Type": "application/json; charset=utf8",
+    }
+
+
+def measure(fn, n: int, repeat: int = 3) -> float:
+    """fn を n 回呼ぶのにかかった秒数（repeat 回のうち最速）"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(n):
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(label: str, fn, n: int) -> float:
+    elapsed = measure(fn, n)
+    rate = n / elapsed
+    print(f"  {label:<9}: {rate:>12,.0f} headers/s  ({elapsed / n * 1e6:6.2f} µs/op)")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-n", type=int, default=20000, help="1 方式あたりの試行回数")
+    args = parser.parse_args()
+
+    signer = SwitchBotSigner(TOKEN, SECRET)
+    per_tick = SwitchBotSigner(TOKEN, SECRET, reuse_window=1.0)
+
+    # 署名結果が旧実装と一致することを確認
+    t, nonce = "1700000000000", "00000000-0000-0000-0000-000000000000"
+    expected = base64.b64encode(
+        hmac.new(
+            SECRET.encode(), f"{TOKEN}{t}{nonce}".encode(), hashlib.sha256
+        ).digest()
+    ).upper()
+    assert signer.sign(t, nonce)[0] == str(expected, "utf-8")
+
+    print(f"Signature benchmark (n={args.n:,}, best of 3)")
+    legacy = bench("legacy", lambda: legacy_headers(TOKEN, SECRET), args.n)
+    bench("signer", signer.headers, args.n)
+    ticked = bench("per_tick", per_tick.headers, args.n)
+
+    # 鍵設定の事前計算だけの差（HMAC の計算部分のみ）
+    key, message = SECRET.encode(), f"{TOKEN}{t}{nonce}".encode()
+    keyed = hmac.new(key, digestmod=hashlib.sha256)
+
+    def copy_sign() -> bytes:
+        mac = keyed.copy()
+        mac.update(message)
+        return mac.digest()
+
+    fresh = measure(lambda: hmac.new(key, message, hashlib.sha256).digest(), args.n)
+    copied = measure(copy_sign, args.n)
+    saved = (fresh - copied) / args.n * 1e6
+    print(
+        f"\n  per-sign HMAC: hmac.new {fresh / args.n * 1e6:.2f} µs, "
+        f"pre-keyed copy {copied / args.n * 1e6:.2f} µs ({saved:+.2f} µs saved)"
+    )
+    print(f"  per_tick speedup vs legacy: x{ticked / legacy:.2f}")
+
+
+if __name__ == "__main__":
+    main()
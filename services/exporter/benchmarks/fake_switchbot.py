@@ -0,0 +1,149 @@
+"""
+ローカルで動く SwitchBot API の代役
+
+`GET /v1.1/devices/{id}/status` にプラグミニ形式のレスポンスを返す。
+応答遅延・エラー率・レート制限ヘッダーを指定でき、ベンチマークや
+exporter のローカル検証（SWITCHBOT_API_BASE をこのサーバーに向ける）に使う。
+
+使い方:
+    cd services/exporter
+    python benchmarks/fake_switchbot.py --port 9000 --latency-ms 50 --error-rate 0.01
+    SWITCHBOT_API_BASE=http://127.0.0.1:9000 SWITCHBOT_TOKEN=x SWITCHBOT_SECRET=y \\
+        python -m src.main
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import random
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class FakeApiConfig:
+    latency_ms: float = 20.0
+    jitter_ms: float = 5.0
+    error_rate: float = 0.0  # HTTP 500 を返す割合
+    daily_limit: int = 10_000_000  # 0 になると 429 を返す
+    remaining: Optional[int] = None  # 残り回数の初期値（None なら daily_limit）
+    seed: Optional[int] = None
+
+
+def _next_utc_midnight_ms() -> int:
+    now = datetime.datetime.now(datetime.timezone.utc)
+    midnight = (now + datetime.timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return int(midnight.timestamp() * 1000)
+
+
+class FakeSwitchBotApi:
+    """keep-alive 対応の最小限の HTTP/1.1 サーバー"""
+
+    def __init__(self, config: FakeApiConfig) -> None:
+        self.config = config
+        self.remaining = (
+            config.daily_limit if config.remaining is None else config.remaining
+        )
+        self.requests = 0
+        self._random = random.Random(config.seed)
+
+    def _response(self, status: int, body: dict) -> bytes:
+        payload = json.dumps(body).encode()
+        reason = {200: "OK", 404: "Not Found", 429: "Too Many Requests"}.get(
+            status, "Internal Server Error"
+        )
+        head = (
+            f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"x-ratelimit-remaining: {max(self.remaining, 0)}\r\n"
+            f"x-ratelimit-reset: {_next_utc_midnight_ms()}\r\n"
+            "\r\n"
+        )
+        return head.encode() + payload
+
+    def _handle_request(self, path: str) -> bytes:
+        self.requests += 1
+        if self.remaining <= 0:
+            return self._response(429, {"message": "Unauthorized"})
+        self.remaining -= 1
+
+        parts = path.strip("/").split("/")
+        if len(parts) != 4 or parts[:2] != ["v1.1", "devices"] or parts[3] != "status":
+            return self._response(404, {"message": "not found"})
+        if self._random.random() < self.config.error_rate:
+            return self._response(500, {"message": "internal error"})
+        body = {
+            "statusCode": 100,
+            "message": "success",
+            "body": {
+                "deviceId": parts[2],
+                "deviceType": "Plug Mini (JP)",
+                "power": "on",
+                "voltage": 100.0,
+                "weight": round(self._random.uniform(0.0, 120.0), 1),
+                "electricityOfDay": 0,
+                "electricCurrent": 0.0,
+            },
+        }
+        return self._response(200, body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                _, path, _ = head.split(b"\r\n", 1)[0].decode().split(" ", 2)
+                delay = self.config.latency_ms + self._random.uniform(
+                    -self.config.jitter_ms, self.config.jitter_ms
+                )
+                await asyncio.sleep(max(delay, 0.0) / 1000.0)
+                writer.write(self._handle_request(path))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int, ready=None) -> None:
+        server = await asyncio.start_server(self.handle, host, port, backlog=1024)
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def run_server(host: str, port: int, config: FakeApiConfig, ready=None) -> None:
+    """別プロセスから起動するためのエントリポイント"""
+    try:
+        asyncio.run(FakeSwitchBotApi(config).serve(host, port, ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--daily-limit", type=int, default=10_000_000)
+    parser.add_argument("--remaining", type=int, help="残り回数の初期値")
+    args = parser.parse_args()
+
+    config = FakeApiConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        daily_limit=args.daily_limit,
+        remaining=args.remaining,
+    )
+    print(f"Fake SwitchBot API listening on http://{args.host}:{args.port}")
+    run_server(args.host, args.port, config)
+
+
+if __name__ == "__main__":
+    main()
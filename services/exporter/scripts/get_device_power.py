@@ -32,7 +32,7 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 import httpx
 from dotenv import load_dotenv
-from src.main import generate_sign
+from src.signer import SwitchBotSigner
 
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 # スクリプトをプロジェクトルートから実行した場合にも .env を読む
@@ -51,16 +51,9 @@ def format_reset_time(reset_ms: str) -> str:
 
 
 async def fetch_status(
-    client: httpx.AsyncClient, device_id: str, token: str, secret: str
+    client: httpx.AsyncClient, device_id: str, signer: SwitchBotSigner
 ) -> None:
-    sign, t, nonce = generate_sign(token, secret)
-    headers = {
-        "Authorization": token,
-        "sign": sign,
-        "nonce": nonce,
-        "t": t,
-        "Content-Type": "application/json; charset=utf8",
-    }
+    headers = signer.headers()
 
     url = f"https://api.switch-bot.com/v1.1/devices/{device_id}/status"
     resp = await client.get(url, headers=headers, timeout=10.0)
@@ -137,10 +130,11 @@ async def main() -> None:
 
     print(f"\nSwitchBot API から電力情報を取得します...")
 
+    signer = SwitchBotSigner(token, secret)
     async with httpx.AsyncClient() as client:
         for device_id in device_ids:
             try:
-                await fetch_status(client, device_id, token, secret)
+                await fetch_status(client, device_id, signer)
             except httpx.HTTPStatusError as e:
                 print(f"\n  [ERROR] HTTP {e.response.status_code}: {e.response.text}")
             except Exception as e:
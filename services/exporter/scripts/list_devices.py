@@ -30,21 +30,14 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 import httpx
 from dotenv import load_dotenv
-from src.main import generate_sign
+from src.signer import SwitchBotSigner
 
 # プロジェクトルートの .env も読む
 load_dotenv(os.path.join(os.path.dirname(__file__), "..", ".env"))
 
 
 async def fetch_device_list(token: str, secret: str) -> tuple[dict, dict]:
-    sign, t, nonce = generate_sign(token, secret)
-    headers = {
-        "Authorization": token,
-        "sign": sign,
-        "nonce": nonce,
-        "t": t,
-        "Content-Type": "application/json; charset=utf8",
-    }
+    headers = SwitchBotSigner(token, secret).headers()
     async with httpx.AsyncClient() as client:
         resp = await client.get(
             "https://api.switch-bot.com/v1.1/devices",
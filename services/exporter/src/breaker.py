@@ -0,0 +1,146 @@
+"""
+デバイスごとのサーキットブレーカー
+
+オフラインのプラグに毎サイクル API を呼ぶと、1 日の呼び出し上限を無駄に消費する。
+連続で failure_threshold 回失敗したデバイスはブレーカーを開き、
+指数バックオフ（ジッター付き）の間は取得をスキップする。
+クールダウンが明けたら 1 回だけ試行 (half-open) し、成功すれば閉じ、失敗すれば待ち時間を倍にして開き直す。
+試行が締め切りで打ち切られるなどして結果が返らないまま probe_timeout 秒たったら、もう一度試行する。
+
+ブレーカーが閉じている間の単発の失敗ではゲージを下げないため、
+不安定なデバイスの `switchbot_device_up` が毎サイクル上下することもない。
+"""
+
+import logging
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+
+from prometheus_client import Counter, Gauge
+
+CLOSED, OPEN, HALF_OPEN = 0, 1, 2
+
+BREAKER_STATE = Gauge(
+    "switchbot_breaker_state",
+    "Circuit breaker state per device (0: closed, 1: open, 2: half-open)",
+    ["device_id"],
+)
+
+BREAKER_SKIPPED = Counter(
+    "switchbot_breaker_skipped_total",
+    "API calls skipped because the device's circuit breaker was open",
+)
+
+
+@dataclass
+class _Breaker:
+    state: int = CLOSED
+    failures: int = 0  # 連続失敗回数
+    trips: int = 0  # 連続してブレーカーを開いた回数（バックオフの指数）
+    open_until: float = 0.0  # half-open の間は試行の結果を待つ期限
+
+
+class DeviceBreakers:
+    """デバイス ID ごとのブレーカーの集合"""
+
+    def __init__(
+        self,
+        failure_threshold: int = 3,
+        base_backoff: float = 120.0,
+        max_backoff: float = 3600.0,
+        jitter: float = 0.2,
+        probe_timeout: float = 60.0,
+        rng: Optional[random.Random] = None,
+    ) -> None:
+        self.failure_threshold = max(failure_threshold, 1)
+        self.base_backoff = base_backoff
+        self.max_backoff = max(max_backoff, base_backoff)
+        self.jitter = jitter
+        self.probe_timeout = probe_timeout
+        self._rng = rng or random.Random()
+        self._breakers: Dict[str, _Breaker] = {}
+
+    def _set_state(self, device_id: str, breaker: _Breaker, state: int) -> None:
+        breaker.state = state
+        BREAKER_STATE.labels(device_id=device_id).set(state)
+
+    def backoff(self, trips: int) -> float:
+        """trips 回目にブレーカーを開いたときの待ち時間（ジッター前）"""
+        return min(self.base_backoff * 2 ** (trips - 1), self.max_backoff)
+
+    # --- 判定 ---
+    def allow(self, device_id: str, now: Optional[float] = None) -> bool:
+        """今回取得してよいか。クールダウン明けの最初の 1 回は half-open の試行として許可する"""
+        breaker = self._breakers.get(device_id)
+        if breaker is None or breaker.state == CLOSED:
+            return True
+        now = time.time() if now is None else now
+        if now >= breaker.open_until:
+            if breaker.state == HALF_OPEN:
+                # 前回の試行は結果が返らなかった（締め切りで打ち切られたなど）
+                logging.info(f"Device {device_id}: half-open probe lost, retrying")
+            breaker.open_until = now + self.probe_timeout
+            self._set_state(device_id, breaker, HALF_OPEN)
+            return True
+        BREAKER_SKIPPED.inc()
+        return False
+
+    def filter(
+        self, devices: List[Dict[str, str]], now: Optional[float] = None
+    ) -> List[Dict[str, str]]:
+        now = time.time() if now is None else now
+        return [d for d in devices if self.allow(d["id"], now)]
+
+    def is_open(self, device_id: str) -> bool:
+        breaker = self._breakers.get(device_id)
+        return breaker is not None and breaker.state != CLOSED
+
+    # --- 結果の記録 ---
+    def record_success(self, device_id: str) -> None:
+        breaker = self._breakers.get(device_id)
+        if breaker is None:
+            return
+        if breaker.state != CLOSED:
+            logging.info(f"Device {device_id}: circuit closed")
+        del self._breakers[device_id]
+        BREAKER_STATE.labels(device_id=device_id).set(CLOSED)
+
+    def record_failure(self, device_id: str, now: Optional[float] = None) -> bool:
+        """失敗を記録する。ブレーカーが開いている（= デバイスを停止扱いにする）なら True"""
+        now = time.time() if now is None else now
+        breaker = self._breakers.setdefault(device_id, _Breaker())
+        breaker.failures += 1
+        if breaker.state == CLOSED and breaker.failures < self.failure_threshold:
+            return False
+
+        breaker.trips += 1
+        wait = self.backoff(breaker.trips)
+        wait *= self._rng.uniform(1 - self.jitter, 1 + self.jitter)
+        breaker.open_until = now + wait
+        self._set_state(device_id, breaker, OPEN)
+        logging.warning(
+            f"Device {device_id}: circuit open for {wait:.0f}s "
+            f"after {breaker.failures} consecutive failures"
+        )
+        return True
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {k: asdict(v) for k, v in self._breakers.items()}
+
+    def restore(self, data: Dict[str, dict]) -> None:
+        """snapshot() の内容を取り込む（開いていたブレーカーは開いたまま再開する）"""
+        for device_id, values in data.items():
+            breaker = self._breakers[device_id] = _Breaker(**values)
+            if breaker.state == HALF_OPEN:
+                # 試行の結果は失われたので、次のサイクルでもう一度試す
+                breaker.state, breaker.open_until = OPEN, 0.0
+            BREAKER_STATE.labels(device_id=device_id).set(breaker.state)
+
+    def forget(self, device_ids: Iterable[str]) -> None:
+        for device_id in device_ids:
+            self._breakers.pop(device_id, None)
+            try:
+                BREAKER_STATE.remove(device_id)
+            except KeyError:
+                pass
@@ -0,0 +1,90 @@
+"""
+変化のないサンプルの書き込み抑制（デッドバンド + ハートビート）
+
+充電器や待機中のテレビのようなプラグは、何時間も同じ電力値を返し続ける。
+直前に書き込んだ値からの変化がデッドバンド（絶対値 / 相対値）以内なら書き込みを省き、
+heartbeat 秒ごとに 1 回だけは変化がなくても書き込む（ストレージ側で系列が途切れないように）。
+
+デッドバンドはデバイスごとの電力値（deadband_metrics）にだけ適用する。
+積算電力量のカウンターや API 残り回数は 1 サイクルの変化が W 単位の幅より小さいため、
+それ以外のメトリクスは値が変わらないときだけ省く。
+
+判定は最後に「書き込んだ」値と比べるため、小さな変化が積み重なってデッドバンドを
+超えた時点で必ず書き込まれる。
+"""
+
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+from prometheus_client import Counter
+
+from src.remote_write import Sample
+
+SUPPRESSED_SAMPLES = Counter(
+    "switchbot_suppressed_samples_total",
+    "Samples not written because the value stayed within the deadband",
+    ["metric"],
+)
+
+
+@dataclass
+class _Emitted:
+    value: float
+    timestamp: float
+
+
+SeriesKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+POWER_METRIC = "switchbot_power_watts"
+
+
+def sample_key(sample: Sample) -> SeriesKey:
+    return sample.name, tuple(sorted(sample.labels.items()))
+
+
+class ChangeDetector:
+    """系列ごとに最後に書き込んだ値を覚え、書き込むべきかを判定する"""
+
+    def __init__(
+        self,
+        abs_deadband: float = 0.0,
+        rel_deadband: float = 0.0,
+        heartbeat: float = 300.0,
+        deadband_metrics: Sequence[str] = (POWER_METRIC,),
+    ) -> None:
+        self.heartbeat = heartbeat
+        # メトリクス名 -> (絶対値の幅, 相対値の幅)。ない名前は幅 0（値が同じときだけ省く）
+        self.bands: Dict[str, Tuple[float, float]] = {
+            name: (abs_deadband, rel_deadband) for name in deadband_metrics
+        }
+        self._emitted: Dict[SeriesKey, _Emitted] = {}
+
+    def changed(self, key: SeriesKey, value: float, timestamp: float) -> bool:
+        """書き込むべきなら True を返し、書き込んだ値として記録する"""
+        last = self._emitted.get(key)
+        if last is not None and last.timestamp == timestamp:
+            return last.value == value  # 書き込み済みのサンプルを再び判定した
+        if last is not None and timestamp - last.timestamp < self.heartbeat:
+            abs_band, rel_band = self.bands.get(key[0], (0.0, 0.0))
+            band = max(abs_band, rel_band * abs(last.value))
+            if abs(value - last.value) <= band:
+                return False
+        self._emitted[key] = _Emitted(value, timestamp)
+        return True
+
+    def changed_sample(self, sample: Sample) -> bool:
+        """changed() のサンプル版。抑制したら件数を数える"""
+        if self.changed(sample_key(sample), sample.value, sample.timestamp):
+            return True
+        SUPPRESSED_SAMPLES.labels(metric=sample.name).inc()
+        return False
+
+    def filter(self, samples: Iterable[Sample]) -> List[Sample]:
+        """書き込むべきサンプルだけを残す"""
+        return [s for s in samples if self.changed_sample(s)]
+
+    def forget(self, device_id: str) -> None:
+        """デバイスに関する記録を消す（次の値は必ず書き込まれる）"""
+        label = ("device_id", device_id)
+        for key in [k for k in self._emitted if label in k[1]]:
+            del self._emitted[key]
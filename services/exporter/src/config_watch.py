@@ -0,0 +1,84 @@
+"""
+devices.json のホットリロード
+
+ファイルの stat（mtime / サイズ / inode）だけを毎サイクル確認し、変化したときだけ読み直す。
+ConfigMap のマウントはシンボリックリンクの差し替えで更新されるため、
+stat はリンク先を追って比較する。読み直した設定は旧設定との差分
+（追加 / 削除 / ラベル変更）として返し、影響のあるデバイスだけを更新できるようにする。
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+@dataclass
+class ConfigDiff:
+    """デバイス設定の差分"""
+
+    added: List[Dict[str, str]] = field(default_factory=list)
+    removed: List[Dict[str, str]] = field(default_factory=list)
+    relabelled: List[Tuple[Dict[str, str], Dict[str, str]]] = field(
+        default_factory=list
+    )  # (旧設定, 新設定)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.relabelled)
+
+    def summary(self) -> str:
+        return (
+            f"added={[d['id'] for d in self.added]}, "
+            f"removed={[d['id'] for d in self.removed]}, "
+            f"relabelled={[new['id'] for _, new in self.relabelled]}"
+        )
+
+
+def diff_devices(old: List[Dict[str, str]], new: List[Dict[str, str]]) -> ConfigDiff:
+    """デバイス ID をキーに旧設定と新設定を比較する"""
+    old_by_id = {d["id"]: d for d in old}
+    new_by_id = {d["id"]: d for d in new}
+    diff = ConfigDiff()
+    for device_id, device in new_by_id.items():
+        previous = old_by_id.get(device_id)
+        if previous is None:
+            diff.added.append(device)
+        elif previous != device:
+            diff.relabelled.append((previous, device))
+    diff.removed = [
+        d for device_id, d in old_by_id.items() if device_id not in new_by_id
+    ]
+    return diff
+
+
+class DeviceConfigWatcher:
+    """設定ファイルの変更を stat で検知し、変わっていれば読み直す"""
+
+    def __init__(
+        self, path: str, loader: Callable[[str], List[Dict[str, str]]]
+    ) -> None:
+        self.path = path
+        self.loader = loader
+        self._signature = self._stat()
+
+    def _stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def poll(self) -> Optional[List[Dict[str, str]]]:
+        """変更があれば新しい設定を返す。変更なし・読み込み失敗時は None"""
+        signature = self._stat()
+        if signature == self._signature or signature is None:
+            return None
+        try:
+            devices = self.loader(self.path)
+        except (OSError, ValueError) as e:
+            # 書き込み途中などで壊れている場合は次回に再試行する
+            logging.error(f"Failed to reload {self.path}: {e}")
+            return None
+        self._signature = signature
+        return devices
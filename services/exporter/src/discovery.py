@@ -0,0 +1,146 @@
+"""
+/v1.1/devices によるデバイスの自動検出
+
+デバイス一覧 API を TTL ごとに 1 回だけ呼び、結果をディスクにキャッシュする。
+devices.json にないプラグミニは既定のラベルで収集対象に加え、
+devices.json にあるデバイスは設定側のラベル（部屋・棚・parent_id）をそのまま使う。
+新しいプラグを追加しても再デプロイは不要で、検出にかかる API 呼び出しは TTL あたり 1 回になる。
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+
+def is_plug(entry: Dict[str, str]) -> bool:
+    """電力を取得できるプラグ系デバイスか (Plug / Plug Mini (JP) / Plug Mini (US) など)"""
+    return "plug" in entry.get("deviceType", "").lower()
+
+
+def _identity(plugs: List[Dict[str, str]]) -> set:
+    return {(d["deviceId"], d.get("deviceName", "")) for d in plugs}
+
+
+def _label_name(name: str) -> str:
+    return re.sub(r"\s+", "_", name.strip()).lower() or "plug_mini"
+
+
+class DeviceDiscovery:
+    """デバイス一覧 API の結果を TTL 付きで保持する"""
+
+    def __init__(
+        self,
+        ttl: float = 21600.0,
+        cache_path: Optional[str] = None,
+        retry_interval: float = 300.0,
+        default_room: str = "unassigned",
+        default_shelf: str = "unassigned",
+    ) -> None:
+        self.ttl = ttl
+        self.cache_path = cache_path
+        self.retry_interval = retry_interval
+        self.default_room = default_room
+        self.default_shelf = default_shelf
+
+        self.plugs: List[Dict[str, str]] = []  # 一覧 API の deviceList（プラグのみ）
+        self.fetched_at = 0.0
+        self.remaining: Optional[int] = None
+        self.reset: Optional[str] = None
+        self._next_attempt = 0.0
+        if cache_path:
+            self._load()
+
+    # --- キャッシュ ---
+    def _load(self) -> None:
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.plugs = [d for d in data["devices"] if is_plug(d)]
+            self.fetched_at = float(data["fetched_at"])
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError) as e:
+            logging.error(f"Discovery cache {self.cache_path} is broken: {e}")
+
+    def _save(self, devices: List[Dict[str, str]]) -> None:
+        directory = os.path.dirname(self.cache_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.cache_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, "devices": devices}, f)
+        os.replace(tmp, self.cache_path)
+
+    def is_fresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        return self.fetched_at > 0 and now - self.fetched_at < self.ttl
+
+    # --- 取得 ---
+    async def refresh(
+        self,
+        client: httpx.AsyncClient,
+        headers: Dict[str, str],
+        base_url: str,
+        now: Optional[float] = None,
+    ) -> bool:
+        """一覧 API を 1 回呼ぶ。プラグの集合が変わったら True"""
+        now = time.time() if now is None else now
+        resp = await client.get(f"{base_url}/v1.1/devices", headers=headers)
+        remaining = resp.headers.get("x-ratelimit-remaining")
+        self.remaining = int(remaining) if remaining is not None else None
+        self.reset = resp.headers.get("x-ratelimit-reset")
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("statusCode") != 100:
+            raise ValueError(f"API Error: {data.get('message')}")
+
+        devices = data.get("body", {}).get("deviceList", [])
+        plugs = [d for d in devices if is_plug(d)]
+        changed = _identity(plugs) != _identity(self.plugs)
+        self.plugs = plugs
+        self.fetched_at = now
+        if self.cache_path:
+            self._save(devices)
+        logging.info(f"Discovered {len(plugs)} plugs via /v1.1/devices")
+        return changed
+
+    async def maybe_refresh(
+        self,
+        client: httpx.AsyncClient,
+        headers: Callable[[], Dict[str, str]],
+        base_url: str,
+        now: Optional[float] = None,
+    ) -> bool:
+        """TTL が切れていれば一覧を取り直す。失敗時は retry_interval 後に再試行する"""
+        now = time.time() if now is None else now
+        if self.is_fresh(now) or now < self._next_attempt:
+            return False
+        try:
+            return await self.refresh(client, headers(), base_url, now)
+        except Exception as e:
+            logging.error(f"Device discovery failed: {e}")
+            self._next_attempt = now + self.retry_interval
+            return False
+
+    # --- 設定との統合 ---
+    def merge(self, configured: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """設定済みデバイスに、設定にない検出済みプラグを既定のラベルで加える"""
+        known = {d["id"] for d in configured}
+        discovered = [
+            {
+                "id": plug["deviceId"],
+                "name": _label_name(plug.get("deviceName", "")),
+                "device": "plug_mini",
+                "room": self.default_room,
+                "shelf": self.default_shelf,
+                "parent_id": "none",
+            }
+            for plug in self.plugs
+            if plug["deviceId"] not in known
+        ]
+        return list(configured) + discovered
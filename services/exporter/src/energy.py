@@ -0,0 +1,94 @@
+"""
+電力量 (kWh) の積算
+
+取得ごとの (時刻, W) から台形則で電力量を積分し、デバイスごとの単調増加カウンタにする。
+Grafana / BFF 側は `increase(switchbot_energy_kwh_total[...])` だけで期間の電力量が得られる。
+積算値は小さな JSON ファイルに保存し、再起動後も続きから数える。
+"""
+
+import json
+import logging
+import os
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class EnergyState:
+    """デバイスごとの積算状態"""
+
+    kwh: float = 0.0
+    last_ts: Optional[float] = None
+    last_watts: Optional[float] = None
+    created: float = 0.0  # 積算を開始した時刻 (epoch 秒)
+
+
+class EnergyIntegrator:
+    """
+    台形則による電力量の積算器
+
+    前回の取得から max_gap 秒以上空いた場合はその区間の電力が分からないため積分しない
+    （値の推定はせず、次の区間から積算を再開する）。
+    """
+
+    def __init__(self, state_path: Optional[str] = None, max_gap: float = 1800.0):
+        self.state_path = state_path
+        self.max_gap = max_gap
+        self.devices: Dict[str, EnergyState] = {}
+        self._dirty = False
+        if state_path:
+            self.load()
+
+    def add(self, device_id: str, watts: float, ts: float) -> float:
+        """新しい取得結果を積算し、増分 (kWh) を返す"""
+        state = self.devices.get(device_id)
+        if state is None:
+            state = self.devices[device_id] = EnergyState(created=ts)
+
+        delta = 0.0
+        if state.last_ts is not None and state.last_watts is not None:
+            dt = ts - state.last_ts
+            if dt <= 0:
+                return 0.0  # 同じ（または古い）取得結果
+            if dt <= self.max_gap:
+                delta = (state.last_watts + watts) / 2.0 * dt / 3600.0 / 1000.0
+        state.kwh += delta
+        state.last_ts = ts
+        state.last_watts = watts
+        self._dirty = True
+        return delta
+
+    def total(self, device_id: str) -> float:
+        state = self.devices.get(device_id)
+        return state.kwh if state else 0.0
+
+    def forget(self, device_id: str) -> None:
+        if self.devices.pop(device_id, None) is not None:
+            self._dirty = True
+
+    # --- 永続化 ---
+    def load(self) -> None:
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            logging.error(f"Energy state {self.state_path} is broken: {e}")
+            return
+        self.devices = {
+            device_id: EnergyState(**values) for device_id, values in data.items()
+        }
+
+    def save(self, force: bool = False) -> None:
+        """変更があれば状態ファイルを書き換える（一時ファイル経由で atomic に置き換える）"""
+        if not self.state_path or not (self._dirty or force):
+            return
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({k: asdict(v) for k, v in self.devices.items()}, f)
+        os.replace(tmp, self.state_path)
+        self._dirty = False
@@ -0,0 +1,192 @@
+"""
+描画済み /metrics のキャッシュと HTTP サーバー
+
+prometheus_client の標準サーバーはスクレイプのたびに全系列をたどってテキストを作り直す。
+ここでは描画結果（と gzip 圧縮したもの）をバイト列のまま保持し、
+収集サイクルが新しい値を反映したとき (invalidate) だけ作り直す。
+スクレイパーが何台あっても描画は 1 回で済み、同時に来たスクレイプは同じ描画結果を待つ。
+
+既定では作り直すのは invalidate のときだけ。自己計測のカウンタや sample_age のように
+収集サイクル外でも動く値を追従させたい場合は、ttl 秒を過ぎたキャッシュも作り直せる。
+ETag / If-None-Match と HEAD にも応答する。
+
+Accept ヘッダーで OpenMetrics が要求されれば OpenMetrics 形式で返す（形式ごとにキャッシュする）。
+TimestampedView を通すと、電力などのサンプルに取得時刻のタイムスタンプが付く。
+"""
+
+import gzip
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, Optional, Tuple
+
+from prometheus_client import REGISTRY
+from prometheus_client.exposition import choose_encoder
+from prometheus_client.metrics_core import Metric
+from prometheus_client.registry import Collector
+
+# ラベル -> 時刻 (epoch 秒)。分からなければ None
+LabelTime = Callable[[Dict[str, str]], Optional[float]]
+
+
+class TimestampedView:
+    """
+    レジストリの収集結果にサンプルごとの時刻を付けて返す Collector
+
+    timestamps: メトリクス名 -> 値を取得した時刻。サンプルのタイムスタンプになり、
+        VictoriaMetrics (honor_timestamps) はスクレイプ時刻ではなくこの時刻で保存する。
+    created: Counter 名 -> カウントを始めた時刻。`_created` サンプルの値を置き換える。
+    """
+
+    def __init__(
+        self,
+        registry: Collector = REGISTRY,
+        timestamps: Optional[Dict[str, LabelTime]] = None,
+        created: Optional[Dict[str, LabelTime]] = None,
+    ) -> None:
+        self.registry = registry
+        self.timestamps = timestamps or {}
+        self.created = created or {}
+
+    def collect(self) -> Iterator[Metric]:
+        for family in self.registry.collect():
+            stamp = self.timestamps.get(family.name)
+            created = self.created.get(family.name)
+            if stamp is None and created is None:
+                yield family
+                continue
+            samples = []
+            for sample in family.samples:
+                if created is not None and sample.name.endswith("_created"):
+                    value = created(sample.labels)
+                    if value is not None:
+                        sample = sample._replace(value=value)
+                elif stamp is not None:
+                    ts = stamp(sample.labels)
+                    if ts is not None:
+                        sample = sample._replace(timestamp=ts)
+                samples.append(sample)
+            family.samples = samples
+            yield family
+
+
+@dataclass
+class Rendered:
+    """1 回分の描画結果"""
+
+    body: bytes
+    content_type: str
+    etag: str
+    rendered_at: float
+    gzipped: Optional[bytes] = None
+
+
+class ExpositionCache:
+    """レジストリの描画結果を invalidate されるまで使い回す"""
+
+    def __init__(
+        self,
+        registry: Collector = REGISTRY,
+        ttl: float = 0.0,
+        gzip_level: int = 6,
+    ) -> None:
+        self.registry = registry
+        self.ttl = ttl
+        self.gzip_level = gzip_level
+        self.renders = 0  # 実際に描画した回数
+        self._lock = threading.Lock()
+        self._cached: Dict[str, Rendered] = {}  # 形式 (Content-Type) ごとの描画結果
+
+    def invalidate(self) -> None:
+        """収集サイクルが値を反映したら呼ぶ。次のスクレイプで描画し直す"""
+        self._cached = {}
+
+    def get(
+        self, now: Optional[float] = None, accept: Optional[str] = None
+    ) -> Rendered:
+        """Accept ヘッダーに合う形式の描画結果を返す"""
+        now = time.time() if now is None else now
+        encoder, content_type = choose_encoder(accept or "")
+        with self._lock:
+            cached = self._cached.get(content_type)
+            if cached is None or (
+                self.ttl > 0 and now - cached.rendered_at >= self.ttl
+            ):
+                body = encoder(self.registry)
+                etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+                cached = Rendered(body, content_type, etag, now)
+                self._cached[content_type] = cached
+                self.renders += 1
+            return cached
+
+    def get_gzipped(self, rendered: Rendered) -> bytes:
+        """圧縮版は最初に要求されたときに一度だけ作る"""
+        with self._lock:
+            if rendered.gzipped is None:
+                rendered.gzipped = gzip.compress(rendered.body, self.gzip_level)
+            return rendered.gzipped
+
+
+def _accepts_gzip(header: Optional[str]) -> bool:
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() == "gzip":
+            return params.replace(" ", "") != "q=0"
+    return False
+
+
+def make_handler(cache: ExpositionCache):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def _respond(self, send_body: bool) -> None:
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            rendered = cache.get(accept=self.headers.get("Accept"))
+            headers: Dict[str, str] = {
+                "Content-Type": rendered.content_type,
+                "ETag": rendered.etag,
+                "Vary": "Accept, Accept-Encoding",
+            }
+            if self.headers.get("If-None-Match") == rendered.etag:
+                self._send(304, headers, b"", send_body=False)
+                return
+            body = rendered.body
+            if _accepts_gzip(self.headers.get("Accept-Encoding")):
+                body = cache.get_gzipped(rendered)
+                headers["Content-Encoding"] = "gzip"
+            self._send(200, headers, body, send_body)
+
+        def _send(
+            self, status: int, headers: Dict[str, str], body: bytes, send_body: bool
+        ) -> None:
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+
+        def do_GET(self) -> None:
+            self._respond(send_body=True)
+
+        def do_HEAD(self) -> None:
+            self._respond(send_body=False)
+
+        def log_message(self, format: str, *args) -> None:
+            pass  # スクレイプごとのアクセスログは出さない
+
+    return MetricsHandler
+
+
+def start_metrics_server(
+    port: int, cache: ExpositionCache, addr: str = "0.0.0.0"
+) -> Tuple[ThreadingHTTPServer, threading.Thread]:
+    """キャッシュから /metrics を返す HTTP サーバーを別スレッドで起動する"""
+    server = ThreadingHTTPServer((addr, port), make_handler(cache))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
@@ -0,0 +1,87 @@
+"""
+同時実行数とサイクル締め切りを持つフェッチプール
+
+全デバイス分のコルーチンを一度に gather するのではなく、
+固定数のワーカーがキューからジョブを取り出して実行する。
+サイクル全体の締め切りを超えたジョブはキャンセルし、未着手のジョブは実行しない。
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Generic, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+Job = Tuple[str, Callable[[], Awaitable[T]]]
+
+
+@dataclass
+class PoolResult(Generic[T]):
+    """1 サイクル分の実行結果"""
+
+    results: Dict[str, T] = field(default_factory=dict)
+    cancelled: List[str] = field(default_factory=list)  # 実行中に締め切りを超えた
+    skipped: List[str] = field(default_factory=list)  # 締め切りまでに着手できなかった
+    errors: Dict[str, BaseException] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    @property
+    def timed_out(self) -> bool:
+        return bool(self.cancelled or self.skipped)
+
+
+class FetchPool:
+    """同時実行数の上限とサイクル締め切り付きでジョブを実行する"""
+
+    def __init__(self, concurrency: int = 8, cycle_deadline: Optional[float] = None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be >= 1")
+        self.concurrency = concurrency
+        self.cycle_deadline = cycle_deadline
+
+    async def run(self, jobs: List[Job]) -> PoolResult:
+        """ジョブを実行し、締め切りまでに終わったものの結果を返す"""
+        outcome: PoolResult = PoolResult()
+        started = time.monotonic()
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        in_flight: Dict[int, str] = {}
+
+        async def worker(worker_id: int) -> None:
+            while True:
+                try:
+                    key, factory = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                in_flight[worker_id] = key
+                try:
+                    outcome.results[key] = await factory()
+                except Exception as e:
+                    outcome.errors[key] = e
+                finally:
+                    in_flight.pop(worker_id, None)
+
+        workers = [
+            asyncio.create_task(worker(i))
+            for i in range(min(self.concurrency, len(jobs)))
+        ]
+        if workers:
+            _, pending = await asyncio.wait(workers, timeout=self.cycle_deadline)
+            if pending:
+                outcome.cancelled = list(in_flight.values())
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                while not queue.empty():
+                    outcome.skipped.append(queue.get_nowait()[0])
+                logging.warning(
+                    f"Cycle deadline ({self.cycle_deadline}s) exceeded: "
+                    f"cancelled={outcome.cancelled}, skipped={len(outcome.skipped)}"
+                )
+
+        outcome.elapsed = time.monotonic() - started
+        return outcome
@@ -0,0 +1,285 @@
+"""
+parent_id による階層集計
+
+devices.json の parent_id から親子関係（タップ → その先のプラグ）の木を 1 度だけ組み立て、
+タップ・棚・部屋・家全体の合計電力をあらかじめ計算して公開する。
+Grafana 側で表示のたびに `sum by` を実行する必要がなくなる。
+
+親の計測値には子の消費電力が含まれるため、単純に足すと二重計上になる。
+そこで各ノードの「自分だけの電力」(exclusive) を
+    exclusive = 自分の計測値 - Σ 子の部分木合計
+とし、棚・部屋・家全体はこの exclusive の合計とする。
+計測値のないノードの exclusive は 0 で、部分木合計は子の部分木合計の和になる。
+部分木内の exclusive の和は常に部分木合計と一致する。
+
+1 デバイスの値が変わったときは、そのノードと「計測値を持つ最も近い祖先」の
+exclusive だけが変わるため、その差分だけを棚・部屋・家全体の合計に反映する。
+
+複数レプリカで分担している場合、棚・部屋・家全体の合計は自レプリカの分だけの部分和になり、
+レプリカ間で同じ系列を上書きし合うため publish_groups=False で公開しない。
+タップの合計は配下が同じレプリカに載るので、分担していても正しい。
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from prometheus_client import Gauge
+
+_NODE_LABELS = ["room", "shelf", "device_name", "device_id"]
+
+TAP_POWER = Gauge(
+    "switchbot_tap_power_watts",
+    "Power of a parent device including everything plugged into it",
+    _NODE_LABELS,
+)
+
+UNACCOUNTED_POWER = Gauge(
+    "switchbot_unaccounted_power_watts",
+    "Parent reading minus the total of its children",
+    _NODE_LABELS,
+)
+
+SHELF_POWER = Gauge(
+    "switchbot_shelf_power_watts", "Total power of the shelf", ["room", "shelf"]
+)
+
+ROOM_POWER = Gauge("switchbot_room_power_watts", "Total power of the room", ["room"])
+
+HOUSE_POWER = Gauge("switchbot_house_power_watts", "Total power of the house")
+
+ShelfKey = Tuple[str, str]  # (room, shelf)
+
+
+def _node_labels(device: Dict[str, str]) -> Tuple[str, str, str, str]:
+    return (device["room"], device["shelf"], device["name"], device["id"])
+
+
+class _Group:
+    """棚・部屋・家全体の合計（計測値のあるノード数も数え、0 件なら系列を消す）"""
+
+    __slots__ = ("total", "known")
+
+    def __init__(self) -> None:
+        self.total = 0.0
+        self.known = 0
+
+
+class HierarchyAggregator:
+    """デバイスの親子関係に沿って電力を集計し、ゲージへ反映する"""
+
+    def __init__(
+        self,
+        devices: Optional[List[Dict[str, str]]] = None,
+        publish_groups: bool = True,
+    ) -> None:
+        self.publish_groups = publish_groups
+        self.devices: Dict[str, Dict[str, str]] = {}
+        self.parent: Dict[str, Optional[str]] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.readings: Dict[str, float] = {}
+        self.exclusive: Dict[str, float] = {}
+        self.subtree: Dict[str, Optional[float]] = {}
+        self.shelves: Dict[ShelfKey, _Group] = {}
+        self.rooms: Dict[str, _Group] = {}
+        self.house = _Group()
+        self._published_nodes: Set[Tuple[str, str, str, str]] = set()
+        self._published_unaccounted: Set[Tuple[str, str, str, str]] = set()
+        if devices is not None:
+            self.rebuild(devices, {})
+
+    # --- 木の構築 ---
+    def _build_tree(self, devices: List[Dict[str, str]]) -> None:
+        self.devices = {d["id"]: d for d in devices}
+        self.parent = {}
+        self.children = {device_id: [] for device_id in self.devices}
+        for device_id, device in self.devices.items():
+            parent_id = device.get("parent_id", "none")
+            self.parent[device_id] = parent_id if parent_id in self.devices else None
+
+        # 循環している親子関係は根として扱う
+        for device_id in self.devices:
+            seen = {device_id}
+            node = self.parent[device_id]
+            while node is not None:
+                if node in seen:
+                    logging.warning(f"parent_id cycle detected at {device_id}")
+                    self.parent[device_id] = None
+                    break
+                seen.add(node)
+                node = self.parent[node]
+
+        for device_id, parent_id in self.parent.items():
+            if parent_id is not None:
+                self.children[parent_id].append(device_id)
+
+    def rebuild(
+        self, devices: List[Dict[str, str]], readings: Dict[str, float]
+    ) -> None:
+        """設定変更時に木と合計を作り直す"""
+        old_shelves, old_rooms = self.shelves, self.rooms
+        self._build_tree(devices)
+        self.readings = {k: v for k, v in readings.items() if k in self.devices}
+        self.shelves, self.rooms, self.house = {}, {}, _Group()
+        self.exclusive, self.subtree = {}, {}
+
+        # 葉から順に部分木合計を確定させる
+        for device_id in self._post_order():
+            self.subtree[device_id] = self._compute_subtree(device_id)
+        for device_id in self.devices:
+            excl = self._compute_exclusive(device_id)
+            self.exclusive[device_id] = excl
+            self._add_to_groups(device_id, excl, int(device_id in self.readings))
+
+        self._remove_stale_series(old_shelves, old_rooms)
+        self._publish_groups(self.shelves, self.rooms)
+        self._publish_nodes(self.devices)
+
+    def _post_order(self) -> List[str]:
+        order: List[str] = []
+        stack = [(d, False) for d in self.devices if self.parent[d] is None]
+        while stack:
+            node, expanded = stack.pop()
+            if expanded:
+                order.append(node)
+                continue
+            stack.append((node, True))
+            stack.extend((c, False) for c in self.children[node])
+        return order
+
+    # --- 計算 ---
+    def _compute_subtree(self, device_id: str) -> Optional[float]:
+        reading = self.readings.get(device_id)
+        if reading is not None:
+            return reading
+        known = [self.subtree[c] for c in self.children[device_id]]
+        known = [v for v in known if v is not None]
+        return sum(known) if known else None
+
+    def _compute_exclusive(self, device_id: str) -> float:
+        reading = self.readings.get(device_id)
+        if reading is None:
+            return 0.0
+        return reading - sum(self.subtree[c] or 0.0 for c in self.children[device_id])
+
+    def _add_to_groups(self, device_id: str, delta: float, known_delta: int) -> None:
+        device = self.devices[device_id]
+        shelf = self.shelves.setdefault((device["room"], device["shelf"]), _Group())
+        room = self.rooms.setdefault(device["room"], _Group())
+        for group in (shelf, room, self.house):
+            group.total += delta
+            group.known += known_delta
+            if not group.known:
+                group.total = 0.0  # 差分の積み重ねによる誤差を捨てる
+
+    # --- 差分更新 ---
+    def update(self, device_id: str, watts: Optional[float]) -> None:
+        """1 デバイスの計測値を更新する（None は計測値なし）"""
+        if device_id not in self.devices:
+            return
+        was_known = device_id in self.readings
+        if watts is None:
+            if not was_known:
+                return
+            del self.readings[device_id]
+        else:
+            self.readings[device_id] = watts
+
+        changed = [device_id]
+        touched_exclusive = [device_id]
+        node = device_id
+        while True:
+            self.subtree[node] = self._compute_subtree(node)
+            parent = self.parent[node]
+            if parent is None:
+                break
+            changed.append(parent)
+            if parent in self.readings:
+                # 計測値を持つ祖先の部分木合計は変わらず、exclusive だけが変わる
+                touched_exclusive.append(parent)
+                break
+            node = parent
+
+        shelves: Dict[ShelfKey, _Group] = {}
+        rooms: Dict[str, _Group] = {}
+        for node in touched_exclusive:
+            new = self._compute_exclusive(node)
+            known_delta = 0
+            if node == device_id:
+                known_delta = int(watts is not None) - int(was_known)
+            self._add_to_groups(node, new - self.exclusive[node], known_delta)
+            self.exclusive[node] = new
+            device = self.devices[node]
+            key = (device["room"], device["shelf"])
+            shelves[key] = self.shelves[key]
+            rooms[device["room"]] = self.rooms[device["room"]]
+
+        self._publish_groups(shelves, rooms)
+        self._publish_nodes(changed)
+
+    # --- ゲージへの反映 ---
+    def _publish_groups(
+        self, shelves: Dict[ShelfKey, _Group], rooms: Dict[str, _Group]
+    ) -> None:
+        if not self.publish_groups:
+            return
+        for (room, shelf), group in shelves.items():
+            self._set_or_remove(SHELF_POWER, (room, shelf), group)
+        for room, group in rooms.items():
+            self._set_or_remove(ROOM_POWER, (room,), group)
+        HOUSE_POWER.set(self.house.total)
+
+    @staticmethod
+    def _set_or_remove(gauge: Gauge, labels: Tuple[str, ...], group: _Group) -> None:
+        if group.known:
+            gauge.labels(*labels).set(group.total)
+            return
+        try:
+            gauge.remove(*labels)
+        except KeyError:
+            pass
+
+    def _publish_nodes(self, device_ids: Iterable[str]) -> None:
+        """子を持つノードのタップ合計と未計上分を更新する"""
+        for device_id in device_ids:
+            if not self.children[device_id]:
+                continue
+            labels = _node_labels(self.devices[device_id])
+            total = self.subtree[device_id]
+            if total is None:
+                self._remove(TAP_POWER, labels, self._published_nodes)
+            else:
+                TAP_POWER.labels(*labels).set(total)
+                self._published_nodes.add(labels)
+            if device_id in self.readings:
+                UNACCOUNTED_POWER.labels(*labels).set(self.exclusive[device_id])
+                self._published_unaccounted.add(labels)
+            else:
+                self._remove(UNACCOUNTED_POWER, labels, self._published_unaccounted)
+
+    @staticmethod
+    def _remove(
+        gauge: Gauge, labels: Tuple[str, ...], published: Set[Tuple[str, ...]]
+    ) -> None:
+        published.discard(labels)
+        try:
+            gauge.remove(*labels)
+        except KeyError:
+            pass
+
+    def _remove_stale_series(
+        self, old_shelves: Dict[ShelfKey, _Group], old_rooms: Dict[str, _Group]
+    ) -> None:
+        """設定から消えた（またはラベルが変わった）ノード・グループの系列を削除する"""
+        current = {
+            _node_labels(d)
+            for device_id, d in self.devices.items()
+            if self.children[device_id]
+        }
+        for labels in list(self._published_nodes - current):
+            self._remove(TAP_POWER, labels, self._published_nodes)
+        for labels in list(self._published_unaccounted - current):
+            self._remove(UNACCOUNTED_POWER, labels, self._published_unaccounted)
+        for key in old_shelves.keys() - self.shelves.keys():
+            self._set_or_remove(SHELF_POWER, key, _Group())
+        for room in old_rooms.keys() - self.rooms.keys():
+            self._set_or_remove(ROOM_POWER, (room,), _Group())
@@ -0,0 +1,106 @@
+"""
+SwitchBot API 用の長寿命 HTTP クライアント
+
+exporter の起動から終了まで 1 つの httpx.AsyncClient を使い回し、
+サイクルごとの TCP / TLS ハンドシェイクを避ける。
+httpcore の trace 拡張で新規接続と TLS ハンドシェイクを数え、接続の再利用率を可視化する。
+"""
+
+import logging
+import os
+from typing import Optional
+
+import httpx
+from prometheus_client import Counter
+
+HTTP_REQUESTS = Counter(
+    "switchbot_http_requests_total",
+    "HTTP requests sent to the SwitchBot API by connection usage",
+    ["connection"],  # new: 新規接続, reused: keep-alive 接続を再利用
+)
+
+HTTP_CONNECTIONS_OPENED = Counter(
+    "switchbot_http_connections_opened_total",
+    "TCP connections opened to the SwitchBot API",
+)
+
+HTTP_TLS_HANDSHAKES = Counter(
+    "switchbot_http_tls_handshakes_total",
+    "TLS handshakes performed with the SwitchBot API",
+)
+
+
+class _ConnectionTrace:
+    """1 リクエスト分の httpcore trace イベントを受け取る"""
+
+    def __init__(self) -> None:
+        self.opened = False
+
+    async def __call__(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.opened = True
+            HTTP_CONNECTIONS_OPENED.inc()
+        elif event_name == "connection.start_tls.complete":
+            HTTP_TLS_HANDSHAKES.inc()
+
+
+async def _attach_trace(request: httpx.Request) -> None:
+    request.extensions["trace"] = _ConnectionTrace()
+
+
+async def _count_request(response: httpx.Response) -> None:
+    trace = response.request.extensions.get("trace")
+    if isinstance(trace, _ConnectionTrace):
+        HTTP_REQUESTS.labels(connection="new" if trace.opened else "reused").inc()
+
+
+def _h2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_client(
+    max_connections: int = 8,
+    max_keepalive_connections: Optional[int] = None,
+    keepalive_expiry: float = 120.0,
+    http2: bool = False,
+    transport: Optional[httpx.AsyncBaseTransport] = None,
+) -> httpx.AsyncClient:
+    """
+    接続プール設定付きの AsyncClient を作る
+
+    keepalive_expiry は収集周期より長くしないとサイクルをまたいだ再利用が効かない。
+    """
+    if http2 and not _h2_available():
+        logging.warning(
+            "HTTP2_ENABLED is set but 'h2' is not installed. Using HTTP/1.1"
+        )
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=(
+            max_connections
+            if max_keepalive_connections is None
+            else max_keepalive_connections
+        ),
+        keepalive_expiry=keepalive_expiry,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        http2=http2,
+        transport=transport,
+        event_hooks={"request": [_attach_trace], "response": [_count_request]},
+    )
+
+
+def build_client_from_env(max_connections: int) -> httpx.AsyncClient:
+    """環境変数から AsyncClient を作る（デフォルトの同時接続数はフェッチプールに揃える）"""
+    return build_client(
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", str(max_connections))),
+        keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "120")),
+        http2=os.getenv("HTTP2_ENABLED", "false").lower() in ("1", "true", "yes"),
+    )
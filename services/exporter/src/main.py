@@ -1,15 +1,40 @@
-import time
-import hmac
-import hashlib
-import base64
-import uuid
 import os
+import time
 import json
 import asyncio
 import logging
-from typing import Dict, List
+import functools
+import signal
+import socket
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 import httpx
-from prometheus_client import Gauge, start_http_server
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram, start_http_server
+
+from src.breaker import DeviceBreakers
+from src.config_watch import ConfigDiff, DeviceConfigWatcher, diff_devices
+from src.energy import EnergyIntegrator
+from src.exposition import ExpositionCache, TimestampedView, start_metrics_server
+from src.fetch_pool import FetchPool
+from src.hierarchy import HierarchyAggregator
+from src.http_client import build_client_from_env
+from src.remote_write import PushSink, Sample, build_push_sink
+from src.scheduler import DEFAULT_ACCOUNT, AdaptivePollScheduler
+from src.signer import SwitchBotSigner
+from src.startup import StartupProfile
+
+# 既定で無効の機能のモジュールは、有効にしたときだけ build_* の中で import する
+# （Raspberry Pi では import だけで起動が目に見えて遅くなるため）
+if TYPE_CHECKING:
+    from src.change_detect import ChangeDetector
+    from src.discovery import DeviceDiscovery
+    from src.sharding import DeviceSharder
+    from src.wal import SampleWAL, WalRecord, WalShipper
+
+# ベンチマークやローカル検証では偽の API サーバーに向けられる
+SWITCHBOT_API_BASE = os.getenv(
+    "SWITCHBOT_API_BASE", "https://api.switch-bot.com"
+).rstrip("/")
 
 # --- メトリクス定義 ---
 # テストコード (tests/test_exporter.py) が import している名前と一致させる
@@ -27,43 +52,156 @@ API_REMAINING = Gauge(
     "switchbot_api_requests_remaining", "Remaining API calls for the day"
 )
 
+ACCOUNT_REMAINING = Gauge(
+    "switchbot_account_requests_remaining",
+    "Remaining API calls for the day per SwitchBot account",
+    ["account"],
+)
+
+ENERGY_KWH = Counter(
+    "switchbot_energy_kwh",
+    "Energy consumed, integrated from power samples (trapezoid rule)",
+    ["room", "shelf", "device", "device_name", "device_id", "parent_id"],
+)
+
+POLL_INTERVAL = Gauge(
+    "switchbot_poll_interval_seconds",
+    "Adaptive polling interval assigned to the device",
+    ["device_id"],
+)
+
+
+SAMPLE_AGE = Gauge(
+    "switchbot_sample_age_seconds",
+    "Age of the power reading currently exported for the device",
+    ["device_id"],
+)
+
+# --- 収集パイプラインの自己計測 ---
+API_LATENCY = Histogram(
+    "switchbot_api_request_duration_seconds",
+    "SwitchBot API request latency per device",
+    ["device_id"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+API_RESPONSES = Counter(
+    "switchbot_api_responses_total",
+    "SwitchBot API responses by HTTP status class",
+    ["status_class"],  # 2xx / 4xx / 5xx / error (応答なし)
+)
+
+API_STATUS_CODES = Counter(
+    "switchbot_api_status_codes_total",
+    "statusCode values in SwitchBot API response bodies",
+    ["status_code"],
+)
+
+JSON_DECODE_SECONDS = Histogram(
+    "switchbot_json_decode_seconds",
+    "Time spent decoding API response bodies",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+
+CYCLE_DURATION = Histogram(
+    "switchbot_cycle_duration_seconds",
+    "Duration of one collection cycle",
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0, 120.0),
+)
+
+CYCLE_OVERRUNS = Counter(
+    "switchbot_cycle_overruns_total",
+    "Collection cycles that took longer than COLLECTION_INTERVAL",
+)
+
+SLEEP_SECONDS = Counter(
+    "switchbot_sleep_seconds_total", "Time the collection loop spent sleeping"
+)
+
+
+@dataclass
+class FetchResult:
+    """fetch_device_status の結果（スケジューラ等の後段処理に渡す）"""
+
+    device_id: str
+    watts: Optional[float] = None  # 失敗時は None
+    remaining: Optional[int] = None
+    reset: Optional[str] = None  # x-ratelimit-reset (epoch ms)
+    fetched_at: Optional[float] = None  # レスポンス受信時刻 (epoch 秒)
+    down: bool = False  # 失敗してデバイスを停止扱いにした（系列を削除した）
+    account: str = DEFAULT_ACCOUNT  # 呼び出しに使った SwitchBot アカウント
+    changed: bool = True  # 書き込み済みの値からデッドバンドを超えて変化した
+
+    @property
+    def ok(self) -> bool:
+        return self.watts is not None
+
+
+def power_labels(device: dict) -> Dict[str, str]:
+    """POWER_WATT のラベル（定義順）をデバイス設定から作る"""
+    return {
+        "room": device["room"],
+        "shelf": device["shelf"],
+        "device": device["device"],
+        "device_name": device["name"],
+        "device_id": device["id"],
+        "parent_id": device.get("parent_id", "none"),
+    }
+
 
 # --- 署名生成ロジック ---
 def generate_sign(token: str, secret: str):
     """SwitchBot API v1.1 の署名を生成する"""
-    nonce = str(uuid.uuid4())
-    t = str(int(time.time() * 1000))
-    string_to_sign = f"{token}{t}{nonce}"
-    sign = base64.b64encode(
-        hmac.new(secret.encode(), string_to_sign.encode(), hashlib.sha256).digest()
-    ).upper()
-    return str(sign, "utf-8"), t, nonce
+    return SwitchBotSigner(token, secret).sign()
+
+
+@functools.lru_cache(maxsize=64)
+def get_signer(token: str, secret: str) -> SwitchBotSigner:
+    """認証情報ごとに HMAC を鍵設定済みの署名器を使い回す"""
+    return SwitchBotSigner(
+        token, secret, reuse_window=float(os.getenv("SIGN_REUSE_WINDOW", "0"))
+    )
 
 
 # --- データ取得ロジック ---
 async def fetch_device_status(
-    client: httpx.AsyncClient, device: dict, token: str, secret: str
-):
-    """単一デバイスのステータスを取得し、メトリクスを更新する"""
+    client: httpx.AsyncClient,
+    device: dict,
+    token: str,
+    secret: str,
+    timeout: float = 10.0,
+    breakers: Optional[DeviceBreakers] = None,
+    keep_stale: bool = False,
+) -> FetchResult:
+    """
+    単一デバイスのステータスを取得し、メトリクスを更新する
+
+    breakers を渡した場合、ブレーカーが開くまでの失敗では直近の値を残す。
+    keep_stale の場合は停止扱いにしても電力の系列を消さない（古くなったら expire_stale で消す）。
+    """
     device_id = device["id"]
-    sign, t, nonce = generate_sign(token, secret)
-
-    headers = {
-        "Authorization": token,
-        "sign": sign,
-        "nonce": nonce,
-        "t": t,
-        "Content-Type": "application/json; charset=utf8",
-    }
+    result = FetchResult(
+        device_id=device_id, account=device.get("account", DEFAULT_ACCOUNT)
+    )
+    headers = get_signer(token, secret).headers()
+    resp = None
+    started = time.perf_counter()
 
     try:
-        url = f"https://api.switch-bot.com/v1.1/devices/{device_id}/status"
-        resp = await client.get(url, headers=headers, timeout=10.0)
+        url = f"{SWITCHBOT_API_BASE}/v1.1/devices/{device_id}/status"
+        resp = await client.get(url, headers=headers, timeout=timeout)
+        result.fetched_at = time.time()
+        API_LATENCY.labels(device_id=device_id).observe(time.perf_counter() - started)
+        API_RESPONSES.labels(status_class=f"{resp.status_code // 100}xx").inc()
 
         # API制限の更新（copilot-instructions.md 準拠）
         remaining = resp.headers.get("x-ratelimit-remaining")
+        result.reset = resp.headers.get("x-ratelimit-reset")
         if remaining is not None:
-            API_REMAINING.set(int(remaining))
+            result.remaining = int(remaining)
+            ACCOUNT_REMAINING.labels(account=result.account).set(int(remaining))
+            if result.account == DEFAULT_ACCOUNT:
+                API_REMAINING.set(int(remaining))
             if int(remaining) <= 100:
                 logging.warning(f"API rate limit low: {remaining} calls remaining")
         else:
@@ -72,42 +210,47 @@ async def fetch_device_status(
             )
 
         resp.raise_for_status()
+        decode_started = time.perf_counter()
         data = resp.json()
+        JSON_DECODE_SECONDS.observe(time.perf_counter() - decode_started)
+        API_STATUS_CODES.labels(status_code=str(data.get("statusCode"))).inc()
 
         if data.get("statusCode") == 100:
             # 重要：SwitchBotプラグミニでは 'weight' が消費電力(W)を指す
             wattage = data["body"].get("weight", 0)
 
-            POWER_WATT.labels(
-                room=device["room"],
-                shelf=device["shelf"],
-                device=device["device"],
-                device_name=device["name"],
-                device_id=device_id,
-                parent_id=device.get("parent_id", "none"),
-            ).set(wattage)
+            POWER_WATT.labels(**power_labels(device)).set(wattage)
 
             DEVICE_UP.labels(device_id=device_id).set(1)
+            result.watts = float(wattage)
+            if breakers is not None:
+                breakers.record_success(device_id)
             logging.info(f"Device {device_id}: power={wattage}W, remaining={remaining}")
         else:
             raise ValueError(f"API Error: {data.get('message')}")
 
     except Exception as e:
+        if resp is None:
+            # タイムアウト・接続失敗も遅いプラグとして latency に含める
+            API_LATENCY.labels(device_id=device_id).observe(
+                time.perf_counter() - started
+            )
+            API_RESPONSES.labels(status_class="error").inc()
         logging.error(f"Device {device_id} fetch failed: {e}")
+        if breakers is not None and not breakers.record_failure(device_id):
+            return result  # 単発の失敗では直近の値を残す
         # 失敗時は stale (古い値が残るの) を防ぐためにメトリクスを削除
+        result.down = True
         DEVICE_UP.labels(device_id=device_id).set(0)
+        if keep_stale:
+            return result
         try:
-            POWER_WATT.remove(
-                device["room"],
-                device["shelf"],
-                device["device"],
-                device["name"],
-                device_id,
-                device.get("parent_id", "none"),
-            )
+            POWER_WATT.remove(*power_labels(device).values())
         except KeyError:
             pass  # すでに存在しない場合は無視
 
+    return result
+
 
 # --- 設定ロード機能 ---
 def load_device_config(config_path: str = "devices.json") -> List[Dict[str, str]]:
@@ -140,31 +283,868 @@ def load_device_config(config_path: str = "devices.json") -> List[Dict[str, str]
         return json.load(f)
 
 
-# --- メインアプリケーション ---
-async def collect_metrics(
+def result_samples(
     devices: List[Dict[str, str]],
-) -> None:
+    results: List[FetchResult],
+    include_power: bool = True,
+) -> List[Sample]:
+    """取得結果をプッシュ用のタイムスタンプ付きサンプルに変換する"""
+    by_id = {d["id"]: d for d in devices}
+    samples: List[Sample] = []
+    for r in results:
+        device = by_id.get(r.device_id)
+        if device is None:
+            continue
+        ts = r.fetched_at or time.time()
+        up = {"device_id": r.device_id}
+        if r.ok and include_power and r.changed:
+            samples.append(
+                Sample("switchbot_power_watts", power_labels(device), r.watts, ts)
+            )
+        if r.ok or r.down:
+            samples.append(Sample("switchbot_device_up", up, 1.0 if r.ok else 0.0, ts))
+        if r.remaining is not None:
+            if r.account == DEFAULT_ACCOUNT:
+                samples.append(
+                    Sample(
+                        "switchbot_api_requests_remaining", {}, float(r.remaining), ts
+                    )
+                )
+            samples.append(
+                Sample(
+                    "switchbot_account_requests_remaining",
+                    {"account": r.account},
+                    float(r.remaining),
+                    ts,
+                )
+            )
+    return samples
+
+
+def load_accounts() -> Dict[str, Tuple[str, str]]:
     """
-    全デバイスのメトリクス収集を実行
+    SwitchBot アカウントごとの認証情報を読み込む
+
+    SWITCHBOT_TOKEN / SWITCHBOT_SECRET は "default" アカウントになる。
+    SWITCHBOT_ACCOUNTS_FILE には {"<account>": {"token": ..., "secret": ...}} 形式の
+    JSON を置き、devices.json の "account" でデバイスごとに使うアカウントを選ぶ。
     """
+    accounts: Dict[str, Tuple[str, str]] = {}
     token = (os.getenv("SWITCHBOT_TOKEN") or "").strip()
     secret = (os.getenv("SWITCHBOT_SECRET") or "").strip()
+    if token and secret:
+        accounts[DEFAULT_ACCOUNT] = (token, secret)
 
-    if not token or not secret:
+    path = os.getenv("SWITCHBOT_ACCOUNTS_FILE", "").strip()
+    if path:
+        with open(path, encoding="utf-8") as f:
+            for name, creds in json.load(f).items():
+                accounts[name] = (creds["token"].strip(), creds["secret"].strip())
+
+    if not accounts:
         raise ValueError("SWITCHBOT_TOKEN and SWITCHBOT_SECRET must be set")
+    return accounts
+
+
+# --- メインアプリケーション ---
+async def collect_metrics(
+    devices: List[Dict[str, str]],
+    pool: Optional[FetchPool] = None,
+    client: Optional[httpx.AsyncClient] = None,
+    breakers: Optional[DeviceBreakers] = None,
+    keep_stale: bool = False,
+    accounts: Optional[Dict[str, Tuple[str, str]]] = None,
+) -> List[FetchResult]:
+    """
+    全デバイスのメトリクス収集を実行
+
+    同時実行数とサイクル締め切りは FetchPool で制御する。
+    締め切りまでに完了しなかったデバイスの結果は含まれない。
+    client を渡すとその接続プールを使い回す（省略時はこの呼び出し限りのクライアントを作る）。
+    各デバイスは devices.json の "account" のアカウントで取得する（省略時は default）。
+    """
+    accounts = accounts or load_accounts()
+
+    pool = pool or build_fetch_pool()
+    # SIGN_REUSE_WINDOW 有効時はサイクルごとに 1 回だけ署名する
+    for token, secret in accounts.values():
+        get_signer(token, secret).new_tick()
+    targets = []
+    for device in devices:
+        if device.get("account", DEFAULT_ACCOUNT) in accounts:
+            targets.append(device)
+        else:
+            logging.error(
+                f"Device {device['id']}: no credentials for account "
+                f"{device.get('account', DEFAULT_ACCOUNT)}"
+            )
+    request_timeout = float(os.getenv("REQUEST_TIMEOUT", "10"))
 
     logging.info("Collecting metrics via SwitchBot API")
-    async with httpx.AsyncClient() as client:
-        tasks = [
-            fetch_device_status(client, device, token, secret) for device in devices
+    owns_client = client is None
+    if owns_client:
+        client = build_client_from_env(pool.concurrency)
+    try:
+        jobs = [
+            (
+                device["id"],
+                functools.partial(
+                    fetch_device_status,
+                    client,
+                    device,
+                    *accounts[device.get("account", DEFAULT_ACCOUNT)],
+                    request_timeout,
+                    breakers=breakers,
+                    keep_stale=keep_stale,
+                ),
+            )
+            for device in targets
         ]
-        await asyncio.gather(*tasks)
+        outcome = await pool.run(jobs)
+    finally:
+        if owns_client:
+            await client.aclose()
+
+    for device_id, error in outcome.errors.items():
+        logging.error(f"Device {device_id} fetch raised: {error}")
+    return [outcome.results[d["id"]] for d in targets if d["id"] in outcome.results]
+
+
+def build_fetch_pool() -> FetchPool:
+    """環境変数からフェッチプールを構築する"""
+    deadline = float(os.getenv("CYCLE_DEADLINE", "25"))
+    return FetchPool(
+        concurrency=int(os.getenv("FETCH_CONCURRENCY", "8")),
+        cycle_deadline=deadline if deadline > 0 else None,
+    )
+
+
+def build_scheduler(collection_interval: int) -> Optional[AdaptivePollScheduler]:
+    """環境変数から適応ポーリングスケジューラを構築する（無効時は None）"""
+    if os.getenv("ADAPTIVE_POLLING", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return AdaptivePollScheduler(
+        daily_limit=int(os.getenv("API_DAILY_LIMIT", "10000")),
+        reserve=int(os.getenv("API_RESERVE_CALLS", "100")),
+        min_interval=float(collection_interval),
+        max_interval=float(os.getenv("MAX_POLL_INTERVAL", "900")),
+    )
+
+
+def build_wal() -> Optional["SampleWAL"]:
+    """環境変数から WAL を構築する（WAL_DIR 未設定なら None）"""
+    wal_dir = os.getenv("WAL_DIR", "").strip()
+    if not wal_dir:
+        return None
+    from src.wal import SampleWAL
+
+    return SampleWAL(
+        wal_dir,
+        segment_bytes=int(os.getenv("WAL_SEGMENT_BYTES", str(1024 * 1024))),
+        max_bytes=int(os.getenv("WAL_MAX_BYTES", str(32 * 1024 * 1024))),
+    )
+
+
+def build_energy() -> EnergyIntegrator:
+    """環境変数から電力量の積算器を構築する（ENERGY_STATE_PATH 未設定なら永続化しない）"""
+    return EnergyIntegrator(
+        state_path=os.getenv("ENERGY_STATE_PATH", "").strip() or None,
+        max_gap=float(os.getenv("ENERGY_MAX_GAP", "1800")),
+    )
+
+
+def restore_energy(state: "ExporterState") -> None:
+    """保存済みの積算値でカウンタを再開する（設定にないデバイスの状態は捨てる）"""
+    wanted = state.devices_by_id
+    for device_id in list(state.energy.devices):
+        if device_id not in wanted:
+            state.energy.forget(device_id)
+    for device in state.devices:
+        total = state.energy.total(device["id"])
+        if total > 0:
+            ENERGY_KWH.labels(**power_labels(device)).inc(total)
+
+
+def build_change_detector() -> Optional["ChangeDetector"]:
+    """環境変数から変化のない値の書き込み抑制を構築する（無効時は None）"""
+    if os.getenv("CHANGE_DETECTION", "false").lower() not in ("1", "true", "yes"):
+        return None
+    from src.change_detect import ChangeDetector
+
+    return ChangeDetector(
+        abs_deadband=float(os.getenv("CHANGE_DEADBAND_ABS", "0")),
+        rel_deadband=float(os.getenv("CHANGE_DEADBAND_REL", "0")),
+        heartbeat=float(os.getenv("CHANGE_HEARTBEAT", "300")),
+    )
+
+
+def build_breakers() -> Optional[DeviceBreakers]:
+    """環境変数からサーキットブレーカーを構築する（無効時は None）"""
+    if os.getenv("BREAKER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return DeviceBreakers(
+        failure_threshold=int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3")),
+        base_backoff=float(os.getenv("BREAKER_BASE_BACKOFF", "120")),
+        max_backoff=float(os.getenv("BREAKER_MAX_BACKOFF", "3600")),
+        probe_timeout=float(os.getenv("BREAKER_PROBE_TIMEOUT", "60")),
+    )
+
+
+def build_discovery() -> Optional["DeviceDiscovery"]:
+    """環境変数からデバイス自動検出を構築する（無効時は None）"""
+    if os.getenv("DISCOVERY_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+    from src.discovery import DeviceDiscovery
+
+    return DeviceDiscovery(
+        ttl=float(os.getenv("DISCOVERY_TTL", "21600")),
+        cache_path=os.getenv("DISCOVERY_CACHE_PATH", "").strip() or None,
+        default_room=os.getenv("DISCOVERY_DEFAULT_ROOM", "unassigned"),
+        default_shelf=os.getenv("DISCOVERY_DEFAULT_SHELF", "unassigned"),
+    )
+
+
+def build_sharder() -> Optional["DeviceSharder"]:
+    """
+    環境変数からレプリカ間のデバイス分担を構築する（単独で動かす場合は None）
+
+    SHARD_PEER_DNS があればヘッドレス Service の DNS でメンバーを動的に求める。
+    なければ SHARD_REPLICAS と StatefulSet の Pod 名、または SHARD_MEMBERS を使う。
+    """
+    from src.sharding import DeviceSharder, resolve_peers, statefulset_members
+
+    hostname = os.getenv("HOSTNAME") or socket.gethostname()
+    member_id = os.getenv("SHARD_ID", "").strip()
+    vnodes = int(os.getenv("SHARD_VNODES", "64"))
+    peer_dns = os.getenv("SHARD_PEER_DNS", "").strip()
+    if peer_dns:
+        # DNS が返すのは Pod の IP なので、自分も IP で識別する
+        member_id = member_id or os.getenv("POD_IP") or socket.gethostbyname(hostname)
+        # メンバーは最初のサイクルで引く（それまではどのデバイスも取得しない）
+        return DeviceSharder(
+            member_id,
+            vnodes=vnodes,
+            resolve=functools.partial(resolve_peers, peer_dns),
+            refresh_interval=float(os.getenv("SHARD_REFRESH_INTERVAL", "30")),
+        )
+
+    replicas = int(os.getenv("SHARD_REPLICAS", "1"))
+    members = [m.strip() for m in os.getenv("SHARD_MEMBERS", "").split(",")]
+    members = [m for m in members if m]
+    if replicas > 1:
+        members = statefulset_members(hostname, replicas)
+    if len(members) <= 1:
+        return None
+    return DeviceSharder(member_id or hostname, members, vnodes=vnodes)
+
+
+async def refresh_discovery(state: "ExporterState") -> bool:
+    """TTL が切れていればデバイス一覧を取り直し、収集対象が変わったら True を返す"""
+    # 一覧は default アカウントのものだけを取得する
+    creds = (state.accounts or load_accounts()).get(DEFAULT_ACCOUNT)
+    if creds is None:
+        return False
+    token, secret = creds
+    discovery = state.discovery
+    changed = await discovery.maybe_refresh(
+        state.client, get_signer(token, secret).headers, SWITCHBOT_API_BASE
+    )
+    if discovery.remaining is not None:
+        API_REMAINING.set(discovery.remaining)
+        if state.scheduler is not None:
+            state.scheduler.observe_rate_limit(discovery.remaining, discovery.reset)
+        discovery.remaining = None
+    return changed
+
+
+def wal_samples(
+    records: List["WalRecord"], devices_by_id: Dict[str, Dict[str, str]]
+) -> List[Sample]:
+    """WAL レコードを現在のデバイス設定のラベルでサンプルに変換する"""
+    return [
+        Sample(
+            "switchbot_power_watts",
+            power_labels(devices_by_id[r.device_id]),
+            r.watts,
+            r.timestamp,
+        )
+        for r in records
+        if r.device_id in devices_by_id
+    ]
+
+
+@dataclass
+class ExporterState:
+    """収集ループが使い回すコンポーネント一式"""
+
+    devices: List[Dict[str, str]]
+    pool: FetchPool
+    client: httpx.AsyncClient
+    collection_interval: float
+    scheduler: Optional[AdaptivePollScheduler] = None
+    sink: Optional[PushSink] = None
+    wal: Optional["SampleWAL"] = None
+    watcher: Optional[DeviceConfigWatcher] = None
+    energy: Optional[EnergyIntegrator] = None
+    hierarchy: Optional[HierarchyAggregator] = None
+    breakers: Optional[DeviceBreakers] = None
+    discovery: Optional["DeviceDiscovery"] = None
+    sharder: Optional["DeviceSharder"] = None
+    changes: Optional["ChangeDetector"] = None
+    exposition: Optional[ExpositionCache] = None
+    profile: Optional[StartupProfile] = None
+    # アカウント名 -> (token, secret)。None なら毎サイクル環境変数から読む
+    accounts: Optional[Dict[str, Tuple[str, str]]] = None
+    # devices.json の内容（devices はこれに検出済みのプラグを加えたもの）
+    configured: Optional[List[Dict[str, str]]] = None
+    # 0 より大きい場合、取得に失敗しても直近の値をこの秒数まで公開し続ける
+    stale_max_age: float = 0.0
+    # device_id -> (watts, 取得時刻)。最新の取得結果（stale 判定やスナップショットに使う）
+    readings: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    # 変化検出の有効時、device_id -> 最後に書き込んだ (watts, 取得時刻)。
+    # デッドバンド内の取得結果ではゲージとタイムスタンプをこの値のままにする
+    written: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    # 取得に失敗中で、直近の値を公開し続けているデバイス
+    stale: Set[str] = field(default_factory=set)
+
+    @property
+    def devices_by_id(self) -> Dict[str, Dict[str, str]]:
+        return {d["id"]: d for d in self.devices}
+
+    def effective_devices(self) -> List[Dict[str, str]]:
+        """設定済みデバイスと検出済みプラグを合わせた収集対象"""
+        configured = self.configured if self.configured is not None else self.devices
+        if self.discovery is None:
+            return configured
+        return self.discovery.merge(configured)
+
+    def owned_devices(self) -> List[Dict[str, str]]:
+        """収集対象のうち、このレプリカが担当するデバイス"""
+        devices = self.effective_devices()
+        if self.sharder is None:
+            return devices
+        return self.sharder.assign(devices)
+
+    def rebuild_hierarchy(self) -> None:
+        """現在の設定と直近の値で階層集計を作り直す"""
+        if self.hierarchy is not None:
+            self.hierarchy.rebuild(
+                self.devices, {k: w for k, (w, _) in self.readings.items()}
+            )
+
+
+def set_reading(
+    state: ExporterState, device_id: str, watts: float, fetched_at: float
+) -> None:
+    """公開中の値を記録し、その経過時間をスクレイプ時に計算させる"""
+    state.readings[device_id] = (watts, fetched_at)
+    state.stale.discard(device_id)
+    SAMPLE_AGE.labels(device_id=device_id).set_function(
+        lambda: time.time() - fetched_at
+    )
+
+
+def drop_reading(state: ExporterState, device_id: str) -> None:
+    state.readings.pop(device_id, None)
+    state.written.pop(device_id, None)
+    state.stale.discard(device_id)
+    try:
+        SAMPLE_AGE.remove(device_id)
+    except KeyError:
+        pass
+
+
+def expire_stale(state: ExporterState, now: Optional[float] = None) -> int:
+    """失敗中のデバイスのうち、値が stale_max_age より古くなったものの系列を削除する"""
+    if not state.stale:
+        return 0
+    now = time.time() if now is None else now
+    by_id = state.devices_by_id
+    expired = 0
+    for device_id in list(state.stale):
+        reading = state.readings.get(device_id)
+        if reading is not None and now - reading[1] <= state.stale_max_age:
+            continue
+        device = by_id.get(device_id)
+        if device is not None:
+            try:
+                POWER_WATT.remove(*power_labels(device).values())
+            except KeyError:
+                pass
+        drop_reading(state, device_id)
+        if state.hierarchy is not None:
+            state.hierarchy.update(device_id, None)
+        logging.info(f"Device {device_id}: last reading expired")
+        expired += 1
+    return expired
+
+
+def restore_from_wal(state: ExporterState, max_age: float) -> int:
+    """WAL に残っている直近の値でゲージを復元する（再起動直後の再取得を避ける）"""
+    now = time.time()
+    last = state.wal.last_values(d["id"] for d in state.devices)
+    restored = 0
+    for device in state.devices:
+        record = last.get(device["id"])
+        if record is None or now - record.timestamp > max_age:
+            continue
+        POWER_WATT.labels(**power_labels(device)).set(record.watts)
+        DEVICE_UP.labels(device_id=device["id"]).set(1)
+        set_reading(state, device["id"], record.watts, record.timestamp)
+        if state.scheduler is not None:
+            state.scheduler.seed(device["id"], record.watts, record.timestamp)
+        restored += 1
+    return restored
+
+
+def snapshot_data(state: ExporterState) -> dict:
+    """終了時に保存する状態（直近の値・ブレーカー・レート制限とポーリング予定）"""
+    return {
+        "readings": {k: [w, ts] for k, (w, ts) in state.readings.items()},
+        "breakers": state.breakers.snapshot() if state.breakers is not None else {},
+        "scheduler": state.scheduler.snapshot() if state.scheduler is not None else {},
+    }
+
+
+def restore_snapshot(
+    state: ExporterState, data: dict, max_age: float, now: Optional[float] = None
+) -> int:
+    """
+    スナップショットからゲージと各コンポーネントの状態を復元する
+
+    max_age より古い電力値は公開しない。設定にないデバイスの状態は捨てる。
+    """
+    now = time.time() if now is None else now
+    by_id = state.devices_by_id
+    restored = 0
+    for device_id, (watts, fetched_at) in data.get("readings", {}).items():
+        device = by_id.get(device_id)
+        if device is None or now - fetched_at > max_age:
+            continue
+        POWER_WATT.labels(**power_labels(device)).set(watts)
+        DEVICE_UP.labels(device_id=device_id).set(1)
+        set_reading(state, device_id, watts, fetched_at)
+        restored += 1
+
+    if state.breakers is not None:
+        breakers = {k: v for k, v in data.get("breakers", {}).items() if k in by_id}
+        state.breakers.restore(breakers)
+        for device_id in breakers:
+            if state.breakers.is_open(device_id):
+                DEVICE_UP.labels(device_id=device_id).set(0)
+
+    if state.scheduler is not None:
+        scheduler = data.get("scheduler", {})
+        state.scheduler.restore(scheduler, now)
+        for account, budget in scheduler.get("budgets", {}).items():
+            if budget["remaining"] is None or (budget["reset_at"] or 0) <= now:
+                continue
+            ACCOUNT_REMAINING.labels(account=account).set(budget["remaining"])
+            if account == DEFAULT_ACCOUNT:
+                API_REMAINING.set(budget["remaining"])
+    return restored
+
+
+def build_wal_shipper(
+    state: ExporterState, replay_sink: Optional[PushSink]
+) -> Optional["WalShipper"]:
+    """
+    WAL の送信役を構築する
+
+    プッシュモードでは常に未送信分を送り、スクレイプ運用 (WAL_REPLAY_URL) では
+    VictoriaMetrics が停止していた間のレコードだけを復旧後に送る。
+    """
+    if state.wal is None or replay_sink is None:
+        return None
+    from src.wal import WalShipper
+
+    async def send(records: List["WalRecord"]) -> bool:
+        samples = wal_samples(records, state.devices_by_id)
+        return await replay_sink.send_samples(samples) if samples else True
+
+    health = None if replay_sink is state.sink else replay_sink.check_health
+    return WalShipper(state.wal, send, health=health)
+
+
+def process_results(
+    state: ExporterState, targets: List[Dict[str, str]], results: List[FetchResult]
+) -> None:
+    """取得結果をスケジューラ・WAL・プッシュ出力へ反映する"""
+    for r in results:
+        if r.ok:
+            set_reading(state, r.device_id, r.watts, r.fetched_at)
+            if state.profile is not None:
+                state.profile.mark_first_sample("fetched")
+        elif not r.down:
+            continue  # ブレーカーが開くまでは直近の値を使い続ける
+        elif state.stale_max_age > 0 and r.device_id in state.readings:
+            state.stale.add(r.device_id)  # 古くなるまで直近の値を公開し続ける
+            continue
+        else:
+            drop_reading(state, r.device_id)
+        if state.hierarchy is not None:
+            state.hierarchy.update(r.device_id, r.watts)
+
+    if state.scheduler is not None:
+        for r in results:
+            state.scheduler.observe_rate_limit(r.remaining, r.reset, r.account)
+            state.scheduler.record(r.device_id, r.watts)
+            interval = state.scheduler.interval_of(r.device_id)
+            if interval is not None:
+                POLL_INTERVAL.labels(device_id=r.device_id).set(interval)
+
+    if state.changes is not None:
+        mark_unchanged(state, results)
+
+    if state.energy is not None:
+        by_id = state.devices_by_id
+        for r in results:
+            if r.ok and r.device_id in by_id:
+                delta = state.energy.add(r.device_id, r.watts, r.fetched_at)
+                # 積算を始めたばかりのデバイスも 0 の系列として公開する
+                ENERGY_KWH.labels(**power_labels(by_id[r.device_id])).inc(delta)
+        state.energy.save()
+
+    if state.wal is not None:
+        for r in results:
+            if r.ok and r.changed:
+                state.wal.append(r.fetched_at, r.device_id, r.watts)
+        state.wal.sync()
+
+    if state.sink is not None:
+        # WAL がある場合、電力値は WAL 経由で送る
+        samples = result_samples(targets, results, include_power=state.wal is None)
+        if state.energy is not None:
+            samples += energy_samples(state, targets, results)
+        if state.hierarchy is not None and results:
+            samples += rollup_samples(state.hierarchy, time.time())
+        if state.changes is not None:
+            samples = state.changes.filter(samples)
+        state.sink.add(samples)
+
+
+def mark_unchanged(state: ExporterState, results: List[FetchResult]) -> None:
+    """
+    電力値が書き込み済みの値からデッドバンド内に収まっている結果に changed=False を付ける
+
+    プッシュ出力と WAL はこの印を見て書き込みを省く。
+    スクレイプでは、印の付いたデバイスのゲージを最後に書き込んだ値に戻し、
+    タイムスタンプもその取得時刻のままにする（timestamped_view）。
+    honor_timestamps の VictoriaMetrics は同じ (時刻, 値) を重複として捨てるため、
+    待機中のプラグはスクレイプしてもハートビートごとにしか保存されない。
+    """
+    by_id = state.devices_by_id
+    for r in results:
+        device = by_id.get(r.device_id)
+        if not r.ok or device is None:
+            continue
+        r.changed = state.changes.changed_sample(
+            Sample("switchbot_power_watts", power_labels(device), r.watts, r.fetched_at)
+        )
+        if r.changed or r.device_id not in state.written:
+            state.written[r.device_id] = (r.watts, r.fetched_at)
+        else:
+            POWER_WATT.labels(**power_labels(device)).set(state.written[r.device_id][0])
+
+
+def energy_samples(
+    state: ExporterState, targets: List[Dict[str, str]], results: List[FetchResult]
+) -> List[Sample]:
+    """取得できたデバイスの積算電力量をプッシュ用サンプルにする"""
+    by_id = {d["id"]: d for d in targets}
+    return [
+        Sample(
+            "switchbot_energy_kwh_total",
+            power_labels(by_id[r.device_id]),
+            state.energy.total(r.device_id),
+            r.fetched_at,
+        )
+        for r in results
+        if r.ok and r.device_id in by_id
+    ]
+
+
+def rollup_samples(hierarchy: HierarchyAggregator, ts: float) -> List[Sample]:
+    """階層集計の現在値をプッシュ用サンプルにする"""
+    samples: List[Sample] = []
+    if hierarchy.publish_groups:
+        samples.append(
+            Sample("switchbot_house_power_watts", {}, hierarchy.house.total, ts)
+        )
+        for room, group in hierarchy.rooms.items():
+            if group.known:
+                samples.append(
+                    Sample(
+                        "switchbot_room_power_watts", {"room": room}, group.total, ts
+                    )
+                )
+        for (room, shelf), group in hierarchy.shelves.items():
+            if group.known:
+                labels = {"room": room, "shelf": shelf}
+                samples.append(
+                    Sample("switchbot_shelf_power_watts", labels, group.total, ts)
+                )
+    for device_id, children in hierarchy.children.items():
+        total = hierarchy.subtree.get(device_id)
+        if not children or total is None:
+            continue
+        device = hierarchy.devices[device_id]
+        labels = {
+            "room": device["room"],
+            "shelf": device["shelf"],
+            "device_name": device["name"],
+            "device_id": device_id,
+        }
+        samples.append(Sample("switchbot_tap_power_watts", labels, total, ts))
+        if device_id in hierarchy.readings:
+            samples.append(
+                Sample(
+                    "switchbot_unaccounted_power_watts",
+                    labels,
+                    hierarchy.exclusive[device_id],
+                    ts,
+                )
+            )
+    return samples
+
+
+def forget_device(state: ExporterState, device: Dict[str, str]) -> None:
+    """設定から外れたデバイスの系列をすべて削除する"""
+    for metric, labels in (
+        (POWER_WATT, power_labels(device).values()),
+        (ENERGY_KWH, power_labels(device).values()),
+        (DEVICE_UP, (device["id"],)),
+        (POLL_INTERVAL, (device["id"],)),
+    ):
+        try:
+            metric.remove(*labels)
+        except KeyError:
+            pass
+    drop_reading(state, device["id"])
+    if state.energy is not None:
+        state.energy.forget(device["id"])
+    if state.breakers is not None:
+        state.breakers.forget([device["id"]])
+    if state.changes is not None:
+        state.changes.forget(device["id"])
+
+
+def sync_shard_budgets(state: ExporterState) -> None:
+    """同じアカウントを使うレプリカの数で API 予算を等分する"""
+    if state.sharder is not None and state.scheduler is not None:
+        shares = state.sharder.account_shares(state.effective_devices())
+        state.scheduler.set_shares(shares)
+
+
+def apply_config_change(
+    state: ExporterState, devices: List[Dict[str, str]]
+) -> ConfigDiff:
+    """
+    新しいデバイス設定を差分で適用する
+
+    削除されたデバイスの系列を消し、ラベルが変わったデバイスは直近の値を新しいラベルへ移す。
+    それ以外のデバイスのゲージやポーリング予定には触れない。
+    追加されたデバイスは次のサイクルでスケジューラに取り込まれ、すぐに取得される。
+    """
+    diff = diff_devices(state.devices, devices)
+    state.devices = devices
+    if not diff.changed:
+        return diff
+
+    for device in diff.removed:
+        forget_device(state, device)
+    for old, new in diff.relabelled:
+        for metric in (POWER_WATT, ENERGY_KWH):
+            try:
+                metric.remove(*power_labels(old).values())
+            except KeyError:
+                pass
+        if state.energy is not None and new["id"] in state.energy.devices:
+            ENERGY_KWH.labels(**power_labels(new)).inc(state.energy.total(new["id"]))
+        reading = state.readings.get(new["id"])
+        if reading is not None:
+            POWER_WATT.labels(**power_labels(new)).set(reading[0])
+        if state.changes is not None:
+            state.changes.forget(old["id"])  # 新しいラベルの系列は最初の値から書き込む
+    if state.scheduler is not None:
+        state.scheduler.sync(
+            (d["id"] for d in devices),
+            {d["id"]: d.get("account", DEFAULT_ACCOUNT) for d in devices},
+        )
+    # 親子関係が変わりうるため、階層集計は差分ではなく作り直す
+    state.rebuild_hierarchy()
+    logging.info(f"Device config reloaded: {diff.summary()}")
+    return diff
+
+
+async def run_cycle(state: ExporterState) -> float:
+    """1 サイクル分の収集を行い、次のサイクルまでの待ち時間を返す"""
+    started = time.perf_counter()
+    changed = False
+    if state.watcher is not None:
+        devices = state.watcher.poll()
+        if devices is not None:
+            state.configured = devices
+            changed = True
+    if state.discovery is not None and await refresh_discovery(state):
+        changed = True
+    if state.sharder is not None and await state.sharder.refresh():
+        changed = True
+    if changed:
+        apply_config_change(state, state.owned_devices())
+        sync_shard_budgets(state)
+
+    scheduler = state.scheduler
+    targets = scheduler.due(state.devices) if scheduler is not None else state.devices
+    sleep_for = state.collection_interval
+
+    if state.breakers is not None:
+        # ブレーカーが開いているデバイスは API を呼ばない
+        targets = state.breakers.filter(targets)
+
+    if targets:
+        results = await collect_metrics(
+            targets,
+            state.pool,
+            state.client,
+            state.breakers,
+            keep_stale=state.stale_max_age > 0,
+            accounts=state.accounts,
+        )
+        process_results(state, targets, results)
+        if state.sink is not None:
+            state.sink.maybe_flush()
+    expire_stale(state)
+    if state.exposition is not None:
+        state.exposition.invalidate()  # このサイクルの値を次のスクレイプから公開する
+    if scheduler is not None:
+        sleep_for = min(sleep_for, max(scheduler.seconds_until_next_due(), 1.0))
+
+    elapsed = time.perf_counter() - started
+    CYCLE_DURATION.observe(elapsed)
+    if elapsed > state.collection_interval:
+        CYCLE_OVERRUNS.inc()
+        logging.warning(
+            f"Collection cycle took {elapsed:.1f}s "
+            f"(COLLECTION_INTERVAL={state.collection_interval:.0f}s)"
+        )
+    logging.info(
+        f"Metrics collection completed ({len(targets)}/{len(state.devices)} devices). "
+        f"Next run in {sleep_for:.0f}s"
+    )
+    return sleep_for
+
+
+def expire_and_invalidate(state: ExporterState) -> None:
+    if expire_stale(state) and state.exposition is not None:
+        state.exposition.invalidate()
+
+
+async def refresh_in_background(
+    state: ExporterState, tick: float = 1.0, stop: Optional[asyncio.Event] = None
+) -> None:
+    """
+    収集サイクルをバックグラウンドのタスクとして実行する
+
+    サイクルの実行中も待機中も tick ごとに古い値の失効を確認するため、
+    長いサイクルの間に値の鮮度の上限を超えて公開し続けることがない。
+    stop がセットされたら、実行中のサイクルを終えてから戻る。
+    """
+    while stop is None or not stop.is_set():
+        task = asyncio.create_task(run_cycle(state))
+        try:
+            while not task.done():
+                await asyncio.wait({task}, timeout=tick)
+                expire_and_invalidate(state)
+        finally:
+            task.cancel()
+        try:
+            sleep_for = task.result()
+        except Exception as e:
+            logging.error(f"Error in metrics collection: {e}")
+            sleep_for = state.collection_interval
+
+        slept_from = time.monotonic()
+        deadline = slept_from + sleep_for
+        while (remaining := deadline - time.monotonic()) > 0:
+            if stop is not None and stop.is_set():
+                break
+            await asyncio.sleep(min(tick, remaining))
+            expire_and_invalidate(state)
+        SLEEP_SECONDS.inc(time.monotonic() - slept_from)
+
+
+def timestamped_view(state: ExporterState) -> TimestampedView:
+    """電力と積算電力量のサンプルに取得時刻を、積算カウンタに積算開始時刻を付ける"""
+
+    def fetched_at(labels: Dict[str, str]) -> Optional[float]:
+        device_id = labels.get("device_id")
+        # 変化検出で書き込みを省いた値は、最後に書き込んだ時刻のまま公開する
+        reading = state.written.get(device_id) or state.readings.get(device_id)
+        return reading[1] if reading is not None else None
+
+    def energy_state(labels: Dict[str, str]):
+        if state.energy is None:
+            return None
+        return state.energy.devices.get(labels.get("device_id"))
+
+    def energy_updated_at(labels: Dict[str, str]) -> Optional[float]:
+        energy = energy_state(labels)
+        return energy.last_ts if energy is not None else None
+
+    def energy_created(labels: Dict[str, str]) -> Optional[float]:
+        energy = energy_state(labels)
+        return energy.created if energy is not None and energy.created else None
+
+    return TimestampedView(
+        REGISTRY,
+        timestamps={
+            "switchbot_power_watts": fetched_at,
+            "switchbot_energy_kwh": energy_updated_at,
+        },
+        created={"switchbot_energy_kwh": energy_created},
+    )
+
+
+def start_exposition(state: ExporterState, port: int) -> None:
+    """環境変数に従って /metrics を公開する"""
+    registry = REGISTRY
+    if os.getenv("METRICS_TIMESTAMPS", "false").lower() in ("1", "true", "yes"):
+        registry = timestamped_view(state)
+    if os.getenv("METRICS_CACHE", "true").lower() in ("1", "true", "yes"):
+        state.exposition = ExpositionCache(
+            registry, ttl=float(os.getenv("METRICS_CACHE_TTL", "0"))
+        )
+        start_metrics_server(port, state.exposition)
+    else:
+        start_http_server(port, registry=registry)
+
+
+async def sleep_unless_stopped(stop: asyncio.Event, seconds: float) -> None:
+    """seconds 秒待つ。途中で stop がセットされたらすぐに戻る"""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout=seconds)
+    except asyncio.TimeoutError:
+        pass
+
+
+async def run_periodically(fn, interval: float, name: str) -> None:
+    """fn を interval 秒ごとに実行するバックグラウンドループ"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await fn()
+        except Exception as e:
+            logging.error(f"Error in {name}: {e}")
 
 
 async def main_loop() -> None:
     """
     メインアプリケーションループ
     """
+    profile = StartupProfile(
+        log=os.getenv("STARTUP_PROFILE", "false").lower() in ("1", "true", "yes")
+    )
     # 環境変数の読み込み
     metrics_port = int(os.getenv("METRICS_PORT", "8000"))
     collection_interval = int(os.getenv("COLLECTION_INTERVAL", "60"))
@@ -178,26 +1158,167 @@ async def main_loop() -> None:
     )
 
     # デバイス設定の読み込み
-    devices = load_device_config(config_path)
+    with profile.phase("config"):
+        devices = load_device_config(config_path)
+        accounts = load_accounts()
     logging.info(f"Loaded {len(devices)} devices from config")
 
-    # Prometheusメトリクスサーバーの開始
-    start_http_server(metrics_port)
-    logging.info(f"Prometheus metrics server started on port {metrics_port}")
-
     logging.info("✅ REAL API MODE - Using actual SwitchBot API")
 
-    # メインループ
-    while True:
-        try:
-            await collect_metrics(devices)
-            logging.info(
-                f"Metrics collection completed. Next run in {collection_interval}s"
+    with profile.phase("init"):
+        pool = build_fetch_pool()
+        state = ExporterState(
+            devices=devices,
+            pool=pool,
+            # HTTP クライアントは exporter の生存期間中ずっと使い回す
+            client=build_client_from_env(pool.concurrency),
+            collection_interval=float(collection_interval),
+            scheduler=build_scheduler(collection_interval),
+            sink=build_push_sink(),
+            wal=build_wal(),
+            energy=build_energy(),
+            breakers=build_breakers(),
+            stale_max_age=float(os.getenv("STALE_MAX_AGE", "0")),
+            discovery=build_discovery(),
+            sharder=build_sharder(),
+            changes=build_change_detector(),
+            accounts=accounts,
+            configured=devices,
+            profile=profile,
+        )
+
+    if state.discovery is not None:
+        # キャッシュが新しければ起動時には一覧 API を呼ばない
+        state.devices = devices = state.effective_devices()
+        logging.info(
+            f"Device discovery enabled (TTL: {state.discovery.ttl:.0f}s, "
+            f"{len(devices)} devices incl. cached plugs)"
+        )
+    if len(state.accounts) > 1:
+        logging.info(f"Using {len(state.accounts)} SwitchBot accounts")
+    if state.sharder is not None:
+        state.devices = devices = state.owned_devices()
+        logging.info(
+            f"Sharding enabled as {state.sharder.member_id}: "
+            f"{len(devices)} devices of {len(state.effective_devices())}"
+        )
+        sync_shard_budgets(state)
+    if os.getenv("HIERARCHY_ROLLUPS", "true").lower() in ("1", "true", "yes"):
+        # 分担中の棚・部屋・家全体の合計は部分和になるため公開しない
+        state.hierarchy = HierarchyAggregator(
+            devices, publish_groups=state.sharder is None
+        )
+    if os.getenv("CONFIG_RELOAD", "true").lower() in ("1", "true", "yes"):
+        state.watcher = DeviceConfigWatcher(config_path, load_device_config)
+    if state.scheduler is not None:
+        logging.info(
+            f"Adaptive polling enabled (daily limit: {state.scheduler.daily_limit})"
+        )
+
+    background = []
+    if state.sink is not None:
+        background.append(asyncio.create_task(state.sink.run()))
+        logging.info(f"Push mode enabled: {state.sink.url}")
+
+    replay_sink = state.sink
+    if replay_sink is None and os.getenv("WAL_REPLAY_URL", "").strip():
+        replay_sink = PushSink(os.getenv("WAL_REPLAY_URL").strip())
+    shipper = build_wal_shipper(state, replay_sink)
+
+    with profile.phase("restore"):
+        restore_energy(state)
+        snapshot_path = os.getenv("SNAPSHOT_PATH", "").strip()
+        if snapshot_path:
+            from src.snapshot import load_snapshot, save_snapshot
+
+            snapshot = load_snapshot(snapshot_path)
+            if snapshot is not None:
+                restored = restore_snapshot(
+                    state, snapshot, float(os.getenv("SNAPSHOT_MAX_AGE", "900"))
+                )
+                logging.info(
+                    f"Snapshot restored from {snapshot_path} ({restored} readings)"
+                )
+        if state.wal is not None:
+            restored = restore_from_wal(
+                state, float(os.getenv("WAL_RESTORE_MAX_AGE", "900"))
             )
-        except Exception as e:
-            logging.error(f"Error in metrics collection: {e}")
+            logging.info(f"WAL enabled: {state.wal.directory} (restored {restored})")
+        state.rebuild_hierarchy()
+    if shipper is not None:
+        background.append(
+            asyncio.create_task(
+                run_periodically(
+                    shipper.run_once,
+                    float(os.getenv("WAL_SHIP_INTERVAL", "15")),
+                    "WAL shipping",
+                )
+            )
+        )
+
+    # SIGTERM（Pod の停止）では実行中のサイクルを終えてから終了処理に進む
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+
+    # 最初のサイクルはメトリクスサーバーの起動を待たずに始め、API の応答待ちと重ねる
+    background_refresh = os.getenv("BACKGROUND_REFRESH", "false").lower() in (
+        "1",
+        "true",
+        "yes",
+    )
+    cycle = None
+    if not background_refresh:
+        cycle = asyncio.create_task(run_cycle(state))
+        background.append(cycle)  # 起動途中で失敗したときに後始末する
+        await asyncio.sleep(0)
+
+    # Prometheusメトリクスサーバーの開始（プッシュ専用運用では無効化できる）
+    if os.getenv("METRICS_SERVER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        with profile.phase("metrics_server"):
+            start_exposition(state, metrics_port)
+        logging.info(f"Prometheus metrics server started on port {metrics_port}")
+        if state.readings:
+            profile.mark_first_sample("restored")
+
+    try:
+        if background_refresh:
+            await refresh_in_background(state, stop=stop)
+
+        # メインループ
+        while not stop.is_set():
+            sleep_for = float(collection_interval)
+            try:
+                sleep_for = await (cycle or run_cycle(state))
+            except Exception as e:
+                logging.error(f"Error in metrics collection: {e}")
+            cycle = None
 
-        await asyncio.sleep(collection_interval)
+            slept_from = time.monotonic()
+            await sleep_unless_stopped(stop, sleep_for)
+            SLEEP_SECONDS.inc(time.monotonic() - slept_from)
+        logging.info("Shutdown requested; in-flight fetches drained")
+    finally:
+        if snapshot_path:
+            save_snapshot(snapshot_path, snapshot_data(state))
+            logging.info(f"Snapshot saved to {snapshot_path}")
+        for task in background:
+            task.cancel()
+        # 送信中だったバッチが sink に戻ってから close() で送り直す
+        await asyncio.gather(*background, return_exceptions=True)
+        await state.client.aclose()
+        logging.info("HTTP client closed")
+        if shipper is not None and shipper.health is None:
+            await shipper.ship_pending()
+        if state.wal is not None:
+            state.wal.close()
+        state.energy.save()
+        if state.sink is not None:
+            await state.sink.close()
+            logging.info("Push output flushed")
+        if replay_sink is not None and replay_sink is not state.sink:
+            await replay_sink.close()
 
 
 if __name__ == "__main__":
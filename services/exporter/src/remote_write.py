@@ -0,0 +1,255 @@
+"""
+VictoriaMetrics へのプッシュ出力
+
+スクレイプを待たず、取得時刻付きのサンプルをまとめて import エンドポイント
+(`/api/v1/import/prometheus`) に gzip 圧縮して送る。
+送信に失敗したバッチはディスク上のバッファ（容量上限付き、古いものから破棄）に退避し、
+次回の送信成功時にまとめて再送する。
+送信はバックグラウンドの run() だけが行うため、送信先の障害やリトライの待ち時間で
+収集サイクルが止まることはない。
+"""
+
+import asyncio
+import gzip
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+
+import httpx
+from prometheus_client import Counter, Gauge
+
+PUSH_SAMPLES = Counter(
+    "switchbot_push_samples_total",
+    "Samples handled by the push output",
+    ["result"],  # sent / buffered / dropped
+)
+
+PUSH_BUFFER_BYTES = Gauge(
+    "switchbot_push_buffer_bytes", "Bytes of unsent batches kept in the disk buffer"
+)
+
+
+@dataclass
+class Sample:
+    """タイムスタンプ付きの 1 サンプル"""
+
+    name: str
+    labels: Dict[str, str]
+    value: float
+    timestamp: float  # epoch 秒
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def encode_samples(samples: Iterable[Sample]) -> bytes:
+    """Prometheus テキスト形式（ミリ秒タイムスタンプ付き）にエンコードする"""
+    lines = []
+    for s in samples:
+        labels = ",".join(f'{k}="{_escape(str(v))}"' for k, v in s.labels.items())
+        lines.append(f"{s.name}{{{labels}}} {s.value!r} {int(s.timestamp * 1000)}\n")
+    return "".join(lines).encode()
+
+
+class DiskBuffer:
+    """送信できなかった gzip 済みペイロードを保存する容量上限付きバッファ"""
+
+    SUFFIX = ".prom.gz"
+
+    def __init__(self, directory: str, max_bytes: int) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._update_gauge()
+
+    def _files(self) -> List[str]:
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(self.SUFFIX))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def size(self) -> int:
+        return sum(os.path.getsize(p) for p in self._files())
+
+    def _update_gauge(self) -> None:
+        PUSH_BUFFER_BYTES.set(self.size())
+
+    def put(self, payload: bytes, sample_count: int) -> None:
+        """ペイロードを保存し、上限を超えたら古いものから削除する"""
+        name = f"{time.time_ns():020d}-{sample_count}{self.SUFFIX}"
+        path = os.path.join(self.directory, name)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+        files = self._files()
+        total = sum(os.path.getsize(p) for p in files)
+        while total > self.max_bytes and files:
+            oldest = files.pop(0)
+            total -= os.path.getsize(oldest)
+            dropped = int(os.path.basename(oldest).split("-")[1].split(".")[0])
+            os.remove(oldest)
+            PUSH_SAMPLES.labels(result="dropped").inc(dropped)
+            logging.warning(f"Push buffer full. Dropped {oldest}")
+        self._update_gauge()
+
+    def pending(self) -> List[str]:
+        return self._files()
+
+    def remove(self, path: str) -> None:
+        os.remove(path)
+        self._update_gauge()
+
+
+class PushSink:
+    """サンプルをバッチにまとめて VictoriaMetrics に送る"""
+
+    def __init__(
+        self,
+        url: str,
+        batch_size: int = 1000,
+        flush_interval: float = 10.0,
+        buffer: Optional[DiskBuffer] = None,
+        max_retries: int = 3,
+        timeout: float = 10.0,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = buffer
+        self.max_retries = max_retries
+        self._client = client or httpx.AsyncClient(timeout=timeout)
+        self._batch: List[Sample] = []
+        self._lock = asyncio.Lock()
+        self._wake = asyncio.Event()  # バッチサイズに達したら run() を起こす
+
+    def add(self, samples: Iterable[Sample]) -> None:
+        self._batch.extend(samples)
+
+    @property
+    def pending_samples(self) -> int:
+        return len(self._batch)
+
+    async def _send(self, payload: bytes) -> bool:
+        """gzip 済みペイロードを送信する。リトライしても届かなければ False"""
+        for attempt in range(self.max_retries):
+            try:
+                resp = await self._client.post(
+                    self.url,
+                    content=payload,
+                    headers={"Content-Encoding": "gzip"},
+                )
+                if resp.status_code < 300:
+                    return True
+                if resp.status_code < 500 and resp.status_code != 429:
+                    # 4xx はデータ側の問題なので再送しない
+                    logging.error(
+                        f"Push rejected ({resp.status_code}): {resp.text[:200]}"
+                    )
+                    return True
+                logging.warning(f"Push failed with HTTP {resp.status_code}")
+            except httpx.HTTPError as e:
+                logging.warning(f"Push failed: {e}")
+            if attempt + 1 < self.max_retries:
+                await asyncio.sleep(0.5 * 2**attempt)
+        return False
+
+    async def send_samples(self, samples: List[Sample]) -> bool:
+        """バッチを経由せずにサンプルを直接送信する（WAL の再送用）"""
+        payload = gzip.compress(encode_samples(samples), compresslevel=6)
+        if await self._send(payload):
+            PUSH_SAMPLES.labels(result="sent").inc(len(samples))
+            return True
+        return False
+
+    async def check_health(self) -> bool:
+        """送信先の /health が応答するか確認する"""
+        health_url = httpx.URL(self.url).copy_with(path="/health", query=None)
+        try:
+            resp = await self._client.get(health_url, timeout=5.0)
+        except httpx.HTTPError:
+            return False
+        return resp.status_code == 200
+
+    async def flush(self) -> None:
+        """溜まっているサンプルを送信し、成功したらディスクバッファも再送する"""
+        async with self._lock:
+            batch, self._batch = self._batch, []
+            if batch:
+                payload = gzip.compress(encode_samples(batch), compresslevel=6)
+                try:
+                    sent = await self._send(payload)
+                except asyncio.CancelledError:
+                    # 送信中に止められた: 次のフラッシュ（終了時の close など）で送り直す
+                    self._batch[:0] = batch
+                    raise
+                if sent:
+                    PUSH_SAMPLES.labels(result="sent").inc(len(batch))
+                elif self.buffer is not None:
+                    self.buffer.put(payload, len(batch))
+                    PUSH_SAMPLES.labels(result="buffered").inc(len(batch))
+                    return
+                else:
+                    PUSH_SAMPLES.labels(result="dropped").inc(len(batch))
+                    return
+
+            if self.buffer is not None:
+                await self._drain_buffer()
+
+    async def _drain_buffer(self) -> None:
+        for path in self.buffer.pending():
+            with open(path, "rb") as f:
+                payload = f.read()
+            if not await self._send(payload):
+                return
+            self.buffer.remove(path)
+            logging.info(f"Replayed buffered push batch: {os.path.basename(path)}")
+
+    async def run(self) -> None:
+        """flush_interval ごと（バッチサイズに達したときはすぐ）にフラッシュするループ"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Error in push flush: {e}")
+
+    def maybe_flush(self) -> None:
+        """バッチサイズに達していれば run() にフラッシュさせる（送信の完了は待たない）"""
+        if len(self._batch) >= self.batch_size:
+            self._wake.set()
+
+    async def close(self) -> None:
+        """残りのサンプルを送信してクライアントを閉じる"""
+        try:
+            await self.flush()
+        finally:
+            await self._client.aclose()
+
+
+def build_push_sink() -> Optional[PushSink]:
+    """環境変数からプッシュ出力を構築する（PUSH_URL 未設定なら None）"""
+    url = os.getenv("PUSH_URL", "").strip()
+    if not url:
+        return None
+    buffer_dir = os.getenv("PUSH_BUFFER_DIR", "").strip()
+    buffer = (
+        DiskBuffer(
+            buffer_dir, int(os.getenv("PUSH_BUFFER_MAX_BYTES", str(64 * 1024 * 1024)))
+        )
+        if buffer_dir
+        else None
+    )
+    return PushSink(
+        url,
+        batch_size=int(os.getenv("PUSH_BATCH_SIZE", "1000")),
+        flush_interval=float(os.getenv("PUSH_INTERVAL", "10")),
+        buffer=buffer,
+    )
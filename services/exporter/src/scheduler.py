@@ -0,0 +1,249 @@
+"""
+レート制限を考慮した適応ポーリングスケジューラ
+
+SwitchBot API は 1 日 10,000 回の呼び出し制限がある。
+残り回数 (x-ratelimit-remaining) とリセット時刻 (x-ratelimit-reset) から
+「リセットまでに使ってよい呼び出しレート」を求め、デバイスごとのポーリング周期に配分する。
+電力変動の大きいデバイスほど多くの予算を受け取る。
+複数アカウントを使う場合、予算はアカウントごとに独立して管理する。
+複数レプリカで分担している場合、同じアカウントを使うレプリカの数で予算を等分する。
+"""
+
+import time
+import datetime
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, List, Optional
+
+DEFAULT_DAILY_LIMIT = 10000
+DAY_SECONDS = 86400.0
+DEFAULT_ACCOUNT = "default"
+
+
+@dataclass
+class _DeviceState:
+    """デバイスごとのスケジューリング状態"""
+
+    next_due: float = 0.0
+    interval: float = 0.0
+    last_watts: Optional[float] = None
+    activity: float = 0.0  # |Δwatts| の指数移動平均
+    account: str = DEFAULT_ACCOUNT
+
+
+@dataclass
+class _Budget:
+    """アカウントごとのレート制限の観測値"""
+
+    remaining: Optional[int] = None
+    reset_at: Optional[float] = None
+
+
+def parse_reset_header(value) -> Optional[float]:
+    """x-ratelimit-reset ヘッダー (epoch ミリ秒) を epoch 秒に変換する"""
+    if value is None:
+        return None
+    try:
+        reset = float(value)
+    except (TypeError, ValueError):
+        return None
+    # 秒で返ってきた場合にも対応する（ミリ秒なら 13 桁）
+    return reset / 1000.0 if reset > 1e11 else reset
+
+
+def _next_utc_midnight(now: float) -> float:
+    dt = datetime.datetime.fromtimestamp(now, tz=datetime.timezone.utc)
+    midnight = (dt + datetime.timedelta(days=1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    return midnight.timestamp()
+
+
+class AdaptivePollScheduler:
+    """
+    残り API 予算をリセットまで持たせるようにデバイスごとのポーリング周期を決める
+
+    - 利用可能レート = (remaining - reserve) / (reset - now)
+    - デバイス i の重み w_i = 1 + activity_i / mean(activity)（max_boost で上限）
+    - 周期 T_i = Σw / (rate * w_i) を [min_interval, max_interval] に丸める
+    """
+
+    def __init__(
+        self,
+        daily_limit: int = DEFAULT_DAILY_LIMIT,
+        reserve: int = 100,
+        min_interval: float = 60.0,
+        max_interval: float = 900.0,
+        activity_alpha: float = 0.3,
+        max_boost: float = 10.0,
+    ) -> None:
+        self.daily_limit = daily_limit
+        self.reserve = reserve
+        self.min_interval = min_interval
+        self.max_interval = max(max_interval, min_interval)
+        self.activity_alpha = activity_alpha
+        self.max_boost = max_boost
+
+        self._budgets: Dict[str, _Budget] = {}
+        # account -> そのアカウントのデバイスを分担しているレプリカ数
+        self._shares: Dict[str, int] = {}
+        self._states: Dict[str, _DeviceState] = {}
+
+    @property
+    def remaining(self) -> Optional[int]:
+        return self._budgets.get(DEFAULT_ACCOUNT, _Budget()).remaining
+
+    # --- 入力 ---
+    def observe_rate_limit(
+        self, remaining, reset=None, account: str = DEFAULT_ACCOUNT
+    ) -> None:
+        """レスポンスヘッダーから得たレート制限情報を取り込む"""
+        budget = self._budgets.setdefault(account, _Budget())
+        if remaining is not None:
+            try:
+                budget.remaining = int(remaining)
+            except (TypeError, ValueError):
+                pass
+        reset_at = parse_reset_header(reset)
+        if reset_at is not None:
+            budget.reset_at = reset_at
+
+    def record(self, device_id: str, watts: Optional[float]) -> None:
+        """取得結果を記録し、電力変動の大きさ (activity) を更新する"""
+        state = self._states.setdefault(device_id, _DeviceState())
+        if watts is None:
+            return
+        if state.last_watts is not None:
+            delta = abs(watts - state.last_watts)
+            a = self.activity_alpha
+            state.activity = (1 - a) * state.activity + a * delta
+        state.last_watts = watts
+
+    def seed(self, device_id: str, watts: float, fetched_at: float) -> None:
+        """再起動前の取得結果から状態を復元し、直ちに再取得しないようにする"""
+        state = self._states.setdefault(device_id, _DeviceState())
+        state.last_watts = watts
+        state.next_due = max(state.next_due, fetched_at + self.min_interval)
+
+    def snapshot(self) -> dict:
+        """再起動をまたいで引き継ぐ状態（予算と各デバイスの予定）"""
+        return {
+            "budgets": {k: asdict(v) for k, v in self._budgets.items()},
+            "devices": {k: asdict(v) for k, v in self._states.items()},
+        }
+
+    def restore(self, data: dict, now: Optional[float] = None) -> None:
+        """snapshot() の内容を取り込む。リセット時刻を過ぎた予算は捨てる"""
+        now = time.time() if now is None else now
+        for account, values in data.get("budgets", {}).items():
+            budget = _Budget(**values)
+            if budget.reset_at is not None and budget.reset_at > now:
+                self._budgets[account] = budget
+        for device_id, values in data.get("devices", {}).items():
+            self._states[device_id] = _DeviceState(**values)
+
+    def sync(
+        self, device_ids: Iterable[str], accounts: Optional[Dict[str, str]] = None
+    ) -> None:
+        """対象デバイス集合を更新する（既存デバイスの予定はそのまま）"""
+        wanted = set(device_ids)
+        for device_id in list(self._states):
+            if device_id not in wanted:
+                del self._states[device_id]
+        for device_id in wanted:
+            state = self._states.setdefault(device_id, _DeviceState())
+            if accounts is not None:
+                state.account = accounts.get(device_id, DEFAULT_ACCOUNT)
+
+    def set_shares(self, shares: Dict[str, int]) -> None:
+        """アカウントごとに予算を分け合うレプリカ数を設定する（ないアカウントは 1）"""
+        self._shares = {k: max(int(v), 1) for k, v in shares.items()}
+
+    # --- 計算 ---
+    def _budget(self, now: float, account: str = DEFAULT_ACCOUNT) -> tuple:
+        """(このレプリカが使用可能な呼び出し回数, リセットまでの秒数) を返す"""
+        share = self._shares.get(account, 1)
+        budget = self._budgets.get(account)
+        if budget is None or budget.remaining is None:
+            return float(self.daily_limit - self.reserve) / share, DAY_SECONDS
+
+        reset_at = budget.reset_at
+        if reset_at is None or reset_at <= now:
+            reset_at = _next_utc_midnight(now)
+        calls = float(budget.remaining - self.reserve) / share
+        return calls, max(reset_at - now, 1.0)
+
+    def calls_per_second(
+        self, now: Optional[float] = None, account: str = DEFAULT_ACCOUNT
+    ) -> float:
+        """リセットまで予算を持たせるための全体呼び出しレート"""
+        now = time.time() if now is None else now
+        calls, window = self._budget(now, account)
+        return max(calls, 0.0) / window
+
+    def intervals(self, now: Optional[float] = None) -> Dict[str, float]:
+        """デバイスごとのポーリング周期（秒）を計算する"""
+        now = time.time() if now is None else now
+        groups: Dict[str, Dict[str, _DeviceState]] = {}
+        for device_id, state in self._states.items():
+            groups.setdefault(state.account, {})[device_id] = state
+
+        result: Dict[str, float] = {}
+        for account, states in groups.items():
+            result.update(self._account_intervals(states, *self._budget(now, account)))
+        return result
+
+    def _account_intervals(
+        self, states: Dict[str, _DeviceState], calls: float, window: float
+    ) -> Dict[str, float]:
+        """1 アカウント分の予算をそのアカウントのデバイスに配分する"""
+        if calls <= 0:
+            # 予算切れ: リセットまで待つ
+            return {device_id: window for device_id in states}
+
+        rate = calls / window
+        activities = [s.activity for s in states.values()]
+        mean_activity = sum(activities) / len(activities)
+
+        weights: Dict[str, float] = {}
+        for device_id, state in states.items():
+            boost = state.activity / mean_activity if mean_activity > 0 else 0.0
+            weights[device_id] = 1.0 + min(boost, self.max_boost)
+        total_weight = sum(weights.values())
+
+        return {
+            device_id: min(
+                max(total_weight / (rate * w), self.min_interval), self.max_interval
+            )
+            for device_id, w in weights.items()
+        }
+
+    def due(
+        self, devices: List[Dict[str, str]], now: Optional[float] = None
+    ) -> List[Dict[str, str]]:
+        """今回のサイクルで取得すべきデバイスを返し、次回予定を確定する"""
+        now = time.time() if now is None else now
+        self.sync(
+            (d["id"] for d in devices),
+            {d["id"]: d.get("account", DEFAULT_ACCOUNT) for d in devices},
+        )
+        intervals = self.intervals(now)
+
+        selected = []
+        for device in devices:
+            state = self._states[device["id"]]
+            state.interval = intervals[device["id"]]
+            if state.next_due <= now:
+                state.next_due = now + state.interval
+                selected.append(device)
+        return selected
+
+    def seconds_until_next_due(self, now: Optional[float] = None) -> float:
+        """最も早く期限が来るデバイスまでの秒数"""
+        now = time.time() if now is None else now
+        if not self._states:
+            return self.min_interval
+        return max(min(s.next_due for s in self._states.values()) - now, 0.0)
+
+    def interval_of(self, device_id: str) -> Optional[float]:
+        state = self._states.get(device_id)
+        return state.interval if state else None
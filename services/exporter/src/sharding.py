@@ -0,0 +1,189 @@
+"""
+複数レプリカでのデバイスの分担（コンシステントハッシュ）
+
+各レプリカはハッシュリング上で自分が担当するデバイスだけを取得するため、
+同じデバイスを 2 つのレプリカがポーリングすることはない。
+レプリカの増減で担当が変わるのは、リング上で隣り合う一部のデバイスだけである。
+
+分担のキーはデバイスの最上位の祖先（parent_id をたどった先）なので、
+タップとその配下のデバイスは必ず同じレプリカに載り、タップ単位の集計が崩れない。
+
+メンバーの決め方は 2 通り:
+- 固定: StatefulSet の Pod 名（<name>-0 .. <name>-N-1）や明示したメンバー一覧
+- 動的: ヘッドレス Service の DNS（A レコード）を定期的に引き直す
+
+API の 1 日の呼び出し上限はアカウント単位なので、同じアカウントのデバイスを
+分担しているレプリカの数（account_shares）で予算を等分する。
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import re
+import socket
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from prometheus_client import Gauge
+
+from src.scheduler import DEFAULT_ACCOUNT
+
+SHARD_DEVICES = Gauge(
+    "switchbot_shard_devices", "Devices assigned to this exporter replica"
+)
+
+SHARD_MEMBERS = Gauge(
+    "switchbot_shard_members", "Exporter replicas currently sharing the devices"
+)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """仮想ノード付きのコンシステントハッシュリング"""
+
+    def __init__(self, members: Iterable[str], vnodes: int = 64) -> None:
+        self.members = sorted(set(members))
+        self.vnodes = max(vnodes, 1)
+        points = sorted(
+            (_hash(f"{member}#{i}"), member)
+            for member in self.members
+            for i in range(self.vnodes)
+        )
+        self._keys = [p for p, _ in points]
+        self._owners = [m for _, m in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._owners[index]
+
+
+def shard_key(device: Dict[str, str], by_id: Dict[str, Dict[str, str]]) -> str:
+    """デバイスの最上位の祖先の ID（循環していればたどれたところまで）"""
+    seen = {device["id"]}
+    current = device
+    while True:
+        parent = by_id.get(current.get("parent_id", "none"))
+        if parent is None or parent["id"] in seen:
+            return current["id"]
+        seen.add(parent["id"])
+        current = parent
+
+
+def statefulset_members(hostname: str, replicas: int) -> List[str]:
+    """StatefulSet の Pod 名 (<name>-<ordinal>) からレプリカ全員の名前を作る"""
+    match = re.fullmatch(r"(.+)-\d+", hostname)
+    if match is None:
+        raise ValueError(f"{hostname} is not a StatefulSet pod name")
+    return [f"{match.group(1)}-{i}" for i in range(replicas)]
+
+
+def resolve_peers(dns_name: str) -> List[str]:
+    """ヘッドレス Service の A レコード（= 各 Pod の IP）を引く"""
+    return sorted(set(socket.gethostbyname_ex(dns_name)[2]))
+
+
+class DeviceSharder:
+    """自レプリカが担当するデバイスを決める"""
+
+    def __init__(
+        self,
+        member_id: str,
+        members: Iterable[str] = (),
+        vnodes: int = 64,
+        resolve: Optional[Callable[[], List[str]]] = None,
+        refresh_interval: float = 30.0,
+        handoff_delay: Optional[float] = None,
+    ) -> None:
+        self.member_id = member_id
+        self.ring = HashRing(members, vnodes)
+        self.vnodes = vnodes
+        self.resolve = resolve
+        self.refresh_interval = refresh_interval
+        # 他のレプリカから引き継いだデバイスは、相手がメンバー変更に気付くまで取得しない
+        self.handoff_delay = (
+            refresh_interval if handoff_delay is None else handoff_delay
+        )
+        self._next_refresh = 0.0
+        self._seen: Set[str] = set()  # 前回の assign で見たデバイス
+        self._owned: Set[str] = set()
+        self._pending: Dict[str, float] = {}  # device_id -> 取得を始めてよい時刻
+        SHARD_MEMBERS.set(len(self.ring.members))
+
+    def _set_members(self, members: List[str]) -> bool:
+        members = sorted(set(members))
+        if members == self.ring.members:
+            return False
+        logging.info(
+            f"Shard members changed: {len(self.ring.members)} -> {len(members)} "
+            f"({', '.join(members)})"
+        )
+        self.ring = HashRing(members, self.vnodes)
+        SHARD_MEMBERS.set(len(members))
+        return True
+
+    async def refresh(self, now: Optional[float] = None) -> bool:
+        """メンバーを引き直す。担当の再計算が必要なら True"""
+        now = time.time() if now is None else now
+        changed = False
+        if self.resolve is not None and now >= self._next_refresh:
+            self._next_refresh = now + self.refresh_interval
+            try:
+                members = await asyncio.to_thread(self.resolve)
+            except Exception as e:
+                logging.error(f"Shard member lookup failed: {e}")
+            else:
+                # 空の結果は DNS の一時的な不調とみなし、直前のメンバーを使い続ける
+                if members:
+                    changed = self._set_members(members)
+        if any(ready <= now for ready in self._pending.values()):
+            changed = True
+        return changed
+
+    def owns(self, device: Dict[str, str], by_id: Dict[str, Dict[str, str]]) -> bool:
+        return self.ring.owner(shard_key(device, by_id)) == self.member_id
+
+    def account_shares(self, devices: List[Dict[str, str]]) -> Dict[str, int]:
+        """アカウントごとに、そのアカウントのデバイスを担当しているレプリカの数"""
+        by_id = {d["id"]: d for d in devices}
+        owners: Dict[str, Set[str]] = {}
+        for device in devices:
+            owner = self.ring.owner(shard_key(device, by_id))
+            if owner is not None:
+                owners.setdefault(device.get("account", DEFAULT_ACCOUNT), set()).add(
+                    owner
+                )
+        return {account: len(members) for account, members in owners.items()}
+
+    def assign(
+        self, devices: List[Dict[str, str]], now: Optional[float] = None
+    ) -> List[Dict[str, str]]:
+        """全デバイスのうち、このレプリカが今取得してよいものを返す"""
+        now = time.time() if now is None else now
+        by_id = {d["id"]: d for d in devices}
+        owned: Set[str] = set()
+        assigned = []
+        for device in devices:
+            device_id = device["id"]
+            if not self.owns(device, by_id):
+                continue
+            owned.add(device_id)
+            if device_id in self._seen and device_id not in self._owned:
+                # 既存のデバイスを引き継いだ: 前の担当が手放すまで待つ
+                self._pending.setdefault(device_id, now + self.handoff_delay)
+            ready = self._pending.get(device_id)
+            if ready is not None and ready > now:
+                continue
+            self._pending.pop(device_id, None)
+            assigned.append(device)
+
+        self._pending = {k: v for k, v in self._pending.items() if k in owned}
+        self._owned = owned
+        self._seen = set(by_id)
+        SHARD_DEVICES.set(len(assigned))
+        return assigned
@@ -0,0 +1,44 @@
+"""
+再起動をまたぐ状態のスナップショット
+
+SIGTERM で終了するときに、直近の電力値・ブレーカーの状態・レート制限の予算と
+各デバイスのポーリング予定を 1 つの JSON ファイルに保存する。
+起動時にこれを読み込めば、/metrics はすぐに値を返し、
+状態を作り直すためだけに API を呼ぶこともない。
+"""
+
+import json
+import logging
+import os
+import time
+from typing import Optional
+
+SNAPSHOT_VERSION = 1
+
+
+def save_snapshot(path: str, data: dict) -> None:
+    """一時ファイル経由で atomic に書き込む"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    payload = {"version": SNAPSHOT_VERSION, "saved_at": time.time(), **data}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(payload, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path: str) -> Optional[dict]:
+    """スナップショットを読む。存在しない・壊れている・形式が違う場合は None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return None
+    except ValueError as e:
+        logging.error(f"Snapshot {path} is broken: {e}")
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        logging.warning(f"Snapshot {path} has an unsupported format; ignoring it")
+        return None
+    return data
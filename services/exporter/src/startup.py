@@ -0,0 +1,85 @@
+"""
+起動時間の計測
+
+プロセス開始（インタプリタ起動を含む）から最初の電力値を公開するまでを段階ごとに計り、
+`switchbot_startup_phase_seconds` と `switchbot_time_to_first_sample_seconds` で公開する。
+STARTUP_PROFILE=true では最初の電力値を公開した時点で内訳をログに出す。
+
+import ごとの内訳は `python -X importtime -m src.main` で確認できる。
+"""
+
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from prometheus_client import Gauge
+
+STARTUP_PHASE_SECONDS = Gauge(
+    "switchbot_startup_phase_seconds", "Time spent in each startup phase", ["phase"]
+)
+
+FIRST_SAMPLE_SECONDS = Gauge(
+    "switchbot_time_to_first_sample_seconds",
+    "Seconds from process start until the first power reading was exported",
+)
+
+
+def process_uptime() -> Optional[float]:
+    """プロセスが起動してからの秒数（/proc がなければ None）"""
+    try:
+        with open("/proc/self/stat", encoding="ascii") as f:
+            # comm に空白や括弧が含まれても崩れないよう、最後の ')' 以降を数える
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime", encoding="ascii") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupProfile:
+    """起動の各段階の所要時間を記録する"""
+
+    def __init__(self, log: bool = False) -> None:
+        self.log = log
+        now = time.perf_counter()
+        # プロセス開始時刻（perf_counter 基準）。分からなければ計測開始時刻で代用する
+        self.origin = now - (process_uptime() or 0.0)
+        self.phases: Dict[str, float] = {}
+        self.first_sample: Optional[float] = None
+        # main_loop に入るまで = インタプリタの起動とモジュールの import
+        self.record("imports", now - self.origin)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.phases[name] = seconds
+        STARTUP_PHASE_SECONDS.labels(phase=name).set(seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    def since_start(self) -> float:
+        return time.perf_counter() - self.origin
+
+    def mark_first_sample(self, source: str) -> None:
+        """最初の電力値を公開した時点を記録する（2 回目以降は何もしない）"""
+        if self.first_sample is not None:
+            return
+        self.first_sample = self.since_start()
+        FIRST_SAMPLE_SECONDS.set(self.first_sample)
+        if self.log:
+            logging.info(f"Startup profile: {self.report()} ({source})")
+
+    def report(self) -> str:
+        parts = [
+            f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items()
+        ]
+        if self.first_sample is not None:
+            parts.append(f"first_sample={self.first_sample * 1000:.0f}ms")
+        return " ".join(parts)
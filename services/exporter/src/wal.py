@@ -0,0 +1,299 @@
+"""
+サンプルのローカル先行書き込みログ (WAL)
+
+(timestamp, device_id, watts) をコンパクトなバイナリレコードとして追記し、
+一定サイズでセグメントをローテーションする。容量上限を超えたら古いセグメントから削除する。
+VictoriaMetrics に届けた位置はチェックポイントファイルに記録し、
+ストレージが復旧したらチェックポイント以降を import エンドポイントへ再送する。
+
+レコード形式（リトルエンディアン）:
+    crc32 (u32) | timestamp_ms (i64) | watts (f32) | id_len (u8) | device_id (id_len bytes)
+crc32 は crc 以降のバイト列に対して計算する。途中で切れたレコードは起動時に切り詰める。
+"""
+
+import json
+import logging
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import (
+    Awaitable,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from prometheus_client import Counter, Gauge
+
+WAL_BYTES = Gauge("switchbot_wal_bytes", "Bytes stored in the local sample WAL")
+
+WAL_EVICTED_SEGMENTS = Counter(
+    "switchbot_wal_evicted_segments_total",
+    "WAL segments deleted to stay within the byte budget",
+)
+
+WAL_REPLAYED_RECORDS = Counter(
+    "switchbot_wal_replayed_records_total",
+    "WAL records delivered to the storage layer",
+)
+
+_CRC = struct.Struct("<I")
+_BODY = struct.Struct("<qfB")
+_SEGMENT_SUFFIX = ".seg"
+_CHECKPOINT_FILE = "checkpoint.json"
+
+Position = Tuple[int, int]  # (セグメント番号, バイトオフセット)
+
+
+@dataclass(frozen=True)
+class WalRecord:
+    timestamp: float  # epoch 秒
+    device_id: str
+    watts: float
+
+
+def encode_record(timestamp: float, device_id: str, watts: float) -> bytes:
+    raw_id = device_id.encode()[:255]
+    body = _BODY.pack(int(timestamp * 1000), watts, len(raw_id)) + raw_id
+    return _CRC.pack(zlib.crc32(body)) + body
+
+
+def _iter_records(data: bytes, offset: int = 0) -> Iterator[Tuple[WalRecord, int]]:
+    """バイト列からレコードを読み、(レコード, 次のオフセット) を返す。破損箇所で止まる"""
+    head = _CRC.size + _BODY.size
+    while offset + head <= len(data):
+        (crc,) = _CRC.unpack_from(data, offset)
+        ts_ms, watts, id_len = _BODY.unpack_from(data, offset + _CRC.size)
+        end = offset + head + id_len
+        if end > len(data) or zlib.crc32(data[offset + _CRC.size : end]) != crc:
+            return
+        device_id = data[offset + head : end].decode(errors="replace")
+        yield WalRecord(ts_ms / 1000.0, device_id, watts), end
+        offset = end
+
+
+class SampleWAL:
+    """セグメントローテーションと容量上限付きの追記専用ログ"""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 1024 * 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+    ) -> None:
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max(max_bytes, segment_bytes)
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments: List[int] = sorted(
+            int(name[: -len(_SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(_SEGMENT_SUFFIX)
+        )
+        if not self._segments:
+            self._segments.append(1)
+        self._recover_tail()
+        self._fh = self._open_segment(self._segments[-1])
+        self._size = self._fh.tell()
+        self.checkpoint = self._load_checkpoint()
+        self._update_gauge()
+
+    # --- ファイル操作 ---
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, f"{seq:010d}{_SEGMENT_SUFFIX}")
+
+    def _open_segment(self, seq: int) -> BinaryIO:
+        """追記用に開く。ハンドルは WAL が持ち、_rotate() か close() で閉じる"""
+        return open(self._path(seq), "ab")  # noqa: SIM115
+
+    def _read_segment(self, seq: int) -> bytes:
+        try:
+            with open(self._path(seq), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return b""
+
+    def _recover_tail(self) -> None:
+        """最新セグメント末尾の書きかけレコードを切り詰める"""
+        path = self._path(self._segments[-1])
+        data = self._read_segment(self._segments[-1])
+        valid = 0  # 最後の完全なレコードの終端
+        for _, end in _iter_records(data):
+            valid = end
+        if valid < len(data):
+            logging.warning(
+                f"WAL: truncating {len(data) - valid} torn bytes from {path}"
+            )
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+
+    def _total_bytes(self) -> int:
+        return sum(
+            os.path.getsize(self._path(s))
+            for s in self._segments
+            if os.path.exists(self._path(s))
+        )
+
+    def _update_gauge(self) -> None:
+        WAL_BYTES.set(self._total_bytes())
+
+    def _rotate(self) -> None:
+        self._fh.close()
+        self._segments.append(self._segments[-1] + 1)
+        self._fh = self._open_segment(self._segments[-1])
+        self._size = 0
+        self._enforce_budget()
+
+    def _enforce_budget(self) -> None:
+        total = self._total_bytes()
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            path = self._path(oldest)
+            total -= os.path.getsize(path)
+            os.remove(path)
+            WAL_EVICTED_SEGMENTS.inc()
+            logging.warning(f"WAL: byte budget exceeded, evicted segment {oldest}")
+        self._update_gauge()
+
+    # --- 書き込み ---
+    def append(self, timestamp: float, device_id: str, watts: float) -> None:
+        record = encode_record(timestamp, device_id, watts)
+        self._fh.write(record)
+        self._size += len(record)
+        if self._size >= self.segment_bytes:
+            self._rotate()
+
+    def sync(self) -> None:
+        """OS バッファをディスクへ書き出す（サイクルごとに 1 回呼ぶ）"""
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._update_gauge()
+
+    def close(self) -> None:
+        self.sync()
+        self._fh.close()
+
+    # --- 読み出し ---
+    def end_position(self) -> Position:
+        return (self._segments[-1], self._size)
+
+    def read_from(self, pos: Position, limit: int) -> Tuple[List[WalRecord], Position]:
+        """pos 以降のレコードを最大 limit 件読む。削除済みセグメントは飛ばす"""
+        self._fh.flush()
+        seq, offset = pos
+        if seq < self._segments[0]:
+            seq, offset = self._segments[0], 0
+
+        records: List[WalRecord] = []
+        for s in self._segments:
+            if s < seq:
+                continue
+            start = offset if s == seq else 0
+            end = start
+            for record, end in _iter_records(self._read_segment(s), start):
+                records.append(record)
+                if len(records) >= limit:
+                    return records, (s, end)
+            pos = (s, end)
+        return records, pos
+
+    def last_values(
+        self, device_ids: Optional[Iterable[str]] = None
+    ) -> Dict[str, WalRecord]:
+        """デバイスごとの最新レコードを新しいセグメントから順に探す"""
+        wanted = set(device_ids) if device_ids is not None else None
+        found: Dict[str, WalRecord] = {}
+        self._fh.flush()
+        for seq in reversed(self._segments):
+            latest: Dict[str, WalRecord] = {}
+            for record, _ in _iter_records(self._read_segment(seq)):
+                latest[record.device_id] = record
+            for device_id, record in latest.items():
+                found.setdefault(device_id, record)
+            if wanted is not None and wanted <= found.keys():
+                break
+        if wanted is not None:
+            found = {k: v for k, v in found.items() if k in wanted}
+        return found
+
+    # --- チェックポイント ---
+    def _load_checkpoint(self) -> Position:
+        try:
+            with open(os.path.join(self.directory, _CHECKPOINT_FILE)) as f:
+                data = json.load(f)
+            return (int(data["segment"]), int(data["offset"]))
+        except (FileNotFoundError, ValueError, KeyError):
+            return (self._segments[0], 0)
+
+    def commit(self, pos: Position) -> None:
+        """pos までストレージへ届いたことを記録する"""
+        path = os.path.join(self.directory, _CHECKPOINT_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": pos[0], "offset": pos[1]}, f)
+        os.replace(tmp, path)
+        self.checkpoint = pos
+
+
+class WalShipper:
+    """
+    チェックポイント以降の WAL レコードをストレージへ届ける
+
+    health が None の場合（プッシュモード）は常に未送信分を送る。
+    health を渡した場合（スクレイプ運用）は、ストレージが正常な間は
+    スクレイプで取り込まれているとみなしてチェックポイントを進めるだけにし、
+    停止から復旧したときに停止中のレコードだけを送る。
+    """
+
+    def __init__(
+        self,
+        wal: SampleWAL,
+        send: Callable[[List[WalRecord]], Awaitable[bool]],
+        health: Optional[Callable[[], Awaitable[bool]]] = None,
+        batch_records: int = 5000,
+    ) -> None:
+        self.wal = wal
+        self.send = send
+        self.health = health
+        self.batch_records = batch_records
+        self.outage = False
+
+    async def ship_pending(self) -> int:
+        """未送信レコードを送る。送れた件数を返す"""
+        shipped = 0
+        while True:
+            records, pos = self.wal.read_from(self.wal.checkpoint, self.batch_records)
+            if not records:
+                if pos != self.wal.checkpoint:
+                    self.wal.commit(pos)  # 空のセグメントだけが残っている
+                return shipped
+            if not await self.send(records):
+                return shipped
+            self.wal.commit(pos)
+            shipped += len(records)
+            WAL_REPLAYED_RECORDS.inc(len(records))
+
+    async def run_once(self) -> int:
+        if self.health is None:
+            return await self.ship_pending()
+
+        if not await self.health():
+            if not self.outage:
+                logging.warning("WAL: storage unreachable, keeping samples locally")
+            self.outage = True
+            return 0
+        if self.outage:
+            shipped = await self.ship_pending()
+            if self.wal.checkpoint == self.wal.end_position():
+                self.outage = False
+                logging.info(f"WAL: storage recovered, replayed {shipped} records")
+            return shipped
+        self.wal.commit(self.wal.end_position())
+        return 0
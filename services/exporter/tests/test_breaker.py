@@ -0,0 +1,113 @@
+import random
+
+import pytest
+import respx
+from httpx import Response
+from src.breaker import BREAKER_STATE, CLOSED, HALF_OPEN, OPEN, DeviceBreakers
+from src.main import DEVICE_UP, POWER_WATT, fetch_device_status, power_labels
+
+
+def _breakers(**kwargs):
+    kwargs.setdefault("jitter", 0.0)
+    return DeviceBreakers(rng=random.Random(0), **kwargs)
+
+
+def _state(device_id):
+    return BREAKER_STATE.labels(device_id=device_id)._value.get()
+
+
+def test_opens_after_threshold_and_backs_off_exponentially():
+    breakers = _breakers(failure_threshold=2, base_backoff=100, max_backoff=300)
+
+    assert breakers.record_failure("A", now=0) is False
+    assert breakers.record_failure("A", now=0) is True
+    assert _state("A") == OPEN
+    assert breakers.allow("A", now=99) is False
+
+    # クールダウン明けは 1 回だけ試行する
+    assert breakers.allow("A", now=100) is True
+    assert _state("A") == HALF_OPEN
+    assert breakers.allow("A", now=100) is False
+
+    # 試行が失敗すると待ち時間が倍になり、上限で止まる
+    assert breakers.record_failure("A", now=100) is True
+    assert breakers.allow("A", now=299) is False
+    assert breakers.allow("A", now=300) is True
+    breakers.record_failure("A", now=300)
+    assert breakers.allow("A", now=599) is False
+    assert breakers.allow("A", now=600) is True
+
+    breakers.record_success("A")
+    assert _state("A") == CLOSED
+    assert breakers.allow("A", now=600) is True
+    assert breakers.record_failure("A", now=600) is False
+
+
+def test_lost_probe_is_retried_after_probe_timeout():
+    breakers = _breakers(failure_threshold=1, base_backoff=100, probe_timeout=60)
+    breakers.record_failure("P", now=0)
+
+    # 試行を送ったが、締め切りで打ち切られて結果が記録されなかった
+    assert [d["id"] for d in breakers.filter([{"id": "P"}], now=100)] == ["P"]
+    assert breakers.filter([{"id": "P"}], now=130) == []
+    assert _state("P") == HALF_OPEN
+
+    # probe_timeout を過ぎたらもう一度試行する
+    assert breakers.allow("P", now=160) is True
+    assert breakers.allow("P", now=161) is False
+    breakers.record_success("P")
+    assert _state("P") == CLOSED
+
+
+def test_jitter_stays_within_bounds():
+    breakers = DeviceBreakers(
+        failure_threshold=1, base_backoff=100, jitter=0.2, rng=random.Random(1)
+    )
+    breakers.record_failure("B", now=0)
+
+    assert breakers.allow("B", now=79) is False
+    assert breakers.allow("B", now=121) is True
+
+
+def test_filter_skips_open_devices():
+    breakers = _breakers(failure_threshold=1)
+    breakers.record_failure("C", now=0)
+
+    devices = [{"id": "C"}, {"id": "D"}]
+    assert [d["id"] for d in breakers.filter(devices, now=1)] == ["D"]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_single_failure_keeps_the_last_value(client):
+    device = {
+        "id": "BRK0001",
+        "name": "Flaky",
+        "device": "pc",
+        "room": "Work",
+        "shelf": "Rack1",
+        "parent_id": "none",
+    }
+    respx.get("https://api.switch-bot.com/v1.1/devices/BRK0001/status").mock(
+        side_effect=[
+            Response(200, json={"statusCode": 100, "body": {"weight": 42}}),
+            Response(500),
+            Response(500),
+        ]
+    )
+    breakers = _breakers(failure_threshold=2)
+
+    await fetch_device_status(client, device, "token", "secret", breakers=breakers)
+    result = await fetch_device_status(
+        client, device, "token", "secret", breakers=breakers
+    )
+    assert not result.ok and not result.down
+    assert DEVICE_UP.labels(device_id="BRK0001")._value.get() == 1
+    assert POWER_WATT.labels(**power_labels(device))._value.get() == 42
+
+    result = await fetch_device_status(
+        client, device, "token", "secret", breakers=breakers
+    )
+    assert result.down
+    assert DEVICE_UP.labels(device_id="BRK0001")._value.get() == 0
+    assert breakers.is_open("BRK0001")
@@ -0,0 +1,144 @@
+from src.change_detect import ChangeDetector
+from src.exposition import ExpositionCache
+from src.main import (
+    POWER_WATT,
+    ExporterState,
+    FetchResult,
+    power_labels,
+    process_results,
+    timestamped_view,
+)
+from src.remote_write import Sample
+from src.wal import SampleWAL
+
+DEVICE = {
+    "id": "TV0001",
+    "name": "tv",
+    "device": "tv",
+    "room": "living",
+    "shelf": "tv_board",
+    "parent_id": "none",
+}
+
+
+POWER = ("switchbot_power_watts", ())
+
+
+def _sample(value, ts, device_id="TV0001"):
+    return Sample("switchbot_power_watts", {"device_id": device_id}, value, ts)
+
+
+def test_deadbands_and_heartbeat():
+    detector = ChangeDetector(abs_deadband=0.5, rel_deadband=0.1, heartbeat=300)
+
+    assert detector.changed(POWER, 10.0, 0.0)
+    assert not detector.changed(POWER, 10.4, 60.0)  # 絶対値のデッドバンド内
+    assert not detector.changed(POWER, 10.9, 120.0)  # 相対値 (10%) のデッドバンド内
+    assert detector.changed(POWER, 11.2, 180.0)
+    assert not detector.changed(POWER, 11.2, 240.0)
+    assert detector.changed(POWER, 11.2, 480.0)  # ハートビート
+
+
+def test_slow_drift_is_written_once_it_exceeds_the_band():
+    detector = ChangeDetector(abs_deadband=1.0)
+    kept = detector.filter(_sample(5.0 + 0.4 * i, float(i)) for i in range(6))
+
+    assert [s.value for s in kept] == [5.0, 5.0 + 0.4 * 3]
+
+
+def test_forget_writes_next_value():
+    detector = ChangeDetector()
+    assert detector.filter([_sample(0.0, 0.0), _sample(0.0, 0.0, "OTHER")])
+    detector.forget("TV0001")
+
+    kept = detector.filter([_sample(0.0, 10.0), _sample(0.0, 10.0, "OTHER")])
+    assert [s.labels["device_id"] for s in kept] == ["TV0001"]
+
+
+def test_deadband_applies_only_to_power():
+    detector = ChangeDetector(abs_deadband=5.0, heartbeat=300)
+    labels = {"device_id": "TV0001"}
+
+    kept = []
+    for i in range(3):
+        ts = float(60 * i)
+        kept += detector.filter(
+            [
+                Sample("switchbot_power_watts", labels, 100.0 + i, ts),
+                Sample("switchbot_energy_kwh_total", labels, 1.0 + 0.002 * i, ts),
+                Sample("switchbot_api_requests_remaining", {}, 9000.0 - i, ts),
+            ]
+        )
+
+    # 電力値は幅の中に収まっているので最初の 1 回だけ
+    assert [s.timestamp for s in kept if s.name == "switchbot_power_watts"] == [0.0]
+    energy = [s.value for s in kept if s.name == "switchbot_energy_kwh_total"]
+    assert energy == [1.0, 1.002, 1.004]
+    assert len([s for s in kept if s.name == "switchbot_api_requests_remaining"]) == 3
+    # 値が変わらなければ電力値以外も省く
+    assert not detector.changed(("switchbot_api_requests_remaining", ()), 8998.0, 240.0)
+
+
+class _Sink:
+    def __init__(self):
+        self.samples = []
+
+    def add(self, samples):
+        self.samples.extend(samples)
+
+
+def test_idle_plug_is_not_written_every_cycle(tmp_path):
+    sink = _Sink()
+    state = ExporterState(
+        devices=[DEVICE],
+        pool=None,
+        client=None,
+        collection_interval=60,
+        sink=sink,
+        wal=SampleWAL(str(tmp_path)),
+        changes=ChangeDetector(abs_deadband=0.2, heartbeat=300),
+    )
+
+    for i, watts in enumerate([0.5, 0.5, 0.6, 0.5, 30.0]):
+        result = FetchResult(
+            device_id="TV0001", watts=watts, fetched_at=1000.0 + 60 * i
+        )
+        process_results(state, [DEVICE], [result])
+
+    records, _ = state.wal.read_from((0, 0), limit=100)
+    state.wal.close()
+    assert [r.watts for r in records] == [0.5, 30.0]
+    up = [s for s in sink.samples if s.name == "switchbot_device_up"]
+    assert [s.timestamp for s in up] == [1000.0]
+    # ゲージは常に最新の値
+    assert state.readings["TV0001"] == (30.0, 1240.0)
+
+
+def test_scrape_keeps_the_written_sample_within_the_deadband():
+    """デッドバンド内ならスクレイプでも同じ (時刻, 値) を返し、VictoriaMetrics が重複排除できること"""
+    device = dict(DEVICE, id="TV0002")
+    state = ExporterState(
+        devices=[device],
+        pool=None,
+        client=None,
+        collection_interval=60,
+        changes=ChangeDetector(abs_deadband=0.2, heartbeat=300),
+    )
+    view = timestamped_view(state)
+
+    def scrape(watts, fetched_at):
+        POWER_WATT.labels(**power_labels(device)).set(watts)  # fetch_device_status 相当
+        result = FetchResult(device_id="TV0002", watts=watts, fetched_at=fetched_at)
+        process_results(state, [device], [result])
+        body = ExpositionCache(view, ttl=0).get().body.decode()
+        line = next(line for line in body.splitlines() if 'device_id="TV0002"' in line)
+        return line.split()[-2:]
+
+    first = scrape(0.5, 1000.0)
+    assert first == ["0.5", "1000000"]
+    assert scrape(0.6, 1060.0) == first
+    assert scrape(0.4, 1120.0) == first
+    # デッドバンドを超えたら新しい時刻と値
+    assert scrape(30.0, 1180.0) == ["30.0", "1180000"]
+    # ハートビートで同じ値でも時刻を進める
+    assert scrape(30.1, 1500.0) == ["30.1", "1500000"]
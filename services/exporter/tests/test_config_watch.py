@@ -0,0 +1,82 @@
+import json
+import os
+from src.config_watch import DeviceConfigWatcher, diff_devices
+from src.main import (
+    DEVICE_UP,
+    POWER_WATT,
+    ExporterState,
+    apply_config_change,
+    load_device_config,
+    power_labels,
+)
+
+
+def _device(device_id, room="work", name="plug"):
+    return {
+        "id": device_id,
+        "name": name,
+        "device": "pc",
+        "room": room,
+        "shelf": "desk",
+        "parent_id": "none",
+    }
+
+
+def test_diff_devices():
+    old = [_device("A"), _device("B"), _device("C")]
+    new = [_device("A"), _device("B", room="bedroom"), _device("D")]
+
+    diff = diff_devices(old, new)
+
+    assert [d["id"] for d in diff.added] == ["D"]
+    assert [d["id"] for d in diff.removed] == ["C"]
+    assert [(o["room"], n["room"]) for o, n in diff.relabelled] == [("work", "bedroom")]
+
+
+def test_watcher_detects_changes_by_stat(tmp_path):
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps([_device("A")]))
+    watcher = DeviceConfigWatcher(str(path), load_device_config)
+
+    assert watcher.poll() is None
+
+    path.write_text(json.dumps([_device("A"), _device("B")]))
+    os.utime(path, ns=(0, 1_000_000_000))
+    assert [d["id"] for d in watcher.poll()] == ["A", "B"]
+    assert watcher.poll() is None
+
+
+def test_watcher_ignores_broken_file(tmp_path):
+    path = tmp_path / "devices.json"
+    path.write_text(json.dumps([_device("A")]))
+    watcher = DeviceConfigWatcher(str(path), load_device_config)
+
+    path.write_text("[{broken")
+    os.utime(path, ns=(0, 1_000_000_000))
+
+    assert watcher.poll() is None
+
+
+def test_apply_config_change_updates_only_affected_series():
+    kept, moved, dropped = _device("K1"), _device("M1"), _device("R1")
+    state = ExporterState(
+        devices=[kept, moved, dropped], pool=None, client=None, collection_interval=60
+    )
+    for device, watts in ((kept, 1.0), (moved, 2.0), (dropped, 3.0)):
+        POWER_WATT.labels(**power_labels(device)).set(watts)
+        DEVICE_UP.labels(device_id=device["id"]).set(1)
+        state.readings[device["id"]] = (watts, 0.0)
+
+    relabelled = _device("M1", room="bedroom")
+    apply_config_change(state, [kept, relabelled, _device("N1")])
+
+    samples = {
+        (s.labels["device_id"], s.labels["room"]): s.value
+        for s in POWER_WATT.collect()[0].samples
+    }
+    assert samples[("K1", "work")] == 1.0
+    assert samples[("M1", "bedroom")] == 2.0
+    assert ("M1", "work") not in samples
+    assert ("R1", "work") not in samples
+    assert "R1" not in state.readings
+    assert [d["id"] for d in state.devices] == ["K1", "M1", "N1"]
@@ -0,0 +1,111 @@
+import pytest
+import respx
+from httpx import Response
+from src.discovery import DeviceDiscovery
+from src.main import ExporterState, run_cycle
+
+LIST_URL = "https://api.switch-bot.com/v1.1/devices"
+BASE = "https://api.switch-bot.com"
+
+
+def _listing(*plugs):
+    devices = [
+        {"deviceId": device_id, "deviceName": name, "deviceType": "Plug Mini (JP)"}
+        for device_id, name in plugs
+    ]
+    devices.append({"deviceId": "HUB1", "deviceName": "Hub", "deviceType": "Hub 2"})
+    return Response(
+        200,
+        json={"statusCode": 100, "body": {"deviceList": devices}},
+        headers={"x-ratelimit-remaining": "9000"},
+    )
+
+
+CONFIGURED = [
+    {
+        "id": "PLUG1",
+        "name": "server",
+        "device": "pc",
+        "room": "work",
+        "shelf": "rack_1",
+        "parent_id": "none",
+    }
+]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_listing_is_called_once_per_ttl(client, tmp_path):
+    route = respx.get(LIST_URL).mock(
+        return_value=_listing(("PLUG1", "Server"), ("PLUG2", "Desk Lamp"))
+    )
+    cache = str(tmp_path / "discovery.json")
+    discovery = DeviceDiscovery(ttl=600, cache_path=cache)
+
+    assert await discovery.maybe_refresh(client, dict, BASE, now=1000.0) is True
+    assert await discovery.maybe_refresh(client, dict, BASE, now=1500.0) is False
+    assert route.call_count == 1
+
+    # 再起動してもキャッシュが新しければ API を呼ばない
+    restarted = DeviceDiscovery(ttl=600, cache_path=cache)
+    assert await restarted.maybe_refresh(client, dict, BASE, now=1500.0) is False
+    assert route.call_count == 1
+    assert [p["deviceId"] for p in restarted.plugs] == ["PLUG1", "PLUG2"]
+
+    assert await restarted.maybe_refresh(client, dict, BASE, now=1601.0) is False
+    assert route.call_count == 2
+
+
+def test_merge_keeps_configured_labels():
+    discovery = DeviceDiscovery(default_room="inbox")
+    discovery.plugs = [
+        {"deviceId": "PLUG1", "deviceName": "Server"},
+        {"deviceId": "PLUG2", "deviceName": "Desk Lamp"},
+    ]
+
+    merged = discovery.merge(CONFIGURED)
+
+    assert merged[0] == CONFIGURED[0]
+    assert merged[1]["id"] == "PLUG2"
+    assert merged[1]["name"] == "desk_lamp"
+    assert merged[1]["room"] == "inbox"
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_listing_is_retried_later(client):
+    route = respx.get(LIST_URL).mock(return_value=Response(500))
+    discovery = DeviceDiscovery(ttl=600, retry_interval=60)
+
+    assert await discovery.maybe_refresh(client, dict, BASE, now=0.0) is False
+    assert await discovery.maybe_refresh(client, dict, BASE, now=30.0) is False
+    assert route.call_count == 1
+    await discovery.maybe_refresh(client, dict, BASE, now=61.0)
+    assert route.call_count == 2
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_new_plug_is_added_to_the_schedule(client, monkeypatch, tmp_path):
+    monkeypatch.setenv("SWITCHBOT_TOKEN", "token")
+    monkeypatch.setenv("SWITCHBOT_SECRET", "secret")
+    respx.get(LIST_URL).mock(return_value=_listing(("PLUG1", "Server"), ("NEW1", "")))
+    respx.get(url__regex=r".*/status").mock(
+        return_value=Response(200, json={"statusCode": 100, "body": {"weight": 1}})
+    )
+    from src.fetch_pool import FetchPool
+
+    state = ExporterState(
+        devices=list(CONFIGURED),
+        pool=FetchPool(concurrency=2),
+        client=client,
+        collection_interval=60,
+        discovery=DeviceDiscovery(),
+        configured=list(CONFIGURED),
+    )
+
+    await run_cycle(state)
+
+    assert [d["id"] for d in state.devices] == ["PLUG1", "NEW1"]
+    assert "NEW1" in state.readings
+    assert state.devices[1]["name"] == "plug_mini"
@@ -0,0 +1,106 @@
+import pytest
+from src.energy import EnergyIntegrator
+from src.main import (
+    ENERGY_KWH,
+    ExporterState,
+    FetchResult,
+    apply_config_change,
+    power_labels,
+    process_results,
+    restore_energy,
+)
+
+
+def _device(device_id, room="work"):
+    return {
+        "id": device_id,
+        "name": "plug",
+        "device": "pc",
+        "room": room,
+        "shelf": "desk",
+        "parent_id": "none",
+    }
+
+
+def _energy_samples():
+    return {
+        (s.labels["device_id"], s.labels["room"]): s.value
+        for s in ENERGY_KWH.collect()[0].samples
+        if s.name == "switchbot_energy_kwh_total"
+    }
+
+
+def test_trapezoid_integration():
+    energy = EnergyIntegrator(max_gap=7200)
+
+    assert energy.add("A", 100.0, 0.0) == 0.0
+    # 100W → 300W を 1 時間: 平均 200W * 1h = 0.2kWh
+    assert energy.add("A", 300.0, 3600.0) == pytest.approx(0.2)
+    # 同じ時刻の結果は二重に数えない
+    assert energy.add("A", 300.0, 3600.0) == 0.0
+    assert energy.total("A") == pytest.approx(0.2)
+
+
+def test_gap_longer_than_max_gap_is_not_integrated():
+    energy = EnergyIntegrator(max_gap=600)
+    energy.add("A", 1000.0, 0.0)
+
+    assert energy.add("A", 1000.0, 3600.0) == 0.0
+    assert energy.add("A", 1000.0, 3960.0) == pytest.approx(0.1)
+
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / "state" / "energy.json")
+    energy = EnergyIntegrator(state_path=path)
+    energy.add("A", 500.0, 0.0)
+    energy.add("A", 500.0, 360.0)
+    energy.save()
+
+    restored = EnergyIntegrator(state_path=path)
+    assert restored.total("A") == pytest.approx(0.05)
+    # 再起動後も前回の取得時刻から続けて積算する
+    assert restored.add("A", 500.0, 720.0) == pytest.approx(0.05)
+
+
+def test_process_results_increments_counter(tmp_path):
+    device = _device("E1")
+    state = ExporterState(
+        devices=[device],
+        pool=None,
+        client=None,
+        collection_interval=60,
+        energy=EnergyIntegrator(state_path=str(tmp_path / "energy.json"), max_gap=7200),
+    )
+
+    process_results(state, [device], [FetchResult("E1", watts=60.0, fetched_at=0.0)])
+    process_results(state, [device], [FetchResult("E1", watts=60.0, fetched_at=3600.0)])
+
+    assert _energy_samples()[("E1", "work")] == pytest.approx(0.06)
+    assert (tmp_path / "energy.json").exists()
+
+
+def test_restore_and_relabel_keep_the_total(tmp_path):
+    path = str(tmp_path / "energy.json")
+    saved = EnergyIntegrator(state_path=path)
+    saved.add("E2", 1000.0, 0.0)
+    saved.add("E2", 1000.0, 1800.0)
+    saved.add("GONE", 1000.0, 0.0)
+    saved.save()
+
+    device = _device("E2")
+    state = ExporterState(
+        devices=[device],
+        pool=None,
+        client=None,
+        collection_interval=60,
+        energy=EnergyIntegrator(state_path=path),
+    )
+    restore_energy(state)
+    assert _energy_samples()[("E2", "work")] == pytest.approx(0.5)
+    assert "GONE" not in state.energy.devices
+
+    apply_config_change(state, [_device("E2", room="bedroom")])
+    samples = _energy_samples()
+    assert samples[("E2", "bedroom")] == pytest.approx(0.5)
+    assert ("E2", "work") not in samples
+    assert power_labels(device)["room"] == "work"
@@ -0,0 +1,137 @@
+import gzip
+import urllib.error
+import urllib.request
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge
+from src.exposition import ExpositionCache, TimestampedView, start_metrics_server
+from src.main import (
+    POWER_WATT,
+    ExporterState,
+    FetchResult,
+    power_labels,
+    process_results,
+    timestamped_view,
+)
+
+
+@pytest.fixture
+def registry():
+    registry = CollectorRegistry()
+    gauge = Gauge("test_power_watts", "test", ["device_id"], registry=registry)
+    for i in range(100):
+        gauge.labels(device_id=f"D{i:03d}").set(i)
+    return registry
+
+
+@pytest.fixture
+def server(registry):
+    cache = ExpositionCache(registry, ttl=0)
+    server, thread = start_metrics_server(0, cache, addr="127.0.0.1")
+    yield cache, f"http://127.0.0.1:{server.server_address[1]}/metrics"
+    server.shutdown()
+    thread.join()
+
+
+def test_renders_once_until_invalidated(registry):
+    cache = ExpositionCache(registry, ttl=0)
+    first = cache.get()
+    for _ in range(10):
+        assert cache.get() is first
+    assert cache.renders == 1
+
+    Gauge("test_other", "test", registry=registry).set(1)
+    assert b"test_other" not in cache.get().body
+    cache.invalidate()
+    assert b"test_other" in cache.get().body
+    assert cache.renders == 2
+
+
+def test_ttl_rerenders(registry):
+    cache = ExpositionCache(registry, ttl=15)
+    cache.get(now=0.0)
+    cache.get(now=14.0)
+    cache.get(now=15.0)
+    assert cache.renders == 2
+
+
+def _request(url, method="GET", **headers):
+    req = urllib.request.Request(url, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, dict(resp.headers), resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def test_server_gzip_etag_and_head(server):
+    cache, url = server
+    status, headers, body = _request(url)
+    assert status == 200
+    assert b'test_power_watts{device_id="D042"} 42.0' in body
+
+    status, zipped_headers, zipped = _request(url, **{"Accept-Encoding": "gzip"})
+    assert zipped_headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(zipped) == body
+
+    status, _, empty = _request(url, **{"If-None-Match": headers["ETag"]})
+    assert status == 304 and empty == b""
+
+    status, head_headers, head_body = _request(url, method="HEAD")
+    assert status == 200 and head_body == b""
+    assert head_headers["Content-Length"] == str(len(body))
+    assert cache.renders == 1
+
+
+def test_openmetrics_negotiation_with_timestamps_and_created():
+    registry = CollectorRegistry()
+    power = Gauge("test_power_watts", "test", ["device_id"], registry=registry)
+    power.labels(device_id="A").set(12)
+    power.labels(device_id="B").set(3)
+    energy = Counter("test_energy_kwh", "test", ["device_id"], registry=registry)
+    energy.labels(device_id="A").inc(1.5)
+    view = TimestampedView(
+        registry,
+        timestamps={
+            "test_power_watts": lambda labels: (
+                1700000000.5 if labels["device_id"] == "A" else None
+            )
+        },
+        created={"test_energy_kwh": lambda labels: 1600000000.0},
+    )
+    cache = ExpositionCache(view, ttl=0)
+
+    text = cache.get().body.decode()
+    assert 'test_power_watts{device_id="A"} 12.0 1700000000500\n' in text
+    assert 'test_power_watts{device_id="B"} 3.0\n' in text
+
+    om = cache.get(accept="application/openmetrics-text; version=1.0.0")
+    assert om.content_type.startswith("application/openmetrics-text")
+    body = om.body.decode()
+    assert 'test_power_watts{device_id="A"} 12.0 1700000000.5\n' in body
+    assert 'test_energy_kwh_created{device_id="A"} 1.6e+09\n' in body
+    assert body.endswith("# EOF\n")
+    assert cache.renders == 2
+
+
+def test_power_samples_carry_fetch_time():
+    device = {
+        "id": "TS0001",
+        "name": "lamp",
+        "device": "lamp",
+        "room": "living",
+        "shelf": "side",
+        "parent_id": "none",
+    }
+    state = ExporterState(
+        devices=[device], pool=None, client=None, collection_interval=60
+    )
+    POWER_WATT.labels(**power_labels(device)).set(7)
+    result = FetchResult("TS0001", watts=7.0, fetched_at=1700000029.0)
+    process_results(state, [device], [result])
+
+    body = ExpositionCache(timestamped_view(state), ttl=0).get().body.decode()
+    assert (
+        'switchbot_power_watts{device="lamp",device_id="TS0001",device_name="lamp",'
+        'parent_id="none",room="living",shelf="side"} 7.0 1700000029000\n'
+    ) in body
@@ -0,0 +1,68 @@
+import asyncio
+import pytest
+from src.fetch_pool import FetchPool
+
+
+def _job(key, delay, tracker=None):
+    async def run():
+        if tracker is not None:
+            tracker["active"] += 1
+            tracker["peak"] = max(tracker["peak"], tracker["active"])
+        try:
+            await asyncio.sleep(delay)
+            return key
+        finally:
+            if tracker is not None:
+                tracker["active"] -= 1
+
+    return key, run
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    """同時実行数が上限を超えないこと"""
+    tracker = {"active": 0, "peak": 0}
+    pool = FetchPool(concurrency=3)
+    jobs = [_job(f"D{i}", 0.01, tracker) for i in range(20)]
+
+    outcome = await pool.run(jobs)
+
+    assert tracker["peak"] == 3
+    assert len(outcome.results) == 20
+    assert not outcome.timed_out
+
+
+@pytest.mark.asyncio
+async def test_deadline_cancels_stragglers():
+    """締め切りを超えたジョブはキャンセルされ、未着手ジョブはスキップされること"""
+    pool = FetchPool(concurrency=2, cycle_deadline=0.1)
+    jobs = [
+        _job("fast", 0.01),
+        _job("slow", 5.0),
+        _job("late1", 5.0),
+        _job("late2", 5.0),
+    ]
+
+    outcome = await pool.run(jobs)
+
+    assert outcome.results == {"fast": "fast"}
+    assert sorted(outcome.cancelled) == ["late1", "slow"]
+    assert outcome.skipped == ["late2"]
+    assert outcome.elapsed < 1.0
+
+
+@pytest.mark.asyncio
+async def test_job_errors_are_collected():
+    async def boom():
+        raise RuntimeError("boom")
+
+    pool = FetchPool(concurrency=2)
+    outcome = await pool.run([("bad", boom), _job("good", 0)])
+
+    assert outcome.results == {"good": "good"}
+    assert isinstance(outcome.errors["bad"], RuntimeError)
+
+
+def test_invalid_concurrency():
+    with pytest.raises(ValueError):
+        FetchPool(concurrency=0)
@@ -0,0 +1,121 @@
+import pytest
+from src.hierarchy import (
+    HOUSE_POWER,
+    ROOM_POWER,
+    SHELF_POWER,
+    TAP_POWER,
+    UNACCOUNTED_POWER,
+    HierarchyAggregator,
+)
+
+
+def _device(device_id, parent_id="none", room="work", shelf="desk"):
+    return {
+        "id": device_id,
+        "name": f"plug_{device_id}",
+        "device": "pc",
+        "room": room,
+        "shelf": shelf,
+        "parent_id": parent_id,
+    }
+
+
+def _value(gauge, **labels):
+    for s in gauge.collect()[0].samples:
+        if all(s.labels.get(k) == v for k, v in labels.items()):
+            return s.value
+    return None
+
+
+# TAP(100W) ── PC(60W)
+#           └─ MON(30W, 別の棚)
+# LAMP(10W, 別の部屋)
+DEVICES = [
+    _device("TAP"),
+    _device("PC", parent_id="TAP"),
+    _device("MON", parent_id="TAP", shelf="rack"),
+    _device("LAMP", room="bedroom"),
+]
+
+
+def _aggregator(readings):
+    aggregator = HierarchyAggregator()
+    aggregator.rebuild(DEVICES, readings)
+    return aggregator
+
+
+def test_rollups_do_not_double_count_children():
+    agg = _aggregator({"TAP": 100.0, "PC": 60.0, "MON": 30.0, "LAMP": 10.0})
+
+    assert agg.house.total == pytest.approx(110.0)
+    assert _value(HOUSE_POWER) == pytest.approx(110.0)
+    assert _value(ROOM_POWER, room="work") == pytest.approx(100.0)
+    # 未計上分 (100 - 60 - 30) はタップ自身の棚に計上される
+    assert _value(SHELF_POWER, room="work", shelf="desk") == pytest.approx(70.0)
+    assert _value(SHELF_POWER, room="work", shelf="rack") == pytest.approx(30.0)
+    assert _value(TAP_POWER, device_id="TAP") == pytest.approx(100.0)
+    assert _value(UNACCOUNTED_POWER, device_id="TAP") == pytest.approx(10.0)
+
+
+def test_leaf_update_is_applied_incrementally():
+    agg = _aggregator({"TAP": 100.0, "PC": 60.0, "MON": 30.0, "LAMP": 10.0})
+
+    agg.update("PC", 80.0)
+    # 親の値は変わらないので家全体は同じで、未計上分だけが減る
+    assert agg.house.total == pytest.approx(110.0)
+    assert _value(UNACCOUNTED_POWER, device_id="TAP") == pytest.approx(-10.0)
+
+    agg.update("TAP", 120.0)
+    assert agg.house.total == pytest.approx(130.0)
+    assert _value(SHELF_POWER, room="work", shelf="desk") == pytest.approx(90.0)
+
+    # 差分更新の結果が作り直した場合と一致する
+    rebuilt = _aggregator(dict(agg.readings))
+    assert rebuilt.exclusive == pytest.approx(agg.exclusive)
+
+
+def test_missing_parent_falls_back_to_children():
+    agg = _aggregator({"PC": 60.0, "MON": 30.0})
+
+    assert _value(TAP_POWER, device_id="TAP") == pytest.approx(90.0)
+    assert _value(UNACCOUNTED_POWER, device_id="TAP") is None
+    assert agg.house.total == pytest.approx(90.0)
+    # 計測値のない部屋の系列は出さない
+    assert _value(ROOM_POWER, room="bedroom") is None
+
+    agg.update("PC", None)
+    agg.update("MON", None)
+    assert _value(TAP_POWER, device_id="TAP") is None
+    assert _value(ROOM_POWER, room="work") is None
+
+
+def test_rebuild_removes_series_of_dropped_groups():
+    agg = _aggregator({"TAP": 100.0, "PC": 60.0, "MON": 30.0, "LAMP": 10.0})
+
+    agg.rebuild([_device("LAMP", room="bedroom")], dict(agg.readings))
+
+    assert _value(TAP_POWER, device_id="TAP") is None
+    assert _value(SHELF_POWER, room="work", shelf="rack") is None
+    assert agg.house.total == pytest.approx(10.0)
+
+
+def test_parent_cycle_is_treated_as_root():
+    agg = HierarchyAggregator()
+    agg.rebuild([_device("A", parent_id="B"), _device("B", parent_id="A")], {})
+
+    assert None in agg.parent.values()
+
+
+def test_sharded_replica_does_not_publish_partial_group_totals():
+    from src.main import rollup_samples
+
+    ROOM_POWER.labels("bedroom").set(-1.0)
+    agg = HierarchyAggregator(publish_groups=False)
+    agg.rebuild(DEVICES, {"TAP": 100.0, "PC": 60.0, "MON": 30.0})
+    agg.update("LAMP", 10.0)
+
+    # ゲージには触れない
+    assert _value(ROOM_POWER, room="bedroom") == -1.0
+    ROOM_POWER.remove("bedroom")
+    names = {s.name for s in rollup_samples(agg, 0.0)}
+    assert names == {"switchbot_tap_power_watts", "switchbot_unaccounted_power_watts"}
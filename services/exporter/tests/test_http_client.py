@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from src.http_client import (
+    HTTP_CONNECTIONS_OPENED,
+    HTTP_REQUESTS,
+    build_client,
+)
+
+
+async def _handle(reader, writer):
+    """keep-alive 対応の最小 HTTP/1.1 サーバー"""
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            if not head:
+                break
+            body = b'{"statusCode":100}'
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionResetError):
+        pass
+    finally:
+        writer.close()
+
+
+@pytest.mark.asyncio
+async def test_connection_is_reused_across_requests():
+    """同じクライアントでの 2 回目以降のリクエストは接続を再利用すること"""
+    server = await asyncio.start_server(_handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+
+    opened_before = HTTP_CONNECTIONS_OPENED._value.get()
+    reused_before = HTTP_REQUESTS.labels(connection="reused")._value.get()
+
+    client = build_client(max_connections=1)
+    try:
+        for _ in range(3):
+            resp = await client.get(f"http://127.0.0.1:{port}/v1.1/devices")
+            assert resp.status_code == 200
+    finally:
+        await client.aclose()
+        server.close()
+        await server.wait_closed()
+
+    assert HTTP_CONNECTIONS_OPENED._value.get() - opened_before == 1
+    assert HTTP_REQUESTS.labels(connection="reused")._value.get() - reused_before == 2
+
+
+def test_http2_falls_back_without_h2(monkeypatch):
+    monkeypatch.setattr("src.http_client._h2_available", lambda: False)
+    client = build_client(http2=True)
+    # http2 が無効なら HTTP/1.1 のみの接続プールになる
+    assert client._transport._pool._http2 is False
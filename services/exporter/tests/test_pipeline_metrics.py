@@ -0,0 +1,89 @@
+import pytest
+import respx
+from httpx import Response, TimeoutException
+from prometheus_client import REGISTRY
+from src.main import (
+    CYCLE_OVERRUNS,
+    ExporterState,
+    fetch_device_status,
+    run_cycle,
+)
+
+DEVICE = {
+    "id": "PIPE0001",
+    "name": "Server",
+    "device": "pc",
+    "room": "Work",
+    "shelf": "Rack1",
+    "parent_id": "none",
+}
+URL = f"https://api.switch-bot.com/v1.1/devices/{DEVICE['id']}/status"
+
+
+def _sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_success_records_latency_and_status_codes(client):
+    respx.get(URL).mock(
+        return_value=Response(200, json={"statusCode": 100, "body": {"weight": 1}})
+    )
+    latency = "switchbot_api_request_duration_seconds_count"
+    before = (
+        _sample(latency, device_id=DEVICE["id"]),
+        _sample("switchbot_api_responses_total", status_class="2xx"),
+        _sample("switchbot_api_status_codes_total", status_code="100"),
+        _sample("switchbot_json_decode_seconds_count"),
+    )
+
+    await fetch_device_status(client, DEVICE, "token", "secret")
+
+    after = (
+        _sample(latency, device_id=DEVICE["id"]),
+        _sample("switchbot_api_responses_total", status_class="2xx"),
+        _sample("switchbot_api_status_codes_total", status_code="100"),
+        _sample("switchbot_json_decode_seconds_count"),
+    )
+    assert [a - b for a, b in zip(after, before)] == [1, 1, 1, 1]
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failures_are_classified(client):
+    respx.get(URL).mock(
+        side_effect=[
+            Response(500, json={"error": "Internal Server Error"}),
+            Response(200, json={"statusCode": 190, "message": "error"}),
+            TimeoutException("Request timeout"),
+        ]
+    )
+    before_5xx = _sample("switchbot_api_responses_total", status_class="5xx")
+    before_190 = _sample("switchbot_api_status_codes_total", status_code="190")
+    before_error = _sample("switchbot_api_responses_total", status_class="error")
+
+    for _ in range(3):
+        await fetch_device_status(client, DEVICE, "token", "secret")
+
+    assert _sample("switchbot_api_responses_total", status_class="5xx") == (
+        before_5xx + 1
+    )
+    assert _sample("switchbot_api_status_codes_total", status_code="190") == (
+        before_190 + 1
+    )
+    assert _sample("switchbot_api_responses_total", status_class="error") == (
+        before_error + 1
+    )
+
+
+@pytest.mark.asyncio
+async def test_cycle_overrun_is_counted():
+    state = ExporterState(devices=[], pool=None, client=None, collection_interval=0)
+    before = CYCLE_OVERRUNS._value.get()
+    cycles_before = _sample("switchbot_cycle_duration_seconds_count")
+
+    await run_cycle(state)
+
+    assert CYCLE_OVERRUNS._value.get() == before + 1
+    assert _sample("switchbot_cycle_duration_seconds_count") == cycles_before + 1
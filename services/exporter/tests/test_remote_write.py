@@ -0,0 +1,96 @@
+import asyncio
+import gzip
+import pytest
+import respx
+from httpx import Response
+from src.remote_write import DiskBuffer, PushSink, Sample, encode_samples
+
+PUSH_URL = "http://victoriametrics:8428/api/v1/import/prometheus"
+
+
+def _sample(value=12.5, ts=1700000000.123):
+    return Sample(
+        "switchbot_power_watts", {"device_id": "D001", "room": 'wo"rk'}, value, ts
+    )
+
+
+def test_encode_samples_with_timestamp_and_escaping():
+    line = encode_samples([_sample()]).decode()
+    assert line == (
+        'switchbot_power_watts{device_id="D001",room="wo\\"rk"} 12.5 1700000000123\n'
+    )
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_flush_sends_gzip_batch():
+    route = respx.post(PUSH_URL).mock(return_value=Response(204))
+    sink = PushSink(PUSH_URL, max_retries=1)
+    sink.add([_sample(1.0), _sample(2.0)])
+
+    await sink.close()
+
+    request = route.calls.last.request
+    assert request.headers["Content-Encoding"] == "gzip"
+    body = gzip.decompress(request.content).decode()
+    assert body.count("switchbot_power_watts") == 2
+    assert sink.pending_samples == 0
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_failed_batch_is_buffered_and_replayed(tmp_path):
+    """送信失敗時はディスクに退避し、復旧後に再送すること"""
+    route = respx.post(PUSH_URL).mock(return_value=Response(503))
+    buffer = DiskBuffer(str(tmp_path), max_bytes=1024 * 1024)
+    sink = PushSink(PUSH_URL, buffer=buffer, max_retries=1)
+
+    sink.add([_sample(1.0)])
+    await sink.flush()
+    assert len(buffer.pending()) == 1
+
+    route.mock(return_value=Response(204))
+    sink.add([_sample(2.0)])
+    await sink.close()
+
+    assert buffer.pending() == []
+    assert route.call_count == 3  # 失敗 1 回 + 新バッチ + 再送
+
+
+class _HangingClient:
+    """送信先が応答しない状態を再現する"""
+
+    def __init__(self):
+        self.started = asyncio.Event()
+
+    async def post(self, *args, **kwargs):
+        self.started.set()
+        await asyncio.Event().wait()
+
+
+@pytest.mark.asyncio
+async def test_full_batch_is_flushed_in_the_background():
+    """バッチサイズに達しても呼び出し側は送信を待たないこと"""
+    client = _HangingClient()
+    sink = PushSink(PUSH_URL, batch_size=2, flush_interval=3600, client=client)
+    task = asyncio.create_task(sink.run())
+
+    sink.add([_sample(1.0), _sample(2.0)])
+    sink.maybe_flush()  # 送信先が応答しなくてもすぐに戻る
+    await asyncio.wait_for(client.started.wait(), 1.0)
+    assert sink.pending_samples == 0
+
+    # 送信中に止めたバッチは失われず、次のフラッシュで送り直せる
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert sink.pending_samples == 2
+
+
+def test_disk_buffer_evicts_oldest(tmp_path):
+    buffer = DiskBuffer(str(tmp_path), max_bytes=250)
+    for i in range(5):
+        buffer.put(bytes([i]) * 100, sample_count=1)
+
+    pending = buffer.pending()
+    assert len(pending) == 2
+    assert open(pending[-1], "rb").read() == bytes([4]) * 100
@@ -0,0 +1,99 @@
+import pytest
+from src.scheduler import AdaptivePollScheduler, parse_reset_header
+
+
+def _devices(n):
+    return [{"id": f"D{i:03d}"} for i in range(n)]
+
+
+def test_parse_reset_header_millis_and_seconds():
+    assert parse_reset_header("1708473600000") == 1708473600.0
+    assert parse_reset_header(1708473600) == 1708473600.0
+    assert parse_reset_header("invalid") is None
+    assert parse_reset_header(None) is None
+
+
+def test_small_fleet_is_clamped_to_min_interval():
+    """デバイス数が少なければ従来通り COLLECTION_INTERVAL で取得する"""
+    scheduler = AdaptivePollScheduler(min_interval=60, max_interval=900)
+    devices = _devices(2)
+    due = scheduler.due(devices, now=0.0)
+
+    assert len(due) == 2
+    assert scheduler.interval_of("D000") == 60
+
+
+def test_budget_lasts_until_reset():
+    """全デバイスの呼び出し回数の合計がリセットまでの残り予算に収まること"""
+    scheduler = AdaptivePollScheduler(reserve=100, min_interval=1, max_interval=1e6)
+    now = 1_700_000_000.0
+    # 残り 2,100 回でリセットまで 6 時間
+    scheduler.observe_rate_limit("2100", str(int((now + 6 * 3600) * 1000)))
+    scheduler.due(_devices(45), now=now)
+
+    intervals = scheduler.intervals(now)
+    calls = sum(6 * 3600 / t for t in intervals.values())
+    assert calls == pytest.approx(2000)
+
+
+def test_active_device_gets_more_budget():
+    """電力変動の大きいデバイスほど短い周期になること"""
+    scheduler = AdaptivePollScheduler(min_interval=1, max_interval=1e6)
+    devices = _devices(10)
+    scheduler.due(devices, now=0.0)
+    for i, watts in enumerate([10.0, 200.0, 15.0, 300.0]):
+        scheduler.record("D000", watts)
+        scheduler.record("D001", 5.0)
+
+    intervals = scheduler.intervals(0.0)
+    assert intervals["D000"] < intervals["D001"]
+
+
+def test_exhausted_budget_waits_until_reset():
+    scheduler = AdaptivePollScheduler(reserve=100, min_interval=60, max_interval=900)
+    now = 1_700_000_000.0
+    scheduler.observe_rate_limit("50", str(int((now + 7200) * 1000)))
+    scheduler.sync(["D000"])
+
+    assert scheduler.intervals(now)["D000"] == pytest.approx(7200)
+
+
+def test_due_respects_next_due():
+    scheduler = AdaptivePollScheduler(min_interval=60, max_interval=900)
+    devices = _devices(3)
+
+    assert len(scheduler.due(devices, now=0.0)) == 3
+    assert scheduler.due(devices, now=30.0) == []
+    assert len(scheduler.due(devices, now=60.0)) == 3
+    assert scheduler.seconds_until_next_due(now=60.0) == pytest.approx(60)
+
+
+def test_accounts_have_independent_budgets():
+    """アカウントごとの残り予算で、そのアカウントのデバイスの周期が決まること"""
+    scheduler = AdaptivePollScheduler(reserve=0, min_interval=1, max_interval=1e6)
+    now = 1_700_000_000.0
+    reset = str(int((now + 3600) * 1000))
+    scheduler.observe_rate_limit("3600", reset)
+    scheduler.observe_rate_limit("360", reset, account="garage")
+    devices = [{"id": "D000"}, {"id": "D001", "account": "garage"}]
+    scheduler.due(devices, now=now)
+
+    intervals = scheduler.intervals(now)
+    assert intervals["D000"] == pytest.approx(1)
+    assert intervals["D001"] == pytest.approx(10)
+
+
+def test_budget_is_split_between_replicas_sharing_an_account():
+    """同じアカウントを分担するレプリカ数で予算を等分すること"""
+    scheduler = AdaptivePollScheduler(reserve=0, min_interval=1, max_interval=1e6)
+    now = 1_700_000_000.0
+    reset = str(int((now + 3600) * 1000))
+    scheduler.observe_rate_limit("3600", reset)
+    scheduler.observe_rate_limit("360", reset, account="garage")
+    scheduler.set_shares({"default": 3})
+    devices = [{"id": "D000"}, {"id": "D001", "account": "garage"}]
+    scheduler.due(devices, now=now)
+
+    intervals = scheduler.intervals(now)
+    assert intervals["D000"] == pytest.approx(3)
+    assert intervals["D001"] == pytest.approx(10)
@@ -0,0 +1,135 @@
+import json
+
+import pytest
+import respx
+from httpx import Response
+from src.main import collect_metrics
+from src.sharding import DeviceSharder, HashRing, shard_key, statefulset_members
+
+
+def _devices(n):
+    return [{"id": f"D{i:04d}", "parent_id": "none"} for i in range(n)]
+
+
+def _owners(ring, devices):
+    return {d["id"]: ring.owner(d["id"]) for d in devices}
+
+
+def test_every_device_has_exactly_one_owner():
+    members = ["exporter-0", "exporter-1", "exporter-2"]
+    devices = _devices(300)
+    by_id = {d["id"]: d for d in devices}
+    shards = [DeviceSharder(m, members).assign(devices, now=0.0) for m in members]
+
+    ids = [d["id"] for shard in shards for d in shard]
+    assert sorted(ids) == sorted(by_id)
+    # 仮想ノードにより大きく偏らない
+    assert all(50 < len(shard) < 150 for shard in shards)
+
+
+def test_adding_a_replica_moves_few_devices():
+    devices = _devices(1000)
+    before = _owners(HashRing(["a", "b", "c"]), devices)
+    after = _owners(HashRing(["a", "b", "c", "d"]), devices)
+
+    moved = [k for k in before if before[k] != after[k]]
+    assert all(after[k] == "d" for k in moved)
+    assert len(moved) < 400  # 理想は 1/4
+
+
+def test_tree_stays_on_one_replica():
+    devices = [
+        {"id": "TAP", "parent_id": "none"},
+        {"id": "PC", "parent_id": "TAP"},
+        {"id": "MONITOR", "parent_id": "PC"},
+        {"id": "LOOP", "parent_id": "LOOP2"},
+        {"id": "LOOP2", "parent_id": "LOOP"},
+    ]
+    by_id = {d["id"]: d for d in devices}
+
+    assert shard_key(by_id["MONITOR"], by_id) == "TAP"
+    assert shard_key(by_id["LOOP"], by_id) in ("LOOP", "LOOP2")
+
+
+def test_account_shares_count_replicas_per_account():
+    devices = _devices(200) + [
+        {"id": "G0001", "parent_id": "none", "account": "garage"}
+    ]
+    sharder = DeviceSharder("a", ["a", "b", "c"])
+
+    shares = sharder.account_shares(devices)
+    assert shares == {"default": 3, "garage": 1}
+
+
+def test_statefulset_members():
+    assert statefulset_members("switchbot-exporter-1", 3) == [
+        "switchbot-exporter-0",
+        "switchbot-exporter-1",
+        "switchbot-exporter-2",
+    ]
+    with pytest.raises(ValueError):
+        statefulset_members("exporter", 2)
+
+
+@pytest.mark.asyncio
+async def test_taken_over_devices_wait_for_handoff():
+    """メンバー変更で引き継いだデバイスは、前の担当が手放すまで取得しない"""
+    members = [["a", "b"]]
+    sharder = DeviceSharder(
+        "a", resolve=lambda: members[0], refresh_interval=10, handoff_delay=30
+    )
+    devices = _devices(200)
+
+    assert await sharder.refresh(now=0.0) is True
+    owned = {d["id"] for d in sharder.assign(devices, now=0.0)}
+
+    members[0] = ["a"]  # b が抜けた
+    assert await sharder.refresh(now=10.0) is True
+    assert {d["id"] for d in sharder.assign(devices, now=10.0)} == owned
+
+    assert await sharder.refresh(now=40.0) is True
+    assert len(sharder.assign(devices, now=40.0)) == 200
+    assert await sharder.refresh(now=45.0) is False
+
+
+@pytest.mark.asyncio
+async def test_unlisted_replica_owns_nothing():
+    sharder = DeviceSharder("c", resolve=lambda: ["a", "b"])
+    await sharder.refresh(now=0.0)
+    assert sharder.assign(_devices(50), now=0.0) == []
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_devices_use_their_account_credentials(client, monkeypatch, tmp_path):
+    accounts = tmp_path / "accounts.json"
+    accounts.write_text(json.dumps({"garage": {"token": "t2", "secret": "s2"}}))
+    monkeypatch.setenv("SWITCHBOT_TOKEN", "t1")
+    monkeypatch.setenv("SWITCHBOT_SECRET", "s1")
+    monkeypatch.setenv("SWITCHBOT_ACCOUNTS_FILE", str(accounts))
+    route = respx.get(url__regex=r".*/status").mock(
+        return_value=Response(
+            200,
+            json={"statusCode": 100, "body": {"weight": 1}},
+            headers={"x-ratelimit-remaining": "500"},
+        )
+    )
+    devices = [
+        {"id": "HOME1", "name": "a", "device": "pc", "room": "r", "shelf": "s"},
+        {"id": "GAR1", "name": "b", "device": "pc", "room": "r", "shelf": "s"},
+        {"id": "LOST1", "name": "c", "device": "pc", "room": "r", "shelf": "s"},
+    ]
+    devices[1]["account"] = "garage"
+    devices[2]["account"] = "unknown"
+
+    results = await collect_metrics(devices, client=client)
+
+    tokens = {
+        call.request.url.path.split("/")[3]: call.request.headers["Authorization"]
+        for call in route.calls
+    }
+    assert tokens == {"HOME1": "t1", "GAR1": "t2"}
+    assert {r.device_id: r.account for r in results} == {
+        "HOME1": "default",
+        "GAR1": "garage",
+    }
@@ -0,0 +1,56 @@
+import base64
+import hashlib
+import hmac
+import uuid
+import pytest
+from src.signer import SwitchBotSigner
+
+
+def _reference_sign(token, secret, t, nonce):
+    digest = hmac.new(
+        secret.encode(), f"{token}{t}{nonce}".encode(), hashlib.sha256
+    ).digest()
+    return str(base64.b64encode(digest).upper(), "utf-8")
+
+
+@pytest.mark.parametrize("secret", ["test_secret", "s" * 100])
+def test_sign_matches_hmac_sha256(secret):
+    """鍵設定を事前計算しても hmac.new() と同じ署名になること（長い鍵も含む）"""
+    signer = SwitchBotSigner("test_token", secret)
+    t, nonce = "1700000000000", "0f8fad5b-d9cb-469f-a165-70867728950e"
+
+    sign, _, _ = signer.sign(t, nonce)
+
+    assert sign == _reference_sign("test_token", secret, t, nonce)
+
+
+def test_headers_are_freshly_signed_by_default():
+    signer = SwitchBotSigner("test_token", "test_secret")
+
+    first = signer.headers()
+    second = signer.headers()
+
+    assert first["Authorization"] == "test_token"
+    assert first["Content-Type"] == "application/json; charset=utf8"
+    assert first["nonce"] != second["nonce"]
+    assert uuid.UUID(first["nonce"]).version == 4
+    assert first["sign"] == _reference_sign(
+        "test_token", "test_secret", first["t"], first["nonce"]
+    )
+
+
+def test_reuse_window_issues_one_signature_per_tick():
+    """reuse_window 内は同じ署名を使い回し、new_tick() で更新されること"""
+    signer = SwitchBotSigner("test_token", "test_secret", reuse_window=60)
+
+    first = signer.headers()
+    assert signer.headers() == first
+
+    # 返した dict を書き換えても、使い回している署名には影響しない
+    first["X-Extra"] = "1"
+    signer.headers()["sign"] = "tampered"
+    assert "X-Extra" not in signer.headers()
+    assert signer.headers()["sign"] == first["sign"]
+
+    signer.new_tick()
+    assert signer.headers()["nonce"] != first["nonce"]
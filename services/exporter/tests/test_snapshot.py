@@ -0,0 +1,107 @@
+import json
+
+from src.breaker import OPEN, DeviceBreakers
+from src.main import (
+    API_REMAINING,
+    DEVICE_UP,
+    POWER_WATT,
+    ExporterState,
+    FetchResult,
+    power_labels,
+    process_results,
+    restore_snapshot,
+    snapshot_data,
+)
+from src.scheduler import AdaptivePollScheduler
+from src.snapshot import load_snapshot, save_snapshot
+
+
+def _device(device_id):
+    return {
+        "id": device_id,
+        "name": device_id.lower(),
+        "device": "pc",
+        "room": "work",
+        "shelf": "desk",
+        "parent_id": "none",
+    }
+
+
+DEVICES = [_device("SNAP01"), _device("SNAP02")]
+
+
+def _state():
+    return ExporterState(
+        devices=list(DEVICES),
+        pool=None,
+        client=None,
+        collection_interval=60,
+        scheduler=AdaptivePollScheduler(min_interval=60, max_interval=900),
+        breakers=DeviceBreakers(failure_threshold=1, jitter=0.0),
+    )
+
+
+def test_restart_is_warm_without_api_calls(tmp_path):
+    now = 1_700_000_000.0
+    before = _state()
+    before.scheduler.due(before.devices, now=now)
+    before.scheduler.observe_rate_limit("4321", str(int((now + 3600) * 1000)))
+    before.breakers.record_failure("SNAP02", now=now)
+    process_results(
+        before,
+        before.devices,
+        [FetchResult("SNAP01", watts=42.0, remaining=4321, fetched_at=now - 10)],
+    )
+    path = str(tmp_path / "state" / "snapshot.json")
+    save_snapshot(path, snapshot_data(before))
+
+    # 別プロセスで起動したのと同じく、ゲージを消してから復元する
+    POWER_WATT.remove(*power_labels(DEVICES[0]).values())
+    API_REMAINING.set(0)
+    after = _state()
+    restored = restore_snapshot(after, load_snapshot(path), max_age=900, now=now)
+
+    assert restored == 1
+    assert POWER_WATT.labels(**power_labels(DEVICES[0]))._value.get() == 42.0
+    assert DEVICE_UP.labels(device_id="SNAP02")._value.get() == 0
+    assert API_REMAINING._value.get() == 4321
+    assert after.readings["SNAP01"] == (42.0, now - 10)
+    assert after.breakers.is_open("SNAP02")
+    # 再起動直後のサイクルでは、予定の来ていないデバイスを取得しない
+    assert after.scheduler.due(after.devices, now=now + 5) == []
+
+
+def test_old_readings_and_expired_budgets_are_dropped(tmp_path):
+    now = 1_700_000_000.0
+    data = {
+        "readings": {"SNAP01": [5.0, now - 3600], "GONE": [1.0, now]},
+        "breakers": {},
+        "scheduler": {
+            "budgets": {"default": {"remaining": 10, "reset_at": now - 1}},
+            "devices": {},
+        },
+    }
+    state = _state()
+
+    assert restore_snapshot(state, data, max_age=900, now=now) == 0
+    assert state.scheduler.remaining is None
+
+
+def test_half_open_breaker_is_retried_after_restart():
+    breakers = DeviceBreakers(failure_threshold=1, jitter=0.0)
+    breakers.record_failure("SNAP01", now=0.0)
+    assert breakers.allow("SNAP01", now=1000.0)  # half-open の試行中に停止
+
+    restarted = DeviceBreakers()
+    restarted.restore(breakers.snapshot())
+    assert restarted._breakers["SNAP01"].state == OPEN
+    assert restarted.allow("SNAP01", now=1001.0)
+
+
+def test_broken_or_foreign_snapshot_is_ignored(tmp_path):
+    path = tmp_path / "snapshot.json"
+    assert load_snapshot(str(path)) is None
+    path.write_text("{")
+    assert load_snapshot(str(path)) is None
+    path.write_text(json.dumps({"version": 99}))
+    assert load_snapshot(str(path)) is None
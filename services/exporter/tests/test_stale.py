@@ -0,0 +1,91 @@
+import time
+
+import pytest
+import respx
+from httpx import Response
+from src.main import (
+    DEVICE_UP,
+    POWER_WATT,
+    SAMPLE_AGE,
+    ExporterState,
+    FetchResult,
+    expire_stale,
+    fetch_device_status,
+    power_labels,
+    process_results,
+)
+
+DEVICE = {
+    "id": "SWR0001",
+    "name": "Server",
+    "device": "pc",
+    "room": "Work",
+    "shelf": "Rack1",
+    "parent_id": "none",
+}
+
+
+def _power_series():
+    return {s.labels["device_id"] for s in POWER_WATT.collect()[0].samples}
+
+
+def _state(stale_max_age):
+    return ExporterState(
+        devices=[DEVICE],
+        pool=None,
+        client=None,
+        collection_interval=60,
+        stale_max_age=stale_max_age,
+    )
+
+
+@pytest.mark.asyncio
+@respx.mock
+async def test_keep_stale_marks_down_without_removing_power(client):
+    respx.get("https://api.switch-bot.com/v1.1/devices/SWR0001/status").mock(
+        side_effect=[
+            Response(200, json={"statusCode": 100, "body": {"weight": 12}}),
+            Response(500),
+        ]
+    )
+
+    await fetch_device_status(client, DEVICE, "token", "secret", keep_stale=True)
+    result = await fetch_device_status(
+        client, DEVICE, "token", "secret", keep_stale=True
+    )
+
+    assert result.down
+    assert DEVICE_UP.labels(device_id="SWR0001")._value.get() == 0
+    assert POWER_WATT.labels(**power_labels(DEVICE))._value.get() == 12
+
+
+def test_last_reading_is_served_until_it_is_too_old():
+    state = _state(stale_max_age=300)
+    now = time.time()
+    POWER_WATT.labels(**power_labels(DEVICE)).set(12)
+    process_results(state, [DEVICE], [FetchResult("SWR0001", 12.0, fetched_at=now)])
+    process_results(state, [DEVICE], [FetchResult("SWR0001", down=True)])
+
+    assert "SWR0001" in state.stale
+    assert state.readings["SWR0001"] == (12.0, now)
+    ages = {s.labels["device_id"]: s.value for s in SAMPLE_AGE.collect()[0].samples}
+    assert 0 <= ages["SWR0001"] < 60
+
+    assert expire_stale(state, now=now + 299) == 0
+    assert "SWR0001" in _power_series()
+
+    assert expire_stale(state, now=now + 301) == 1
+    assert "SWR0001" not in _power_series()
+    assert "SWR0001" not in state.readings
+    assert all(
+        s.labels["device_id"] != "SWR0001" for s in SAMPLE_AGE.collect()[0].samples
+    )
+
+
+def test_without_stale_window_the_reading_is_dropped():
+    state = _state(stale_max_age=0)
+    process_results(state, [DEVICE], [FetchResult("SWR0001", 5.0, fetched_at=1.0)])
+    process_results(state, [DEVICE], [FetchResult("SWR0001", down=True)])
+
+    assert "SWR0001" not in state.readings
+    assert not state.stale
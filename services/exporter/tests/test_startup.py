@@ -0,0 +1,47 @@
+import subprocess
+import sys
+
+import pytest
+from src.main import ExporterState, FetchResult, process_results
+from src.startup import FIRST_SAMPLE_SECONDS, StartupProfile, process_uptime
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="needs /proc")
+def test_process_uptime_includes_interpreter_start():
+    uptime = process_uptime()
+    assert uptime is not None and 0 < uptime < 3600
+
+
+def test_phases_and_first_sample_are_recorded_once():
+    profile = StartupProfile()
+    with profile.phase("config"):
+        pass
+    state = ExporterState(
+        devices=[], pool=None, client=None, collection_interval=60, profile=profile
+    )
+
+    process_results(state, [], [FetchResult("P1", watts=None)])
+    assert profile.first_sample is None
+
+    process_results(state, [], [FetchResult("P1", watts=5.0, fetched_at=1.0)])
+    first = profile.first_sample
+    assert first is not None and first >= profile.phases["imports"]
+    assert FIRST_SAMPLE_SECONDS._value.get() == first
+
+    process_results(state, [], [FetchResult("P1", watts=6.0, fetched_at=2.0)])
+    assert profile.first_sample == first
+    assert set(profile.phases) == {"imports", "config"}
+    assert "first_sample=" in profile.report()
+
+
+def test_optional_features_are_not_imported_at_startup():
+    code = (
+        "import sys, src.main; "
+        "print(sorted(m for m in sys.modules if m in ("
+        "'src.discovery', 'src.sharding', 'src.change_detect', "
+        "'src.snapshot', 'src.wal')))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert out.stdout.strip() == "[]"
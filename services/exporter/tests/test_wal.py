@@ -0,0 +1,115 @@
+import os
+import pytest
+from src.wal import SampleWAL, WalShipper, encode_record
+
+
+def _fill(wal, n, start=1700000000.0):
+    for i in range(n):
+        wal.append(start + i, f"D{i % 3}", float(i))
+    wal.sync()
+
+
+def test_append_and_read_roundtrip(tmp_path):
+    wal = SampleWAL(str(tmp_path))
+    _fill(wal, 5)
+
+    records, pos = wal.read_from(wal.checkpoint, limit=100)
+
+    assert [r.watts for r in records] == [0.0, 1.0, 2.0, 3.0, 4.0]
+    assert records[1].device_id == "D1"
+    assert records[1].timestamp == pytest.approx(1700000001.0)
+    assert pos == wal.end_position()
+
+
+def test_rotation_and_oldest_first_eviction(tmp_path):
+    record_size = len(encode_record(0, "D0", 0.0))
+    wal = SampleWAL(
+        str(tmp_path), segment_bytes=record_size * 10, max_bytes=record_size * 30
+    )
+    _fill(wal, 100)
+
+    records, _ = wal.read_from((0, 0), limit=1000)
+
+    # 容量上限内の新しいレコードだけが残る
+    assert len(records) <= 30
+    assert records[-1].watts == 99.0
+    assert records[0].watts > 0.0
+
+
+def test_torn_tail_is_truncated_on_reopen(tmp_path):
+    wal = SampleWAL(str(tmp_path))
+    _fill(wal, 3)
+    wal.close()
+    segment = os.path.join(tmp_path, sorted(os.listdir(tmp_path))[0])
+    with open(segment, "ab") as f:
+        f.write(encode_record(1700000099.0, "D9", 9.0)[:-3])
+
+    reopened = SampleWAL(str(tmp_path))
+    reopened.append(1700000100.0, "D1", 10.0)
+    records, _ = reopened.read_from((0, 0), limit=100)
+
+    assert [r.watts for r in records] == [0.0, 1.0, 2.0, 10.0]
+
+
+def test_last_values_survive_restart(tmp_path):
+    wal = SampleWAL(str(tmp_path))
+    _fill(wal, 7)
+    wal.close()
+
+    last = SampleWAL(str(tmp_path)).last_values(["D0", "D1", "unknown"])
+
+    assert last["D0"].watts == 6.0
+    assert last["D1"].watts == 4.0
+    assert "unknown" not in last
+
+
+@pytest.mark.asyncio
+async def test_shipper_commits_only_delivered_records(tmp_path):
+    wal = SampleWAL(str(tmp_path))
+    _fill(wal, 5)
+    delivered = []
+    ok = {"value": False}
+
+    async def send(records):
+        if ok["value"]:
+            delivered.extend(records)
+        return ok["value"]
+
+    shipper = WalShipper(wal, send, batch_records=2)
+    assert await shipper.run_once() == 0
+
+    ok["value"] = True
+    assert await shipper.run_once() == 5
+    assert len(delivered) == 5
+    # チェックポイントは再起動後も保持される
+    wal.close()
+    assert SampleWAL(str(tmp_path)).checkpoint == wal.end_position()
+
+
+@pytest.mark.asyncio
+async def test_shipper_replays_only_outage_window(tmp_path):
+    """スクレイプ運用ではストレージ停止中のレコードだけを再送すること"""
+    wal = SampleWAL(str(tmp_path))
+    healthy = {"value": True}
+    delivered = []
+
+    async def send(records):
+        delivered.extend(records)
+        return True
+
+    async def health():
+        return healthy["value"]
+
+    shipper = WalShipper(wal, send, health=health)
+    _fill(wal, 3)
+    await shipper.run_once()  # 正常時はスクレイプ済みとして進めるだけ
+    assert delivered == []
+
+    healthy["value"] = False
+    _fill(wal, 2, start=1700000100.0)
+    await shipper.run_once()
+    healthy["value"] = True
+    await shipper.run_once()
+
+    assert [r.timestamp for r in delivered] == [1700000100.0, 1700000101.0]
+    assert shipper.outage is False